@@ -0,0 +1,68 @@
+"""RAJA Digital System - analytics replica change capture.
+
+Installs or removes the row triggers that log changes for the DuckDB
+analytics replica (ANALYTICS_DUCKDB). Workers with the replica enabled
+install them at startup; they are only ever removed here, once no worker
+uses the replica any more.
+
+    python -m backend.analytics --install-triggers
+    python -m backend.analytics --drop-triggers
+
+The target comes from ``--database-url`` or SUPABASE_DATABASE_URL /
+DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+from backend import server  # noqa: E402
+
+
+async def run(args):
+    database_url = server.strip_pgbouncer_flag(args.database_url)
+    conn = await asyncpg.connect(database_url,
+                                 ssl=server.make_ssl_context())
+    try:
+        async with conn.transaction():
+            # Same lock as schema changes and partition maintenance.
+            await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                               server.SCHEMA_LOCK_KEY)
+            await server.create_analytics_capture(conn)
+            if args.drop_triggers:
+                await server.drop_analytics_triggers(conn)
+            else:
+                await server.install_analytics_triggers(conn)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--install-triggers",
+                        action="store_true",
+                        help="start capturing changes for the replica")
+    action.add_argument("--drop-triggers",
+                        action="store_true",
+                        help="stop capturing changes and clear the log")
+    parser.add_argument("--database-url",
+                        default=os.environ.get('SUPABASE_DATABASE_URL')
+                        or os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("set DATABASE_URL or pass --database-url")
+
+    asyncio.run(run(args))
+    state = "dihapus" if args.drop_triggers else "dipasang"
+    print(f"Trigger analytics {state}: {', '.join(server.ANALYTICS_TRIGGERS)}")
+
+
+if __name__ == "__main__":
+    main()
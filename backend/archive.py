@@ -0,0 +1,90 @@
+"""RAJA Digital System - cold-data archiver.
+
+Moves closed months of sij_transactions, ritase and audit_log out of
+Postgres into zstd-compressed Parquet files under ARCHIVE_DIR, one file
+per table and month. Reports and exports keep reading them transparently.
+
+    python -m backend.archive                  # older than ARCHIVE_HORIZON_MONTHS
+    python -m backend.archive --keep-months 6
+    python -m backend.archive --before 2025-01 --table ritase --dry-run
+
+The target comes from ``--database-url`` or SUPABASE_DATABASE_URL /
+DATABASE_URL. Needs pyarrow (backend/requirements-optional.txt).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import asyncpg
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+from backend import server  # noqa: E402
+
+
+async def archive(args) -> dict:
+    database_url = server.strip_pgbouncer_flag(args.database_url)
+    conn = await asyncpg.connect(database_url,
+                                 ssl=server.make_ssl_context())
+    try:
+        if args.dry_run:
+            return {
+                f"{table}/{r['month']}": r['n']
+                for table in args.table for r in await conn.fetch(
+                    f"SELECT left(date, 7) AS month, COUNT(*) AS n FROM {table} WHERE date < $1 GROUP BY 1 ORDER BY 1",
+                    f"{args.before}-01")
+            }
+        async with conn.transaction():
+            # Same lock as schema changes and partition maintenance.
+            await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                               server.SCHEMA_LOCK_KEY)
+            return await server.archive_closed_months(conn, args.before,
+                                                      args.table)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keep-months",
+                        type=int,
+                        default=server.ARCHIVE_HORIZON_MONTHS,
+                        help="months kept live besides the current one")
+    parser.add_argument("--before",
+                        help="archive months before YYYY-MM "
+                        "(overrides --keep-months)")
+    parser.add_argument("--table",
+                        action="append",
+                        choices=list(server.ARCHIVE_COLUMNS),
+                        help="limit to a table; repeatable")
+    parser.add_argument("--dry-run",
+                        action="store_true",
+                        help="only count the rows that would move")
+    parser.add_argument("--database-url",
+                        default=os.environ.get('SUPABASE_DATABASE_URL')
+                        or os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("set DATABASE_URL or pass --database-url")
+    if args.before and not server._MONTH_RE.match(args.before):
+        parser.error("--before must be YYYY-MM")
+    args.before = args.before or server.archive_cutoff(
+        horizon=args.keep_months)
+    args.table = args.table or list(server.ARCHIVE_COLUMNS)
+
+    started = time.perf_counter()
+    moved = asyncio.run(archive(args))
+    elapsed = time.perf_counter() - started
+    for month, n in moved.items():
+        print(f"  {month:<28}{n:>10}")
+    verb = "akan diarsipkan" if args.dry_run else "diarsipkan"
+    print(f"{sum(moved.values())} baris {verb} (sebelum {args.before}) "
+          f"dalam {elapsed:.1f}s -> {server.ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+"""RAJA Digital System - benchmark harness for the hot paths.
+
+Seeds a large fleet into a throwaway Postgres, starts the API with
+uvicorn and drives realistic request mixes against it, reporting
+p50/p95/p99 latency and queries per request for every endpoint.
+
+    python -m backend.bench.bench                         # all scenarios
+    python -m backend.bench.bench --drivers 1000 --days 365
+    python -m backend.bench.bench --scenario dashboards --duration 20
+    python -m backend.bench.bench --save-baseline local
+    python -m backend.bench.bench --compare local         # exit 1 on regression
+
+Postgres: by default a cluster is created with ``initdb`` in a temp dir
+(binaries from ``PG_BIN`` or ``PATH``) and removed afterwards.  Pass
+``--database-url`` to use an existing server instead; the database is
+dropped and recreated, so never point it at real data.
+
+Queries per request are the server's own per-request statement counts
+(``/api/_internal/query-stats``), read while each endpoint is called
+sequentially.
+
+Needs httpx on top of backend/requirements.txt.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import asyncpg
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+from backend import server  # noqa: E402
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+BENCH_DB = "raja_bench"
+PROFILE_CALLS = 5
+REGRESSION_TOLERANCE = 0.20  # p95 may grow 20% before it counts
+REGRESSION_FLOOR_MS = 2.0  # ...and by at least this much
+
+# =================== POSTGRES ===================
+
+
+class EphemeralPostgres:
+    """initdb + pg_ctl cluster on a unix socket in a temp dir."""
+
+    def __init__(self, pg_bin: str = None):
+        self.pg_bin = pg_bin or os.environ.get("PG_BIN") or ""
+        self.dir = None
+
+    def _bin(self, name: str) -> str:
+        path = shutil.which(name, path=self.pg_bin or None)
+        if path is None:
+            raise SystemExit(
+                f"{name} not found; set PG_BIN or pass --database-url")
+        return path
+
+    def start(self) -> str:
+        self.dir = tempfile.mkdtemp(prefix="raja-bench-")
+        data = os.path.join(self.dir, "data")
+        subprocess.run([
+            self._bin("initdb"), "-D", data, "-U", "postgres", "-A", "trust",
+            "-E", "UTF8", "--no-sync"
+        ],
+                       check=True,
+                       stdout=subprocess.DEVNULL)
+        options = (f"-k {self.dir} -c listen_addresses='' -c fsync=off "
+                   "-c synchronous_commit=off -c full_page_writes=off "
+                   "-c max_connections=200")
+        subprocess.run([
+            self._bin("pg_ctl"), "-D", data, "-o", options, "-l",
+            os.path.join(self.dir, "postgres.log"), "-w", "start"
+        ],
+                       check=True,
+                       stdout=subprocess.DEVNULL)
+        return f"postgresql://postgres@/postgres?host={self.dir}"
+
+    def stop(self):
+        if self.dir is None:
+            return
+        subprocess.run([
+            self._bin("pg_ctl"), "-D",
+            os.path.join(self.dir, "data"), "-m", "fast", "-w", "stop"
+        ],
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+
+
+def with_database(url: str, dbname: str) -> str:
+    base, _, query = url.partition("?")
+    base = base.rsplit("/", 1)[0] + "/" + dbname
+    return f"{base}?{query}" if query else base
+
+
+async def recreate_database(admin_url: str, dbname: str):
+    conn = await asyncpg.connect(admin_url)
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}" WITH (FORCE)')
+        await conn.execute(f'CREATE DATABASE "{dbname}"')
+    finally:
+        await conn.close()
+
+
+# =================== FLEET SEED ===================
+
+
+async def seed_fleet(url: str, drivers: int, days: int, seed: int) -> dict:
+    """Schema plus ``drivers`` drivers and ``days`` days of history.
+
+    Today is left empty so the SIJ burst has a free driver per request.
+    """
+    conn = await asyncpg.connect(url)
+    try:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                               server.SCHEMA_LOCK_KEY)
+            await server.create_tables(conn)
+            counts = await server.seed_fleet(conn, drivers, days, seed)
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    return {
+        "drivers": drivers,
+        "days": days,
+        "sij": counts["sij_transactions"],
+        "ritase": counts["ritase"],
+        "absences": counts["driver_absences"],
+        "audit_log": counts["audit_log"],
+        "active_driver_ids": counts["active_driver_ids"],
+    }
+
+
+# =================== SERVER ===================
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url: str, port: int, workers: int, env: dict):
+    server_env = dict(os.environ,
+                      DATABASE_URL=database_url,
+                      DB_POOL_HEALTHCHECK_INTERVAL="0",
+                      **env)
+    server_env.pop("SUPABASE_DATABASE_URL", None)
+    log = open(Path(tempfile.gettempdir()) / "raja-bench-server.log", "w")
+    return subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "backend.server:app", "--port",
+        str(port), "--workers",
+        str(workers), "--log-level", "warning"
+    ],
+                            cwd=ROOT_DIR,
+                            env=server_env,
+                            stdout=log,
+                            stderr=subprocess.STDOUT)
+
+
+async def wait_for_server(client: httpx.AsyncClient, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("Server exited during startup; see "
+                             f"{tempfile.gettempdir()}/raja-bench-server.log")
+        try:
+            r = await client.post("/api/auth/login",
+                                  json={
+                                      "email": "superadmin@raja.id",
+                                      "password": "superadmin123"
+                                  })
+            if r.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit("Server did not become ready")
+
+
+def stop_server(proc):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# =================== SCENARIOS ===================
+
+
+class Endpoint:
+    """One request shape: label, method, path and optional JSON body."""
+
+    def __init__(self, label, method, path, role="admin", body=None):
+        self.label = label
+        self.method = method
+        self.path = path
+        self.role = role
+        self.body = body
+
+    def request(self, ctx: dict) -> tuple:
+        path = self.path(ctx) if callable(self.path) else self.path
+        body = self.body(ctx) if callable(self.body) else self.body
+        return self.method, path, body
+
+
+def next_sij_body(ctx: dict):
+    driver_ids = ctx["free_driver_ids"]
+    if not driver_ids:
+        return None
+    return {
+        "driver_id": driver_ids.pop(),
+        "sheets": ctx["rng"].randint(1, 7),
+        "qris_ref": f"BENCH{ctx['rng'].randint(100000, 999999)}"
+    }
+
+
+def week_range(ctx: dict) -> str:
+    monday = ctx["today"] - timedelta(days=ctx["today"].weekday() + 7)
+    sunday = monday + timedelta(days=6)
+    return f"start_date={monday:%Y-%m-%d}&end_date={sunday:%Y-%m-%d}"
+
+
+def month_range(ctx: dict) -> str:
+    first = ctx["today"].replace(day=1) - timedelta(days=1)
+    return f"date_from={first:%Y-%m}-01&date_to={first:%Y-%m-%d}"
+
+
+ENDPOINTS = {
+    e.label: e
+    for e in [
+        Endpoint("POST /api/sij", "POST", "/api/sij", body=next_sij_body),
+        Endpoint("GET /api/drivers/active", "GET", "/api/drivers/active"),
+        Endpoint("GET /api/drivers/search", "GET",
+                 lambda ctx: f"/api/drivers/search?q={ctx['rng'].choice(['ahm', 'bud', 'B 10', 'driver001', 'san'])}"),
+        Endpoint("GET /api/dashboard/admin", "GET", "/api/dashboard/admin"),
+        Endpoint("GET /api/dashboard/superadmin",
+                 "GET",
+                 "/api/dashboard/superadmin",
+                 role="superadmin"),
+        Endpoint("GET /api/pool-dashboard", "GET", "/api/pool-dashboard"),
+        Endpoint("GET /pool-dashboard", "GET", "/pool-dashboard"),
+        Endpoint("GET /api/sij", "GET",
+                 lambda ctx: f"/api/sij?date={ctx['today']:%Y-%m-%d}"),
+        Endpoint("GET /api/audit", "GET", "/api/audit", role="superadmin"),
+        Endpoint("GET /api/sij/export/csv", "GET",
+                 lambda ctx: f"/api/sij/export/csv?{month_range(ctx)}"),
+        Endpoint("GET /api/ritase/export/csv", "GET",
+                 lambda ctx: f"/api/ritase/export/csv?{month_range(ctx)}"),
+        Endpoint("GET /api/revenue-report",
+                 "GET",
+                 "/api/revenue-report?period=monthly",
+                 role="superadmin"),
+        Endpoint("GET /api/weekly-report",
+                 "GET",
+                 lambda ctx: f"/api/weekly-report?{week_range(ctx)}",
+                 role="superadmin"),
+    ]
+}
+
+# name -> (concurrency, [(endpoint label, weight)])
+SCENARIOS = {
+    # Morning counter rush: every admin issuing SIJs while the picker
+    # searches on each keystroke.
+    "sij_burst": (32, [("POST /api/sij", 3), ("GET /api/drivers/search", 6),
+                       ("GET /api/drivers/active", 1)]),
+    # Lobby TVs and admin dashboards polling.
+    "dashboards": (64, [("GET /api/dashboard/admin", 4),
+                        ("GET /api/pool-dashboard", 6),
+                        ("GET /pool-dashboard", 2),
+                        ("GET /api/dashboard/superadmin", 1)]),
+    # Month-end reporting.
+    "exports": (4, [("GET /api/sij/export/csv", 2),
+                    ("GET /api/ritase/export/csv", 2),
+                    ("GET /api/revenue-report", 2),
+                    ("GET /api/weekly-report", 1)]),
+    "mixed": (32, [("POST /api/sij", 2), ("GET /api/drivers/search", 4),
+                   ("GET /api/dashboard/admin", 4),
+                   ("GET /api/pool-dashboard", 6),
+                   ("GET /api/sij", 2), ("GET /api/audit", 1),
+                   ("GET /api/revenue-report", 1)]),
+}
+
+
+async def call(client: httpx.AsyncClient, endpoint: Endpoint, ctx: dict):
+    method, path, body = endpoint.request(ctx)
+    if method == "POST" and body is None:
+        return None
+    headers = {"Authorization": f"Bearer {ctx['tokens'][endpoint.role]}"}
+    start = time.perf_counter()
+    r = await client.request(method, path, json=body, headers=headers)
+    await r.aread()
+    return (time.perf_counter() - start) * 1000, r.status_code
+
+
+async def request_statements(client: httpx.AsyncClient, ctx: dict,
+                             label: str) -> tuple:
+    """(requests, statements) the server has traced for an endpoint."""
+    headers = {"Authorization": f"Bearer {ctx['tokens']['superadmin']}"}
+    for attempt in range(3):
+        # A 500 from the endpoint under test can leave a dead keep-alive
+        # connection behind; retry on a fresh one.
+        try:
+            r = await client.get("/api/_internal/query-stats", headers=headers)
+            break
+        except httpx.TransportError:
+            if attempt == 2:
+                raise
+    # The per-request histogram observes statement counts, so its "sum_ms"
+    # is the total number of statements.
+    counts = r.json()["requests"].get(label, {}).get("queries_per_request")
+    if counts is None:
+        return 0, 0
+    return counts["count"], counts["sum_ms"]
+
+
+async def queries_per_request(client, endpoint: Endpoint, ctx: dict):
+    """Statements per call, from the server's query trace.
+
+    Only meaningful with a single worker: each worker keeps its own stats.
+    """
+    requests_before, before = await request_statements(client, ctx,
+                                                       endpoint.label)
+    for _ in range(PROFILE_CALLS):
+        try:
+            await call(client, endpoint, ctx)
+        except httpx.HTTPError:
+            pass
+    requests_after, after = await request_statements(client, ctx,
+                                                     endpoint.label)
+    calls = requests_after - requests_before
+    return round((after - before) / calls, 2) if calls else None
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      int(round(pct / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[rank], 2)
+
+
+async def run_scenario(client, name: str, ctx: dict, duration: float,
+                       profile: bool) -> dict:
+    concurrency, mix = SCENARIOS[name]
+    labels = [label for label, _ in mix]
+    samples = {label: [] for label in labels}
+    errors = {label: 0 for label in labels}
+    deadline = time.monotonic() + duration
+
+    async def worker(worker_rng: random.Random):
+        choices = dict(mix)
+        while choices and time.monotonic() < deadline:
+            label = worker_rng.choices(list(choices), list(choices.values()))[0]
+            try:
+                result = await call(client, ENDPOINTS[label], ctx)
+            except httpx.HTTPError:
+                errors[label] += 1
+                continue
+            if result is None:
+                # Out of free drivers for SIJ creation.
+                del choices[label]
+                continue
+            ms, status = result
+            samples[label].append(ms)
+            if status >= 400:
+                errors[label] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(random.Random(ctx["seed"] + i))
+                           for i in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    report = {}
+    for label in labels:
+        values = sorted(samples[label])
+        report[label] = {
+            "requests": len(values),
+            "errors": errors[label],
+            "rps": round(len(values) / elapsed, 1) if elapsed else 0,
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "queries_per_request": None,
+        }
+    if profile:
+        for label in labels:
+            report[label]["queries_per_request"] = await queries_per_request(
+                client, ENDPOINTS[label], ctx)
+    return {"concurrency": concurrency, "elapsed_s": round(elapsed, 2),
+            "endpoints": report}
+
+
+# =================== REPORTING ===================
+
+
+def print_report(results: dict):
+    for name, scenario in results["scenarios"].items():
+        print(f"\n== {name} (concurrency {scenario['concurrency']}, "
+              f"{scenario['elapsed_s']}s) ==")
+        print(f"{'endpoint':34} {'n':>6} {'err':>4} {'rps':>7} "
+              f"{'p50':>8} {'p95':>8} {'p99':>8} {'q/req':>6}")
+        for label, row in scenario["endpoints"].items():
+            qpr = row["queries_per_request"]
+            print(f"{label:34} {row['requests']:>6} {row['errors']:>4} "
+                  f"{row['rps']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                  f"{row['p99_ms']:>8} {'-' if qpr is None else qpr:>6}")
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Endpoints whose p95 or queries per request regressed."""
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        base_scenario = baseline["scenarios"].get(name)
+        if not base_scenario:
+            continue
+        for label, row in scenario["endpoints"].items():
+            base = base_scenario["endpoints"].get(label)
+            if not base or not row["requests"]:
+                continue
+            limit = max(base["p95_ms"] * (1 + REGRESSION_TOLERANCE),
+                        base["p95_ms"] + REGRESSION_FLOOR_MS)
+            if row["p95_ms"] > limit:
+                regressions.append(
+                    f"{name} / {label}: p95 {row['p95_ms']}ms "
+                    f"(baseline {base['p95_ms']}ms)")
+            qpr, base_qpr = row["queries_per_request"], base[
+                "queries_per_request"]
+            if qpr is not None and base_qpr is not None and qpr > base_qpr:
+                regressions.append(
+                    f"{name} / {label}: {qpr} queries/request "
+                    f"(baseline {base_qpr})")
+    return regressions
+
+
+# =================== MAIN ===================
+
+
+async def run(args) -> dict:
+    postgres = None
+    proc = None
+    try:
+        if args.database_url:
+            admin_url = args.database_url
+        else:
+            postgres = EphemeralPostgres(args.pg_bin)
+            admin_url = postgres.start()
+        await recreate_database(admin_url, BENCH_DB)
+        database_url = with_database(admin_url, BENCH_DB)
+
+        started = time.monotonic()
+        fleet = await seed_fleet(database_url, args.drivers, args.days,
+                                 args.seed)
+        seed_seconds = round(time.monotonic() - started, 1)
+        print(f"Seeded {fleet['drivers']} drivers, {fleet['sij']} SIJ, "
+              f"{fleet['ritase']} ritase, {fleet['absences']} absences "
+              f"in {seed_seconds}s")
+
+        port = free_port()
+        env = dict(kv.split("=", 1) for kv in args.server_env)
+        proc = start_server(database_url, port, args.workers, env)
+        limits = httpx.Limits(max_connections=256,
+                              max_keepalive_connections=256)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                                     timeout=120,
+                                     limits=limits) as client:
+            await wait_for_server(client, proc)
+            tokens = {}
+            for role, email, pwd in [("admin", "admin1@raja.id", "admin123"),
+                                     ("superadmin", "superadmin@raja.id",
+                                      "superadmin123")]:
+                r = await client.post("/api/auth/login",
+                                      json={"email": email, "password": pwd})
+                tokens[role] = r.json()["token"]
+            free = list(fleet["active_driver_ids"])
+            random.Random(args.seed).shuffle(free)
+            ctx = {
+                "tokens": tokens,
+                "free_driver_ids": free,
+                "rng": random.Random(args.seed),
+                "seed": args.seed,
+                "today": datetime.now(server.JAKARTA_TZ).date(),
+            }
+            scenarios = args.scenario or list(SCENARIOS)
+            results = {}
+            for name in scenarios:
+                print(f"Running {name} for {args.duration}s...")
+                results[name] = await run_scenario(client, name, ctx,
+                                                   args.duration,
+                                                   profile=args.workers == 1)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        if postgres is not None:
+            postgres.stop()
+
+    return {
+        "meta": {
+            "created_at": datetime.now(server.JAKARTA_TZ).isoformat(),
+            "drivers": args.drivers,
+            "days": args.days,
+            "seed": args.seed,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "seed_seconds": seed_seconds,
+            "rows": {k: fleet[k] for k in ("sij", "ritase", "absences",
+                                           "audit_log")},
+            "host": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+            },
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration",
+                        type=float,
+                        default=15,
+                        help="seconds per scenario")
+    parser.add_argument("--scenario",
+                        action="append",
+                        choices=sorted(SCENARIOS),
+                        help="repeatable; default runs all")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url",
+                        help="existing server; the bench DB is recreated")
+    parser.add_argument("--pg-bin", help="directory with initdb/pg_ctl")
+    parser.add_argument("--server-env",
+                        action="append",
+                        default=[],
+                        metavar="KEY=VALUE",
+                        help="extra environment for the API server")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline saved to {path}")
+    if args.compare:
+        baseline = json.loads(
+            (BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline)
+        if regressions:
+            print("\nRegressions against baseline "
+                  f"'{args.compare}':\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions against baseline '{args.compare}'")
+
+
+if __name__ == "__main__":
+    main()
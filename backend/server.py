@@ -1,12 +1,24 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
-import os, logging, random, io, csv, jwt, bcrypt, asyncpg, ssl
+import os, logging, random, io, csv, jwt, bcrypt, asyncpg, ssl, asyncio, time, bisect, heapq, hashlib, re
+import base64
+import contextlib
+import contextvars
+import collections
+import fcntl
+import hmac
+import ipaddress
+import sqlite3
+import sys
+import threading
+import traceback
+import json as json_module
 from pathlib import Path
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 from reportlab.lib.pagesizes import A4, landscape
@@ -38,19 +50,807 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-pool: asyncpg.Pool = None
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# =================== DATABASE POOLS ===================
+# Interactive traffic (counter, dashboards, lists) and reporting traffic
+# (exports, revenue/weekly reports) get separate pools so a slow export can
+# never hold the connections the counter needs. Set DB_REPORT_POOL_MAX_SIZE=0
+# to run reporting on the interactive pool.
+
+POOL_MIN_SIZE = _env_int('DB_POOL_MIN_SIZE', 2)
+POOL_MAX_SIZE = _env_int('DB_POOL_MAX_SIZE', 10)
+REPORT_POOL_MIN_SIZE = _env_int('DB_REPORT_POOL_MIN_SIZE', 1)
+REPORT_POOL_MAX_SIZE = _env_int('DB_REPORT_POOL_MAX_SIZE', 3)
+POOL_ACQUIRE_TIMEOUT = _env_float('DB_POOL_ACQUIRE_TIMEOUT', 10.0)
+POOL_MAX_IDLE_LIFETIME = _env_float('DB_POOL_MAX_IDLE_LIFETIME', 300.0)
+STATEMENT_TIMEOUT = _env_float('DB_STATEMENT_TIMEOUT', 15.0)
+REPORT_STATEMENT_TIMEOUT = _env_float('DB_REPORT_STATEMENT_TIMEOUT', 120.0)
+POOL_HEALTHCHECK_INTERVAL = _env_float('DB_POOL_HEALTHCHECK_INTERVAL', 30.0)
+REPLICA_POOL_MIN_SIZE = _env_int('DB_REPLICA_POOL_MIN_SIZE', 1)
+REPLICA_POOL_MAX_SIZE = _env_int('DB_REPLICA_POOL_MAX_SIZE', 5)
+REPLICA_MAX_LAG = _env_float('DB_REPLICA_MAX_LAG', 30.0)
+READ_YOUR_WRITES_WINDOW = _env_float('DB_READ_YOUR_WRITES_WINDOW', 10.0)
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                      10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds), cumulative on export."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+    def snapshot(self) -> dict:
+        cumulative = []
+        running = 0
+        for bound, c in zip(self.buckets, self.counts):
+            running += c
+            cumulative.append({"le": bound, "count": running})
+        cumulative.append({"le": "+Inf", "count": self.count})
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total_ms, 3),
+            "buckets": cumulative
+        }
+
+
+# =================== QUERY INSTRUMENTATION ===================
+# Every statement that goes through a TrackedPool connection is timed and
+# attributed to the request (route template) that issued it. Per request
+# the totals go out as a Server-Timing header, to superadmin tokens only
+# (statement labels describe the schema) unless SERVER_TIMING=1 sends it
+# on every response; across requests they are
+# aggregated into histograms at /api/_internal/query-stats. Statements
+# slower than DB_SLOW_QUERY_MS are logged with their parameters redacted
+# to type and length.
+
+SLOW_QUERY_MS = _env_float('DB_SLOW_QUERY_MS', 200.0)
+QUERY_STATS_MAX_STATEMENTS = _env_int('DB_QUERY_STATS_MAX_STATEMENTS', 1000)
+SERVER_TIMING = _env_int('SERVER_TIMING', 0)
+SERVER_TIMING_MAX_STATEMENTS = 10
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_SQL_SPACES = re.compile(r"\s+")
+
+
+class RequestTrace:
+    """Query count and timings for one HTTP request."""
+
+    __slots__ = ("scope", "count", "db_ms", "statements")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.db_ms = 0.0
+        self.statements = []
+
+    @property
+    def route(self) -> str:
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+    @property
+    def endpoint(self) -> str:
+        route = self.route
+        if route == "unmatched":
+            return route
+        return f"{self.scope.get('method', '')} {route}"
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class QueryStats:
+    """Aggregated per-endpoint and per-statement query histograms."""
+
+    def __init__(self):
+        self.statements = {}  # (endpoint, statement) -> LatencyHistogram
+        self.requests = {}  # endpoint -> {"queries", "db_ms"}
+        self.slow_queries = 0
+        self._labels = {}
+        self._registered_at = -1
+        self._query_names = {}
+
+    def label(self, query: str) -> str:
+        """Registered query name, or the SQL with literals stripped."""
+        if self._registered_at != len(QUERIES):
+            self._query_names = {sql: name for name, sql in QUERIES.items()}
+            self._registered_at = len(QUERIES)
+        name = self._query_names.get(query)
+        if name:
+            return name
+        label = self._labels.get(query)
+        if label is None:
+            label = _SQL_SPACES.sub(" ", _SQL_LITERALS.sub("?",
+                                                           query)).strip()
+            if len(label) > 200:
+                label = label[:197] + "..."
+            if len(self._labels) < QUERY_STATS_MAX_STATEMENTS:
+                self._labels[query] = label
+        return label
+
+    def observe_query(self, endpoint: str, query: str, args, ms: float):
+        label = self.label(query)
+        key = (endpoint, label)
+        hist = self.statements.get(key)
+        if hist is None:
+            if len(self.statements) >= QUERY_STATS_MAX_STATEMENTS:
+                key = (endpoint, "(other)")
+                hist = self.statements.get(key)
+            if hist is None:
+                hist = self.statements[key] = LatencyHistogram()
+        hist.observe(ms)
+        if ms >= SLOW_QUERY_MS:
+            self.slow_queries += 1
+            logger.warning(f"Slow query {ms:.1f}ms [{endpoint}] {label} "
+                           f"args={redact_args(args)}")
+        return label
+
+    def observe_request(self, trace: RequestTrace):
+        entry = self.requests.get(trace.endpoint)
+        if entry is None:
+            entry = self.requests[trace.endpoint] = {
+                "queries": LatencyHistogram(QUERY_COUNT_BUCKETS),
+                "db_ms": LatencyHistogram(),
+            }
+        entry["queries"].observe(trace.count)
+        entry["db_ms"].observe(trace.db_ms)
+
+    def snapshot(self) -> dict:
+        statements = [{
+            "endpoint": endpoint,
+            "statement": label,
+            **hist.snapshot()
+        } for (endpoint, label), hist in self.statements.items()]
+        statements.sort(key=lambda s: s["sum_ms"], reverse=True)
+        return {
+            "slow_query_ms": SLOW_QUERY_MS,
+            "slow_queries": self.slow_queries,
+            "requests": {
+                endpoint: {
+                    "queries_per_request": entry["queries"].snapshot(),
+                    "db_ms": entry["db_ms"].snapshot(),
+                }
+                for endpoint, entry in sorted(self.requests.items())
+            },
+            "statements": statements,
+        }
+
+
+query_stats = QueryStats()
+
+
+def redact_args(args) -> list:
+    """Parameter types and sizes only; values never reach the log."""
+    redacted = []
+    for a in args or ():
+        if a is None:
+            redacted.append(None)
+        elif isinstance(a, (str, bytes, list, tuple)):
+            redacted.append(f"<{type(a).__name__}:{len(a)}>")
+        else:
+            redacted.append(f"<{type(a).__name__}>")
+    return redacted
+
+
+def record_query(query: str, args, ms: float):
+    trace = current_trace.get()
+    endpoint = trace.endpoint if trace is not None else "background"
+    label = query_stats.observe_query(endpoint, query, args, ms)
+    if trace is not None:
+        trace.count += 1
+        trace.db_ms += ms
+        trace.statements.append((label, ms))
+
+
+class InstrumentedConnection:
+    """Times the query methods of an asyncpg connection.
+
+    Everything else (transaction(), cursor(), ...) is passed through.
+    """
+
+    __slots__ = ("_conn", )
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _timed(self, method: str, query: str, args, *call_args,
+                     **kwargs):
+        start = time.perf_counter()
+        try:
+            return await getattr(self._conn, method)(*call_args, **kwargs)
+        finally:
+            record_query(query, args, (time.perf_counter() - start) * 1000)
+
+    async def fetch(self, query, *args, timeout=None):
+        return await self._timed("fetch", query, args, query, *args,
+                                 timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        return await self._timed("fetchrow", query, args, query, *args,
+                                 timeout=timeout)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return await self._timed("fetchval", query, args, query, *args,
+                                 column=column, timeout=timeout)
+
+    async def execute(self, query, *args, timeout=None):
+        return await self._timed("execute", query, args, query, *args,
+                                 timeout=timeout)
+
+    async def executemany(self, query, args, timeout=None):
+        return await self._timed("executemany", query, None, query, args,
+                                 timeout=timeout)
+
+    async def copy_records_to_table(self, table_name, **kwargs):
+        return await self._timed("copy_records_to_table",
+                                  f"COPY {table_name}", None, table_name,
+                                  **kwargs)
+
+
+def server_timing(trace: RequestTrace, total_ms: float) -> str:
+    parts = [
+        f'db;dur={trace.db_ms:.1f};desc="{trace.count} queries"',
+        f"app;dur={total_ms:.1f}",
+    ]
+    slowest = heapq.nlargest(SERVER_TIMING_MAX_STATEMENTS,
+                             enumerate(trace.statements),
+                             key=lambda s: s[1][1])
+    for i, (label, ms) in sorted(slowest):
+        desc = label.replace('"', "'")[:80]
+        parts.append(f'q{i + 1};dur={ms:.1f};desc="{desc}"')
+    return ", ".join(parts)
+
+
+# =================== METRICS ===================
+# Prometheus text exposition at /metrics. Every series is kept in process
+# memory and updated as requests happen, so a scrape only formats numbers
+# that are already counted; it never queries the database. With several
+# uvicorn workers each process reports its own series. Scrapes must send
+# "Authorization: Bearer <METRICS_TOKEN>"; without METRICS_TOKEN the
+# endpoint stays closed, since route names and pool sizes describe the
+# deployment.
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+LOOP_LAG_INTERVAL = _env_float('LOOP_LAG_INTERVAL', 0.5)
+LOOP_LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+METRIC_HELP = {
+    "raja_http_request_duration_seconds":
+    ("histogram", "HTTP request latency by route"),
+    "raja_export_duration_seconds":
+    ("histogram", "Export duration including the streamed body"),
+    "raja_event_loop_lag_seconds":
+    ("histogram", "Event-loop scheduling delay"),
+    "raja_event_loop_lag_last_seconds":
+    ("gauge", "Most recent event-loop scheduling delay"),
+    "raja_db_pool_connections": ("gauge", "Pool connections by state"),
+    "raja_db_pool_max_connections": ("gauge", "Pool size limit"),
+    "raja_db_pool_saturation": ("gauge", "Connections in use / max size"),
+    "raja_db_pool_waiters": ("gauge", "Tasks waiting for a connection"),
+    "raja_db_pool_acquire_timeouts_total":
+    ("counter", "Acquires that gave up waiting"),
+    "raja_db_pool_acquire_seconds":
+    ("histogram", "Time to acquire a pool connection"),
+    "raja_sij_issued_total": ("counter", "SIJ issued"),
+    "raja_sij_voided_total": ("counter", "SIJ voided"),
+    "raja_logins_total": ("counter", "Login attempts by result"),
+    "raja_process_start_time_seconds":
+    ("gauge", "Process start time, unix epoch"),
+}
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"'
+                          for k, v in labels) + "}"
+
+
+class Metrics:
+    """In-process counters and histograms, rendered for Prometheus."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> LatencyHistogram (ms)
+        self.loop_lag_ms = 0.0
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, ms: float, buckets=LATENCY_BUCKETS_MS,
+                **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = LatencyHistogram(buckets)
+        hist.observe(ms)
+
+    @staticmethod
+    def _histogram_lines(name: str, labels, hist: LatencyHistogram):
+        running = 0
+        for bound, c in zip(hist.buckets, hist.counts):
+            running += c
+            yield f"{name}_bucket{_labels(labels + (('le', bound / 1000), ))} {running}"
+        yield f'{name}_bucket{_labels(labels + (("le", "+Inf"), ))} {hist.count}'
+        yield f"{name}_sum{_labels(labels)} {hist.total_ms / 1000:.6f}"
+        yield f"{name}_count{_labels(labels)} {hist.count}"
+
+    def _pool_series(self):
+        gauges, histograms = [], []
+        for p in (pool, report_pool, replica_pool):
+            if p is None:
+                continue
+            stats = p.stats()
+            label = (("pool", p.name), )
+            gauges += [
+                ("raja_db_pool_connections", label + (("state", "in_use"), ),
+                 stats["in_use"]),
+                ("raja_db_pool_connections", label + (("state", "idle"), ),
+                 stats["idle"]),
+                ("raja_db_pool_max_connections", label, p.max_size),
+                ("raja_db_pool_saturation", label,
+                 round(stats["in_use"] / p.max_size, 4) if p.max_size else 0),
+                ("raja_db_pool_waiters", label, p.waiters),
+                ("raja_db_pool_acquire_timeouts_total", label,
+                 p.acquire_timeouts),
+            ]
+            histograms.append(
+                ("raja_db_pool_acquire_seconds", label, p.acquire_latency))
+        return gauges, histograms
+
+    def render(self) -> str:
+        series = {}
+        for (name, labels), value in self.counters.items():
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), hist in self.histograms.items():
+            series.setdefault(name, []).extend(
+                self._histogram_lines(name, labels, hist))
+        gauges, histograms = self._pool_series()
+        gauges += [
+            ("raja_event_loop_lag_last_seconds", (),
+             round(self.loop_lag_ms / 1000, 6)),
+            ("raja_process_start_time_seconds", (), round(self.started, 3)),
+        ]
+        for name, labels, value in gauges:
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+        for name, labels, hist in histograms:
+            series.setdefault(name, []).extend(
+                self._histogram_lines(name, labels, hist))
+        out = []
+        for name in sorted(series):
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+
+
+async def timed_export_body(body, trace: RequestTrace, start: float):
+    # Export statements run while the body streams, so the request's query
+    # count is only complete once it ends.
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        query_stats.observe_request(trace)
+        metrics.observe("raja_export_duration_seconds",
+                        (time.perf_counter() - start) * 1000,
+                        route=trace.route)
+
+
+async def loop_lag_monitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag_ms = max(0.0, (loop.time() - start - LOOP_LAG_INTERVAL) * 1000)
+        metrics.loop_lag_ms = lag_ms
+        metrics.observe("raja_event_loop_lag_seconds", lag_ms,
+                        LOOP_LAG_BUCKETS_MS)
+
+
+# =================== LOOP WATCHDOG & PROFILER ===================
+# bcrypt, ReportLab builds and the report loops run on the event loop.
+# Set LOOP_WATCHDOG_MS to start a watchdog thread that notices when the
+# loop has not run a callback for that long and records the loop
+# thread's stack at that moment (log + /api/_internal/loop-stalls).
+# /api/_internal/profile samples every thread's stack for a few seconds
+# and returns it in collapsed ("folded") format for flamegraph.pl or
+# speedscope.
+
+LOOP_WATCHDOG_MS = _env_float('LOOP_WATCHDOG_MS', 0.0)
+LOOP_WATCHDOG_KEEP = 20
+PROFILE_MAX_SECONDS = 30.0
+PROFILE_IDLE_FILES = {"selectors.py", "threading.py", "queue.py"}
+METRIC_HELP["raja_event_loop_blocked_total"] = (
+    "counter", "Loop stalls longer than LOOP_WATCHDOG_MS")
+
+
+class LoopWatchdog:
+    """Thread that captures the loop's stack when it stops yielding."""
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self.stalls = collections.deque(maxlen=LOOP_WATCHDOG_KEEP)
+        self.last_beat = time.monotonic()
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    async def _beat(self):
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self):
+        reported, stall = None, None
+        while not self._stop.wait(self.threshold / 4):
+            beat = self.last_beat
+            if stall is not None and beat != reported:
+                # The loop is back; record how long it was really gone.
+                stall["blocked_ms"] = round((beat - reported) * 1000, 1)
+                stall = None
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or beat == reported:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame) if frame else []
+            stall = {
+                "at": datetime.now(JAKARTA_TZ).isoformat(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": [line.rstrip() for line in stack],
+            }
+            self.stalls.append(stall)
+            metrics.inc("raja_event_loop_blocked_total")
+            logger.warning(f"Event loop blocked for {blocked * 1000:.0f}ms:\n"
+                           f"{''.join(stack)}")
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        background_tasks.append(asyncio.create_task(self._beat()))
+        self._thread = threading.Thread(target=self._watch,
+                                        name="loop-watchdog",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+loop_watchdog = LoopWatchdog(LOOP_WATCHDOG_MS)
+
+
+def sample_stacks(seconds: float, interval: float,
+                  include_idle: bool) -> dict:
+    """Folded stacks of every other thread, sampled every ``interval``."""
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if not include_idle and frames and frames[0].split(
+                    ":")[0] in PROFILE_IDLE_FILES:
+                continue
+            frames.append(names.get(ident, str(ident)))
+            key = ";".join(reversed(frames))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return counts
+
+
+profile_lock = asyncio.Lock()
+
+
+class TrackedPool:
+    """asyncpg pool wrapper that measures acquire latency and waiters.
+
+    Exposes the subset of the asyncpg.Pool API the handlers use, so call
+    sites keep reading ``pool.fetch(...)``.
+    """
+
+    def __init__(self,
+                 name: str,
+                 raw: asyncpg.Pool,
+                 min_size: int,
+                 max_size: int,
+                 max_lag: Optional[float] = None):
+        self.name = name
+        self.raw = raw
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lag = max_lag
+        self.replication_lag = None
+        self.waiters = 0
+        self.acquire_timeouts = 0
+        self.acquire_latency = LatencyHistogram()
+        self.healthy = True
+        self.last_health_check = None
+        self.last_health_latency_ms = None
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        self.waiters += 1
+        start = time.perf_counter()
+        try:
+            conn = await self.raw.acquire(timeout=POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise HTTPException(status_code=503,
+                                detail="Database sibuk, coba lagi")
+        finally:
+            self.waiters -= 1
+        self.acquire_latency.observe((time.perf_counter() - start) * 1000)
+        try:
+            yield InstrumentedConnection(conn)
+        finally:
+            await self.raw.release(conn)
+
+    async def fetch(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, timeout=timeout)
+
+    async def execute(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, query, args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.executemany(query, args, timeout=timeout)
+
+    async def health_check(self) -> bool:
+        start = time.perf_counter()
+        try:
+            if self.max_lag is None:
+                await self.fetchval("SELECT 1", timeout=5)
+                self.healthy = True
+            else:
+                # The last replayed transaction only dates the lag while
+                # received WAL is still waiting to be replayed; a replica
+                # that has replayed everything is current however long the
+                # primary has been idle. NULL on a server that is not
+                # replaying WAL, i.e. no lag.
+                lag = await self.fetchval(
+                    """SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END::float8""",
+                    timeout=5)
+                self.replication_lag = round(lag, 3)
+                self.healthy = lag <= self.max_lag
+                if not self.healthy:
+                    logger.warning(
+                        f"Pool '{self.name}' lagging {lag:.1f}s, reads go to primary"
+                    )
+        except Exception as e:
+            logger.warning(f"Pool '{self.name}' health check failed: {e}")
+            self.healthy = False
+        self.last_health_check = datetime.now(JAKARTA_TZ).isoformat()
+        self.last_health_latency_ms = round(
+            (time.perf_counter() - start) * 1000, 3)
+        return self.healthy
+
+    def stats(self) -> dict:
+        size = self.raw.get_size()
+        idle = self.raw.get_idle_size()
+        return {
+            "name": self.name,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self.waiters,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_latency_ms": self.acquire_latency.snapshot(),
+            "healthy": self.healthy,
+            "replication_lag": self.replication_lag,
+            "last_health_check": self.last_health_check,
+            "last_health_latency_ms": self.last_health_latency_ms,
+        }
+
+    async def close(self):
+        await self.raw.close()
+
+
+REPLICA_FALLBACK_ERRORS = (OSError, asyncpg.PostgresConnectionError,
+                           asyncpg.InterfaceError,
+                           asyncpg.CannotConnectNowError)
+
+
+class ReplicaReader:
+    """Runs read-only queries on the replica, falling back to the primary.
+
+    A connection-level failure marks the replica unhealthy so following
+    requests skip it until the next successful health check. A statement
+    timeout is raised as is: the query would be just as slow on the
+    primary, so retrying it there only doubles the load.
+    """
+
+    def __init__(self, replica: TrackedPool, primary: TrackedPool):
+        self.replica = replica
+        self.primary = primary
+
+    async def _read(self, method: str, query, *args, timeout=None):
+        try:
+            return await getattr(self.replica, method)(query,
+                                                       *args,
+                                                       timeout=timeout)
+        except asyncio.TimeoutError:
+            # A subclass of OSError since Python 3.11.
+            raise
+        except REPLICA_FALLBACK_ERRORS as e:
+            self.replica.healthy = False
+            logger.warning(f"Replica read failed ({e}), using primary")
+        except HTTPException:
+            logger.warning("Replica pool exhausted, using primary")
+        return await getattr(self.primary, method)(query,
+                                                   *args,
+                                                   timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None):
+        return await self._read("fetch", query, *args, timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        return await self._read("fetchrow", query, *args, timeout=timeout)
+
+    async def fetchval(self, query, *args, timeout=None):
+        return await self._read("fetchval", query, *args, timeout=timeout)
+
+
+pool: TrackedPool = None
+report_pool: TrackedPool = None
+replica_pool: TrackedPool = None
+
+# user_id -> time.monotonic() of that user's last successful write, used to
+# keep their reads on the primary until the replica has caught up.
+last_write_at = {}
 
-async def get_pool() -> asyncpg.Pool:
+
+async def get_pool() -> TrackedPool:
     if pool is None:
         raise HTTPException(status_code=503, detail="Database unavailable")
     return pool
 
 
-def detect_shift() -> str:
-    now = datetime.now(JAKARTA_TZ)
+def note_user_write(user_id: str):
+    last_write_at[user_id] = time.monotonic()
+    if len(last_write_at) > 1000:
+        cutoff = time.monotonic() - READ_YOUR_WRITES_WINDOW
+        for uid in [u for u, t in last_write_at.items() if t < cutoff]:
+            del last_write_at[uid]
+
+
+def wrote_recently(user: Optional[dict]) -> bool:
+    if not user:
+        return False
+    written = last_write_at.get(user.get('user_id'))
+    if written is None:
+        return False
+    return time.monotonic() - written < READ_YOUR_WRITES_WINDOW
+
+
+def reporting_pool(user: Optional[dict] = None):
+    primary = report_pool or pool
+    if replica_pool is None or not replica_pool.healthy:
+        return primary
+    if wrote_recently(user):
+        return primary
+    return ReplicaReader(replica_pool, primary)
+
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+@app.middleware("http")
+async def track_user_writes(request, call_next):
+    response = await call_next(request)
+    if (replica_pool is not None and request.method in WRITE_METHODS
+            and response.status_code < 400):
+        payload = bearer_payload(request)
+        if payload:
+            note_user_write(payload.get('user_id'))
+    return response
+
+
+def bearer_payload(request) -> Optional[dict]:
+    """The verified JWT claims of the request, if it carries a token."""
+    auth = request.headers.get("authorization", "")
+    if not auth.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.decode(auth[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except Exception:
+        return None
+
+
+@app.middleware("http")
+async def trace_queries(request, call_next):
+    trace = RequestTrace(request.scope)
+    token = current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("raja_http_request_duration_seconds",
+                    elapsed_ms,
+                    method=request.method,
+                    route=trace.route,
+                    status=f"{response.status_code // 100}xx")
+    if "/export" in trace.route and response.status_code < 400:
+        response.body_iterator = timed_export_body(response.body_iterator,
+                                                   trace, start)
+    else:
+        query_stats.observe_request(trace)
+    claims = bearer_payload(request) or {}
+    if SERVER_TIMING or claims.get('role') == 'superadmin':
+        response.headers["Server-Timing"] = server_timing(trace, elapsed_ms)
+    return response
+
+
+def detect_shift(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(JAKARTA_TZ)
     return "Shift1" if 7 <= now.hour < 17 else "Shift2"
 
 
@@ -87,6 +887,8 @@ class SIJCreateRequest(BaseModel):
     sheets: int = 5
     qris_ref: str
     date: Optional[str] = None
+    printer_ip: Optional[str] = None  # cetak struk lewat spooler server
+    printer_port: int = 9100
 
 
 class PrintNetworkRequest(BaseModel):
@@ -95,6 +897,11 @@ class PrintNetworkRequest(BaseModel):
     hex_data: str
 
 
+class PrintSIJRequest(BaseModel):
+    ip: str
+    port: int = 9100
+
+
 class DriverCreateRequest(BaseModel):
     driver_id: str
     name: str
@@ -102,6 +909,7 @@ class DriverCreateRequest(BaseModel):
     plate: str = ""
     category: str = "standar"
     status: str = "active"
+    zone_id: Optional[str] = None
 
 
 class DriverUpdateRequest(BaseModel):
@@ -110,6 +918,16 @@ class DriverUpdateRequest(BaseModel):
     plate: Optional[str] = None
     category: Optional[str] = None
     status: Optional[str] = None
+    zone_id: Optional[str] = None  # "" melepas driver dari zona
+
+
+class ZoneCreateRequest(BaseModel):
+    zone_id: str
+    name: str
+
+
+class ZoneUpdateRequest(BaseModel):
+    name: Optional[str] = None
 
 
 class SIJUpdateRequest(BaseModel):
@@ -134,6 +952,8 @@ class RitaseUpdateRequest(BaseModel):
     notes: Optional[str] = None
 
 
+PRICE_MAP = {"standar": 40000, "premium": 60000}
+
 ABSENCE_REASONS = [
     "SAKIT", "IZIN", "GANTI UNIT", "PINDAH PREMIUM", "CUTI", "GANGGUAN G.A.",
     "TAKEDOWN", "RESIGN", "TANPA KETERANGAN", "AKUN BLOKIR", "UNIT MAINTENANCE"
@@ -173,21 +993,381 @@ def rows_to_list(rows):
     return [dict(r) for r in rows]
 
 
+# =================== QUERY REGISTRY ===================
+# Hot statements live here under a stable name so their SQL text never
+# changes between calls. In session mode asyncpg keeps one named prepared
+# statement per connection for each text; behind pgbouncer in transaction
+# mode the same text goes out as an unnamed extended-protocol statement.
+# Every allowed sort column/direction is registered as its own variant, so
+# no handler needs to build SQL with f-strings. Queries with optional
+# filters (list endpoints, zone scoping, driver search) register a filtered
+# query instead of a catch-all
+# "($1 IS NULL OR col = $1)" predicate: after five executions Postgres may
+# switch a prepared statement to a generic plan, which cannot prune
+# partitions or pick an index for a filter that might be absent. Each
+# combination of filters in use gets its own statement text, added to the
+# registry the first time it runs.
+
+QUERIES = {}
+FILTERED_QUERIES = {}  # name -> (sql, {filter: predicate}, tail)
+
+
+def register_query(name: str, sql: str) -> str:
+    QUERIES[name] = sql
+    return sql
+
+
+def register_filtered_query(name: str, sql: str, filters: dict,
+                            tail: str = ""):
+    """``filters`` maps a filter name to its predicate, with ``{0}``,
+    ``{1}``... for its parameters; a predicate without placeholders is a
+    flag that applies when its value is True. The WHERE clause goes where
+    ``sql`` says ``{filters}``, else at its end, followed by ``tail``;
+    ``{and_filters}`` adds the predicates to a WHERE clause of its own.
+    Trailing parameters are $1, $2... and the filters' parameters follow.
+    """
+    FILTERED_QUERIES[name] = (sql, filters, tail)
+
+
+def register_sorted_filtered_query(name: str, sql: str, filters: dict,
+                                   sort_cols):
+    for col in sort_cols:
+        for direction in ("ASC", "DESC"):
+            register_filtered_query(f"{name}:{col}:{direction}", sql, filters,
+                                    f" ORDER BY {col} {direction}")
+
+
+def filtered_query(name: str, *trailing, **values) -> Tuple[str, list]:
+    """SQL and arguments for the filters that are set (not None/False).
+
+    A filter with several parameters takes a tuple.
+    """
+    sql, filters, tail = FILTERED_QUERIES[name]
+    active = [
+        f for f in filters
+        if values.get(f) is not None and values[f] is not False
+    ]
+    args = list(trailing)
+    clauses = []
+    for f in active:
+        value = values[f]
+        if value is True:
+            clauses.append(filters[f])
+            continue
+        value = value if isinstance(value, tuple) else (value, )
+        clauses.append(filters[f].format(
+            *(f"${len(args) + i}" for i in range(1, len(value) + 1))))
+        args.extend(value)
+    key = f"{name}[{'+'.join(active)}]"
+    if key not in QUERIES:
+        where = ("\n    WHERE " + "\n      AND ".join(clauses)
+                 if clauses else "")
+        if "{and_filters}" in sql:
+            QUERIES[key] = sql.replace(
+                "{and_filters}",
+                "".join(f"\n      AND {c}" for c in clauses)) + tail
+        elif "{filters}" in sql:
+            QUERIES[key] = sql.replace("{filters}", where) + tail
+        else:
+            QUERIES[key] = f"{sql}{where}{tail}"
+    return QUERIES[key], args
+
+
+def sorted_filtered_query(name: str, sort_by: str, sort_dir: str,
+                          default_col: str, *trailing,
+                          **values) -> Tuple[str, list]:
+    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
+    key = f"{name}:{sort_by}:{direction}"
+    if key not in FILTERED_QUERIES:
+        key = f"{name}:{default_col}:{direction}"
+    return filtered_query(key, *trailing, **values)
+
+
+DRIVER_COLUMNS = "driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month, zone_id"
+SIJ_COLUMNS = "transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at"
+RITASE_COLUMNS = "id, driver_id, driver_name, date, waktu_ritase, notes, admin_name, shift, created_at"
+
+DRIVER_SORT_COLS = {
+    "name", "driver_id", "plate", "category", "status", "mismatch_count",
+    "total_sij_month"
+}
+SIJ_SORT_COLS = {
+    "transaction_id", "driver_name", "driver_id", "date", "time", "admin_name",
+    "shift", "amount", "sheets", "status", "created_at"
+}
+RITASE_SORT_COLS = {
+    "id", "driver_name", "driver_id", "date", "waktu_ritase", "created_at"
+}
+AUDIT_SORT_COLS = {"date", "driver_id", "has_sij", "has_trip", "mismatch"}
+
+register_query("users.by_email", "SELECT * FROM users WHERE email = $1")
+
+register_sorted_filtered_query(
+    "drivers.list", f"SELECT {DRIVER_COLUMNS} FROM drivers", {
+        "search": "(name ILIKE {0} OR driver_id ILIKE {0} OR plate ILIKE {0})",
+        "status": "status = {0}",
+    }, DRIVER_SORT_COLS)
+register_query(
+    "drivers.active",
+    f"SELECT {DRIVER_COLUMNS} FROM drivers WHERE status = 'active' ORDER BY name"
+)
+register_query("drivers.directory", f"SELECT {DRIVER_COLUMNS} FROM drivers")
+register_query(
+    "drivers.by_id",
+    f"SELECT {DRIVER_COLUMNS} FROM drivers WHERE driver_id = $1")
+register_query(
+    "drivers.inc_sij_month",
+    "UPDATE drivers SET total_sij_month = total_sij_month + 1 WHERE driver_id = $1"
+)
+
+register_query(
+    "sij.active_for_driver_date",
+    "SELECT transaction_id FROM sij_transactions WHERE driver_id = $1 AND date = $2 AND status = 'active'"
+)
+register_query(
+    "sij.insert",
+    """INSERT INTO sij_transactions (transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)""")
+register_query("sij.by_id",
+               "SELECT * FROM sij_transactions WHERE transaction_id = $1")
+# With the date (the partition key) the lookup touches one partition.
+register_query(
+    "sij.by_id_date",
+    "SELECT * FROM sij_transactions WHERE transaction_id = $1 AND date = $2")
+register_query(
+    "sij.void",
+    "UPDATE sij_transactions SET status = 'void' WHERE transaction_id = $1 AND date = $2"
+)
+register_sorted_filtered_query(
+    "sij.list", f"SELECT {SIJ_COLUMNS} FROM sij_transactions", {
+        "active_only": "status = 'active'",
+        "date": "date = {0}",
+        "date_from": "date >= {0}",
+        "date_to": "date <= {0}",
+        "shift": "shift = {0}",
+        "search":
+        "(driver_name ILIKE {0} OR driver_id ILIKE {0} OR transaction_id ILIKE {0})",
+    }, SIJ_SORT_COLS)
+
+register_query(
+    "ritase.insert",
+    """INSERT INTO ritase (driver_id, driver_name, date, waktu_ritase, notes, admin_id, admin_name, shift, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    RETURNING id""")
+register_query("ritase.by_id",
+               f"SELECT {RITASE_COLUMNS} FROM ritase WHERE id = $1")
+register_sorted_filtered_query(
+    "ritase.list", f"SELECT {RITASE_COLUMNS} FROM ritase", {
+        "date_from": "date >= {0}",
+        "date_to": "date <= {0}",
+        "search": "(driver_name ILIKE {0} OR driver_id ILIKE {0})",
+    }, RITASE_SORT_COLS)
+
+register_query(
+    "audit.mark_sij", """INSERT INTO audit_log (date, driver_id, has_sij, has_trip, mismatch)
+    VALUES ($1, $2, true, false, false)
+    ON CONFLICT (date, driver_id) DO UPDATE SET has_sij = true""")
+register_query(
+    "audit.mark_trip", """INSERT INTO audit_log (date, driver_id, has_sij, has_trip, mismatch)
+    VALUES ($1, $2, false, true, false)
+    ON CONFLICT (date, driver_id) DO UPDATE SET has_trip = true""")
+
+# Audit pages are keyset-paginated: rows are ordered by the sort column with
+# (date, driver_id) as tie-breakers and the next page starts strictly after
+# the previous page's last key, so deep pages cost the same as the first.
+# Filters: date_from/date_to, search (driver id or name pattern), mismatch
+# (spelled out literally so the planner can use the partial
+# idx_audit_log_mismatch index) and after (the cursor, one parameter per key
+# column); $1 is the limit (NULL for none).
+AUDIT_COLUMN_TYPES = {
+    "date": "text",
+    "driver_id": "text",
+    "has_sij": "boolean",
+    "has_trip": "boolean",
+    "mismatch": "boolean",
+}
+AUDIT_FROM = """SELECT a.date, a.driver_id, d.name AS driver_name,
+           a.has_sij, a.has_trip, a.mismatch
+    FROM audit_log a LEFT JOIN drivers d ON d.driver_id = a.driver_id"""
+AUDIT_FILTERS = {
+    "date_from": "a.date >= {0}",
+    "date_to": "a.date <= {0}",
+    "search": "(a.driver_id ILIKE {0} OR d.name ILIKE {0})",
+}
+
+
+def audit_key_columns(sort_by: str) -> List[str]:
+    return [sort_by] + [c for c in ("date", "driver_id") if c != sort_by]
+
+
+for _col in AUDIT_SORT_COLS:
+    _keys = audit_key_columns(_col)
+    _cursor = ", ".join(f"{{{i}}}::{AUDIT_COLUMN_TYPES[c]}"
+                        for i, c in enumerate(_keys))
+    for _direction, _op in (("ASC", ">"), ("DESC", "<")):
+        register_filtered_query(
+            f"audit.page:{_col}:{_direction}", AUDIT_FROM, {
+                **AUDIT_FILTERS,
+                "mismatch": "a.mismatch",
+                "after":
+                f"({', '.join(f'a.{c}' for c in _keys)}) {_op} ({_cursor})",
+            }, f"""
+    ORDER BY {", ".join(f"a.{c} {_direction}" for c in _keys)}
+    LIMIT $1""")
+register_filtered_query(
+    "audit.summary", """SELECT COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE a.mismatch) AS mismatch
+    FROM audit_log a LEFT JOIN drivers d ON d.driver_id = a.driver_id""",
+    AUDIT_FILTERS)
+
+register_query(
+    "dashboard.shift_count",
+    "SELECT COUNT(*) FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active'"
+)
+register_query(
+    "dashboard.shift_revenue",
+    "SELECT COALESCE(SUM(amount), 0) FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active'"
+)
+register_query("dashboard.active_driver_count",
+               "SELECT COUNT(*) FROM drivers WHERE status = 'active'")
+register_query(
+    "dashboard.mismatch_top50",
+    f"SELECT {DRIVER_COLUMNS} FROM drivers WHERE mismatch_count > 0 ORDER BY mismatch_count DESC LIMIT 50"
+)
+register_query(
+    "dashboard.recent_sij",
+    f"SELECT {SIJ_COLUMNS} FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active' ORDER BY created_at DESC LIMIT 20"
+)
+
+# $1 date where there is one; the zone filter left out means the whole
+# fleet.
+register_filtered_query(
+    "pool.active_drivers",
+    "SELECT driver_id, name, plate FROM drivers WHERE status = 'active'{and_filters}",
+    {"zone": "zone_id = {0}"}, " ORDER BY name")
+register_filtered_query(
+    "pool.absences_for_date", """SELECT a.driver_id, a.reason
+    FROM driver_absences a JOIN drivers d ON d.driver_id = a.driver_id
+    WHERE a.date = $1{and_filters}""", {"zone": "d.zone_id = {0}"})
+register_filtered_query(
+    "pool.first_sij_for_date", """SELECT s.driver_id, MIN(s.time) as first_sij
+    FROM sij_transactions s JOIN drivers d ON d.driver_id = s.driver_id
+    WHERE s.date = $1 AND s.status = 'active'{and_filters}""",
+    {"zone": "d.zone_id = {0}"}, "\n    GROUP BY s.driver_id")
+register_query(
+    "zones.list", """SELECT z.zone_id, z.name, COUNT(d.driver_id) AS driver_count
+    FROM pool_zones z LEFT JOIN drivers d ON d.zone_id = z.zone_id
+    GROUP BY z.zone_id, z.name ORDER BY z.name""")
+register_query("zones.names", "SELECT zone_id, name FROM pool_zones")
+register_query("zones.by_id",
+               "SELECT zone_id, name FROM pool_zones WHERE zone_id = $1")
+# $1 user_id, $2 key, $3 endpoint, $4 request hash, $5 TTL seconds. A row
+# that has outlived the TTL is taken over as if it did not exist.
+register_query(
+    "idempotency.claim", """INSERT INTO idempotency_keys (user_id, key, endpoint, request_hash)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (user_id, key) DO UPDATE
+        SET endpoint = EXCLUDED.endpoint, request_hash = EXCLUDED.request_hash,
+            response = NULL, created_at = now()
+        WHERE idempotency_keys.created_at < now() - make_interval(secs => $5)
+    RETURNING 1""")
+register_query(
+    "idempotency.get",
+    "SELECT endpoint, request_hash, response FROM idempotency_keys WHERE user_id = $1 AND key = $2"
+)
+register_query(
+    "idempotency.store",
+    "UPDATE idempotency_keys SET response = $3 WHERE user_id = $1 AND key = $2"
+)
+register_query(
+    "idempotency.purge",
+    "DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(secs => $1)"
+)
+register_query(
+    "pool.sij_for_date",
+    "SELECT transaction_id, driver_id, time FROM sij_transactions WHERE date = $1 AND status = 'active'"
+)
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def like_pattern(term: Optional[str]) -> Optional[str]:
+    return f"%{escape_like(term)}%" if term else None
+
+
+def encode_cursor(key: list) -> str:
+    """Opaque keyset cursor: the last row's sort key, base64url JSON."""
+    return base64.urlsafe_b64encode(
+        json_module.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: list) -> list:
+    """Inverse of encode_cursor; 400 unless it holds one value per type."""
+    try:
+        key = json_module.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, list) or len(key) != len(types) or not all(
+            type(v) is t for v, t in zip(key, types)):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    return key
+
+
+# Driver search parameters: $1 limit, $2 lowercase prefix pattern, $3
+# contains pattern, $4 raw term (trigram only); the status filter is
+# optional. Prefix hits on any column rank above word-prefix hits on the
+# name, which rank above plain substring or fuzzy (trigram) hits.
+DRIVER_SEARCH_SCORE = """(CASE WHEN lower(name) LIKE $2 OR lower(driver_id) LIKE $2
+                OR lower(plate) LIKE $2 OR phone LIKE $2 THEN 2
+           WHEN lower(name) LIKE '% ' || $2 THEN 1 ELSE 0 END)"""
+DRIVER_SEARCH_FILTERS = {"status": "status = {0}"}
+register_filtered_query(
+    "drivers.search_trgm", f"""SELECT driver_id, name, phone, plate, category, status,
+           {DRIVER_SEARCH_SCORE} + GREATEST(similarity(name, $4), similarity(driver_id, $4),
+                    similarity(plate, $4), similarity(phone, $4)) AS score
+    FROM drivers
+    WHERE (name ILIKE $3 OR driver_id ILIKE $3 OR plate ILIKE $3 OR phone ILIKE $3
+           OR name % $4){{and_filters}}
+    ORDER BY score DESC, name
+    LIMIT $1""", DRIVER_SEARCH_FILTERS)
+register_filtered_query(
+    "drivers.search_contains", f"""SELECT driver_id, name, phone, plate, category, status,
+           {DRIVER_SEARCH_SCORE}::float8 AS score
+    FROM drivers
+    WHERE (name ILIKE $3 OR driver_id ILIKE $3 OR plate ILIKE $3 OR phone ILIKE $3){{and_filters}}
+    ORDER BY score DESC, name
+    LIMIT $1""", DRIVER_SEARCH_FILTERS)
+# Terms shorter than a trigram can only be served by the prefix indexes.
+register_filtered_query(
+    "drivers.search_prefix", """SELECT driver_id, name, phone, plate, category, status,
+           1.0::float8 AS score
+    FROM drivers
+    WHERE (lower(name) LIKE $2 OR lower(driver_id) LIKE $2
+           OR lower(plate) LIKE $2 OR phone LIKE $2){and_filters}
+    ORDER BY name
+    LIMIT $1""", DRIVER_SEARCH_FILTERS)
+
+
 # =================== AUTH ===================
 
 
 @api_router.post("/auth/login")
 async def login(req: LoginRequest):
-    row = await pool.fetchrow("SELECT * FROM users WHERE email = $1",
-                              req.email)
+    row = await pool.fetchrow(QUERIES["users.by_email"], req.email)
     if not row:
+        metrics.inc("raja_logins_total", result="failure")
         raise HTTPException(status_code=401,
                             detail="Email atau password salah")
     user_doc = dict(row)
     stored_hash = user_doc.get('password_hash', '')
     if not bcrypt.checkpw(req.password.encode(), stored_hash.encode()):
+        metrics.inc("raja_logins_total", result="failure")
         raise HTTPException(status_code=401,
                             detail="Email atau password salah")
+    metrics.inc("raja_logins_total", result="success")
     shift = detect_shift()
     token_data = {
         "user_id": user_doc['user_id'],
@@ -205,12 +1385,457 @@ async def get_me(user: dict = Depends(get_current_user)):
     return user
 
 
-# =================== DRIVERS ===================
+# =================== EVENT BUS ===================
+# Writes publish typed events with pg_notify; every process (including the
+# writer) holds one dedicated LISTEN connection and fans the events out to
+# in-process subscribers. Anything that caches state per worker subscribes
+# here instead of polling. LISTEN needs a session connection: behind
+# transaction-mode pgbouncer set DATABASE_LISTEN_URL to a direct or
+# session-mode URL, otherwise the bus stays offline and caches are bypassed.
 
-DRIVER_SORT_COLS = {
-    "name", "driver_id", "plate", "category", "status", "mismatch_count",
-    "total_sij_month"
-}
+EVENT_TOPICS = ("sij", "driver", "absence", "ritase", "user", "zone")
+EVENT_CHANNEL_PREFIX = "raja_"
+EVENT_BUS_RECONNECT_DELAY = _env_float('EVENT_BUS_RECONNECT_DELAY', 5.0)
+
+register_query("events.notify", "SELECT pg_notify($1, $2)")
+register_query("events.notify_many",
+               "SELECT pg_notify($1, p) FROM unnest($2::text[]) AS p")
+
+
+class EventBus:
+
+    def __init__(self):
+        self.live = False
+        self._conn = None
+        self._listen_url = None
+        self._subscribers = {}
+        self._resync_handlers = []
+        self._disconnect_handlers = []
+        self._pending = set()
+
+    def subscribe(self, topic: str, handler):
+        """Register ``handler(event)`` for a topic, or ``"*"`` for all."""
+        self._subscribers.setdefault(topic, []).append(handler)
+
+    def on_resync(self, handler):
+        """Run ``await handler()`` after every (re)connect.
+
+        Notifications sent while disconnected are lost, so subscribers
+        holding derived state rebuild it here.
+        """
+        self._resync_handlers.append(handler)
+
+    def on_disconnect(self, handler):
+        self._disconnect_handlers.append(handler)
+
+    async def publish(self, topic: str, event: dict, actor: str = None):
+        if pool is None:
+            return
+        payload = json_module.dumps(dict(event, topic=topic, actor=actor),
+                                    default=str)
+        try:
+            await pool.execute(QUERIES["events.notify"],
+                               EVENT_CHANNEL_PREFIX + topic, payload)
+        except Exception as e:
+            logger.warning(f"Event publish on '{topic}' failed: {e}")
+
+    async def publish_many(self,
+                           topic: str,
+                           events: List[dict],
+                           actor: str = None):
+        """Publish several events on one topic in a single round-trip."""
+        if pool is None or not events:
+            return
+        payloads = [
+            json_module.dumps(dict(e, topic=topic, actor=actor), default=str)
+            for e in events
+        ]
+        try:
+            await pool.execute(QUERIES["events.notify_many"],
+                               EVENT_CHANNEL_PREFIX + topic, payloads)
+        except Exception as e:
+            logger.warning(f"Event publish on '{topic}' failed: {e}")
+
+    def _dispatch(self, conn, pid, channel, payload):
+        try:
+            event = json_module.loads(payload)
+        except ValueError:
+            return
+        topic = channel[len(EVENT_CHANNEL_PREFIX):]
+        event.setdefault("topic", topic)
+        handlers = self._subscribers.get(topic, []) + self._subscribers.get(
+            "*", [])
+        for handler in handlers:
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.create_task(result)
+                    self._pending.add(task)
+                    task.add_done_callback(self._pending.discard)
+            except Exception:
+                logger.exception(f"Event handler failed on '{topic}'")
+
+    def _on_terminate(self, conn):
+        self.live = False
+        self._conn = None
+        for handler in self._disconnect_handlers:
+            handler()
+        logger.warning("Event bus listener lost, reconnecting")
+        background_tasks.append(asyncio.create_task(self._reconnect()))
+
+    async def _reconnect(self):
+        while self._conn is None:
+            await asyncio.sleep(EVENT_BUS_RECONNECT_DELAY)
+            try:
+                await self.start(self._listen_url)
+            except Exception as e:
+                logger.warning(f"Event bus reconnect failed: {e}")
+
+    async def start(self, listen_url: str):
+        self._listen_url = listen_url
+        conn = await asyncpg.connect(strip_pgbouncer_flag(listen_url),
+                                     ssl=make_ssl_context())
+        try:
+            # Listen before resyncing so nothing written meanwhile is
+            # missed, but only go live once every cache has reloaded.
+            for topic in EVENT_TOPICS:
+                await conn.add_listener(EVENT_CHANNEL_PREFIX + topic,
+                                        self._dispatch)
+            for handler in self._resync_handlers:
+                await handler()
+            if conn.is_closed():
+                raise ConnectionError("listener closed during resync")
+        except BaseException:
+            # Caches that reloaded before the failure would go stale.
+            for handler in self._disconnect_handlers:
+                handler()
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._on_terminate)
+        self._conn = conn
+        self.live = True
+        logger.info(f"Event bus listening on {len(EVENT_TOPICS)} channels")
+
+    async def stop(self):
+        self.live = False
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            conn.remove_termination_listener(self._on_terminate)
+            await conn.close()
+
+
+event_bus = EventBus()
+# Writes seen from any worker keep that user's reports on the primary.
+event_bus.subscribe(
+    "*", lambda event: event.get("actor") and note_user_write(event["actor"]))
+
+
+# =================== DRIVER DIRECTORY ===================
+# Process-wide copy of the drivers table so hot lookups are dict hits. A
+# trigger on drivers publishes every row change on the "driver" topic,
+# which also catches edits made outside the API.
+
+
+class DriverDirectory:
+
+    def __init__(self):
+        self.drivers = {}
+        self.version = 0
+        self.live = False
+        self._active = None
+        self._active_body = None
+        self._active_by_zone = None
+
+    def _changed(self):
+        self.version += 1
+        self._active = None
+        self._active_body = None
+        self._active_by_zone = None
+
+    async def load(self):
+        rows = await pool.fetch(QUERIES["drivers.directory"])
+        self.drivers = {r['driver_id']: dict(r) for r in rows}
+        self._changed()
+        self.live = True
+        logger.info(f"Driver directory loaded {len(self.drivers)} drivers")
+
+    def get(self, driver_id: str) -> Optional[dict]:
+        return self.drivers.get(driver_id)
+
+    def put(self, row: dict):
+        self.drivers[row['driver_id']] = row
+        self._changed()
+
+    def active(self) -> list:
+        if self._active is None:
+            self._active = sorted(
+                (d for d in self.drivers.values() if d['status'] == 'active'),
+                key=lambda d: d['name'])
+        return self._active
+
+    def active_body(self) -> tuple:
+        """Serialized active list and its ETag, a hash of the content.
+
+        The hash (not ``version``) keeps ETags equal across workers and
+        restarts as long as the list itself is unchanged.
+        """
+        if self._active_body is None:
+            body = json_module.dumps(self.active()).encode()
+            digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+            self._active_body = body, f'W/"drivers-{digest}"'
+        return self._active_body
+
+    def active_in_zone(self, zone_id: Optional[str]) -> list:
+        """Active drivers of one zone, name-sorted; None means all."""
+        if zone_id is None:
+            return self.active()
+        if self._active_by_zone is None:
+            by_zone = {}
+            for d in self.active():
+                by_zone.setdefault(d.get('zone_id'), []).append(d)
+            self._active_by_zone = by_zone
+        return self._active_by_zone.get(zone_id, [])
+
+    def apply(self, event: dict):
+        if event.get('op') == 'DELETE':
+            if self.drivers.pop(event.get('driver_id'), None) is not None:
+                self._changed()
+        elif event.get('row'):
+            row = event['row']
+            self.drivers[row['driver_id']] = {
+                k: row.get(k)
+                for k in DRIVER_COLUMNS.split(", ")
+            }
+            self._changed()
+
+    def disconnect(self):
+        self.live = False
+
+
+driver_directory = DriverDirectory()
+event_bus.subscribe("driver", driver_directory.apply)
+event_bus.on_resync(driver_directory.load)
+event_bus.on_disconnect(driver_directory.disconnect)
+
+
+async def lookup_driver(driver_id: str) -> Optional[dict]:
+    """Driver row from the directory when it is live, else from the DB."""
+    if driver_directory.live:
+        driver = driver_directory.get(driver_id)
+        if driver is not None:
+            return driver
+    row = await pool.fetchrow(QUERIES["drivers.by_id"], driver_id)
+    if row is None:
+        return None
+    driver = dict(row)
+    if driver_directory.live:
+        driver_directory.put(driver)
+    return driver
+
+
+# =================== POOL PRESENCE ===================
+
+
+def partition_presence(drivers, absent_map: dict, first_sij: dict) -> dict:
+    """Split active drivers into the pool board's three columns."""
+    active_list = []
+    absent_list = []
+    unknown_list = []
+    for d in drivers:
+        did = d['driver_id']
+        if did in first_sij:
+            active_list.append({
+                "name": d['name'],
+                "plate": d['plate'],
+                "time": str(first_sij[did])[:5]  # Ambil Jam:Menit saja
+            })
+        elif did in absent_map:
+            absent_list.append({"name": d['name'], "reason": absent_map[did]})
+        else:
+            unknown_list.append({"name": d['name'], "plate": d['plate']})
+    # Urutkan yang aktif berdasarkan jam masuk terbaru
+    active_list.sort(key=lambda x: x['time'], reverse=True)
+    return {
+        "active": active_list,
+        "absent": absent_list,
+        "unknown": unknown_list
+    }
+
+
+def board_pages(board: dict, page_size: int) -> int:
+    if page_size <= 0:
+        return 1
+    longest = max(len(board[k]) for k in ("active", "absent", "unknown"))
+    return max(1, -(-longest // page_size))
+
+
+def paginate_board(board: dict, page: int, page_size: int) -> dict:
+    """Slice each column to one page; TV boards cycle through pages.
+
+    ``page_size`` 0 returns whole columns. Out-of-range pages wrap, so a
+    board can keep requesting ``page + 1``.
+    """
+    totals = {k: len(board[k]) for k in ("active", "absent", "unknown")}
+    if page_size <= 0:
+        return dict(board, page=0, pages=1, totals=totals)
+    pages = board_pages(board, page_size)
+    page %= pages
+    start = page * page_size
+    sliced = {
+        k: board[k][start:start + page_size]
+        for k in ("active", "absent", "unknown")
+    }
+    return dict(board, **sliced, page=page, pages=pages, totals=totals)
+
+
+PRESENCE_CACHE_MAX = 256
+
+
+class PresenceBoard:
+    """Today's presence per driver, kept current from bus events.
+
+    Holds the active SIJ times and the absence reason of every driver for
+    the current Jakarta day; names, plates, status and zone come from the
+    driver directory.  Boards are partitioned per zone, lazily and once per
+    change, so a terminal only pays for its own zone and reads between
+    writes serialize a cached payload.  The day rolls over on the first
+    read or event after midnight.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.live = False
+        self.version = 0
+        self.zones = {}
+        self._sij = {}
+        self._absences = {}
+        self._boards = {}
+        self._bodies = {}
+        self._buffer = None
+        self._lock = asyncio.Lock()
+
+    def _changed(self):
+        self.version += 1
+        self._boards = {}
+        self._bodies = {}
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(JAKARTA_TZ).strftime("%Y-%m-%d")
+
+    async def load(self):
+        async with self._lock:
+            self._buffer = []
+            try:
+                day = self._today()
+                sij_rows = await pool.fetch(QUERIES["pool.sij_for_date"], day)
+                sql, args = filtered_query("pool.absences_for_date", day)
+                absent_rows = await pool.fetch(sql, *args)
+                zone_rows = await pool.fetch(QUERIES["zones.names"])
+                self.day = day
+                self._sij = {}
+                for r in sij_rows:
+                    self._sij.setdefault(r['driver_id'],
+                                         {})[r['transaction_id']] = r['time']
+                self._absences = {
+                    r['driver_id']: r['reason']
+                    for r in absent_rows
+                }
+                self.zones = {r['zone_id']: r['name'] for r in zone_rows}
+                buffered, self._buffer = self._buffer, None
+                for topic, event in buffered:
+                    self._apply(topic, event)
+                self._changed()
+                self.live = True
+            finally:
+                self._buffer = None
+
+    def disconnect(self):
+        self.live = False
+
+    def _apply(self, topic: str, event: dict):
+        if topic == 'sij':
+            before = event.get('before')
+            after = event.get('transaction')
+            if event.get('op') == 'delete':
+                before, after = after, None
+            for tx in (before, after):
+                if tx and tx.get('date') == self.day:
+                    times = self._sij.get(tx['driver_id'], {})
+                    times.pop(tx['transaction_id'], None)
+                    if not times:
+                        self._sij.pop(tx['driver_id'], None)
+            if (after and after.get('date') == self.day
+                    and after.get('status') == 'active'):
+                self._sij.setdefault(
+                    after['driver_id'],
+                    {})[after['transaction_id']] = after.get('time')
+        elif topic == 'absence' and event.get('date') == self.day:
+            if event.get('op') == 'clear':
+                self._absences.pop(event['driver_id'], None)
+            else:
+                self._absences[event['driver_id']] = event.get('reason')
+        elif topic == 'zone':
+            if event.get('op') == 'delete':
+                self.zones.pop(event['zone_id'], None)
+            else:
+                self.zones[event['zone_id']] = event.get('name')
+        # Driver events only need the boards rebuilt from the directory.
+        self._changed()
+
+    def on_event(self, event: dict):
+        if self._buffer is not None:
+            self._buffer.append((event.get('topic'), event))
+        elif self.live:
+            self._apply(event.get('topic'), event)
+
+    async def board(self, zone_id: Optional[str] = None) -> dict:
+        if self.day != self._today():
+            await self.load()
+        board = self._boards.get(zone_id)
+        if board is None:
+            drivers = driver_directory.active_in_zone(zone_id)
+            first_sij = {}
+            for d in drivers:
+                times = [t for t in self._sij.get(d['driver_id'], {}).values() if t]
+                if times:
+                    first_sij[d['driver_id']] = min(times)
+            board = partition_presence(drivers, self._absences, first_sij)
+            board["zone"] = zone_id
+            board["zone_name"] = self.zones.get(zone_id)
+            while len(self._boards) >= PRESENCE_CACHE_MAX:
+                self._boards.pop(next(iter(self._boards)))
+            self._boards[zone_id] = board
+        return board
+
+    async def body(self,
+                   zone_id: Optional[str] = None,
+                   page: int = 0,
+                   page_size: int = 0) -> tuple:
+        """Serialized board page and its ETag."""
+        board = await self.board(zone_id)
+        # Key on the page actually served, so wrapping page numbers share
+        # one entry; the cap bounds unusual page sizes and unknown zones.
+        page_size = max(page_size, 0)
+        key = (zone_id, page % board_pages(board, page_size), page_size)
+        if key not in self._bodies:
+            body = json_module.dumps(paginate_board(board, page,
+                                                    page_size)).encode()
+            digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+            while len(self._bodies) >= PRESENCE_CACHE_MAX:
+                self._bodies.pop(next(iter(self._bodies)))
+            self._bodies[key] = body, f'W/"pool-{digest}"'
+        return self._bodies[key]
+
+
+presence_board = PresenceBoard()
+for _topic in ("sij", "absence", "driver", "zone"):
+    event_bus.subscribe(_topic, presence_board.on_event)
+event_bus.on_resync(presence_board.load)
+event_bus.on_disconnect(presence_board.disconnect)
+
+
+# =================== DRIVERS ===================
 
 
 @api_router.get("/drivers")
@@ -219,36 +1844,53 @@ async def get_drivers(search: str = "",
                       sort_by: str = "name",
                       sort_dir: str = "asc",
                       user: dict = Depends(get_current_user)):
-    conditions = []
-    params = []
-    idx = 1
-    if search:
-        conditions.append(
-            f"(name ILIKE ${idx} OR driver_id ILIKE ${idx} OR plate ILIKE ${idx})"
-        )
-        params.append(f"%{search}%")
-        idx += 1
-    if status_filter:
-        conditions.append(f"status = ${idx}")
-        params.append(status_filter)
-        idx += 1
-    where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    col = sort_by if sort_by in DRIVER_SORT_COLS else "name"
-    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
-    rows = await pool.fetch(
-        f"SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers {where} ORDER BY {col} {direction}",
-        *params)
+    sql, args = sorted_filtered_query("drivers.list",
+                                      sort_by,
+                                      sort_dir,
+                                      "name",
+                                      search=like_pattern(search),
+                                      status=status_filter or None)
+    rows = await pool.fetch(sql, *args)
     return rows_to_list(rows)
 
 
-@api_router.get("/drivers/active")
-async def get_active_drivers(user: dict = Depends(get_current_user)):
-    rows = await pool.fetch(
-        "SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers WHERE status = 'active' ORDER BY name"
-    )
+@api_router.get("/drivers/search")
+async def search_drivers(q: str = "",
+                         status_filter: str = "",
+                         limit: int = Query(10, ge=1, le=50),
+                         user: dict = Depends(get_current_user)):
+    term = q.strip()
+    if not term:
+        return []
+    prefix = f"{escape_like(term.lower())}%"
+    status = status_filter or None
+    if len(term) < 3:
+        sql, args = filtered_query("drivers.search_prefix", limit, prefix,
+                                   status=status)
+    elif TRGM_AVAILABLE:
+        sql, args = filtered_query("drivers.search_trgm", limit, prefix,
+                                   like_pattern(term), term, status=status)
+    else:
+        sql, args = filtered_query("drivers.search_contains", limit, prefix,
+                                   like_pattern(term), status=status)
+    rows = await pool.fetch(sql, *args)
     return rows_to_list(rows)
 
 
+@api_router.get("/drivers/active")
+async def get_active_drivers(request: Request,
+                             user: dict = Depends(get_current_user)):
+    if not driver_directory.live:
+        rows = await pool.fetch(QUERIES["drivers.active"])
+        return rows_to_list(rows)
+    body, etag = driver_directory.active_body()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body,
+                    media_type="application/json",
+                    headers={"ETag": etag})
+
+
 @api_router.post("/drivers")
 async def create_driver(data: DriverCreateRequest,
                         user: dict = Depends(require_superadmin)):
@@ -256,10 +1898,11 @@ async def create_driver(data: DriverCreateRequest,
         "SELECT driver_id FROM drivers WHERE driver_id = $1", data.driver_id)
     if existing:
         raise HTTPException(status_code=400, detail="Driver ID sudah ada")
+    zone_id = await resolve_zone(data.zone_id)
     await pool.execute(
-        "INSERT INTO drivers (driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month) VALUES ($1, $2, $3, $4, $5, $6, 0, 0)",
+        "INSERT INTO drivers (driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month, zone_id) VALUES ($1, $2, $3, $4, $5, $6, 0, 0, $7)",
         data.driver_id, data.name, data.phone, data.plate, data.category,
-        data.status)
+        data.status, zone_id)
     return {
         "message": "Driver berhasil ditambahkan",
         "driver_id": data.driver_id
@@ -268,7 +1911,7 @@ async def create_driver(data: DriverCreateRequest,
 
 @api_router.get("/drivers/export/csv")
 async def export_drivers_csv(user: dict = Depends(get_current_user)):
-    rows = await pool.fetch(
+    rows = await reporting_pool(user).fetch(
         "SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers ORDER BY name"
     )
     drivers = rows_to_list(rows)
@@ -290,7 +1933,7 @@ async def export_drivers_csv(user: dict = Depends(get_current_user)):
 
 @api_router.get("/drivers/export/pdf")
 async def export_drivers_pdf(user: dict = Depends(get_current_user)):
-    rows = await pool.fetch(
+    rows = await reporting_pool(user).fetch(
         "SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers ORDER BY name"
     )
     drivers = rows_to_list(rows)
@@ -349,6 +1992,8 @@ async def update_driver(driver_id: str,
                         data: DriverUpdateRequest,
                         user: dict = Depends(require_superadmin)):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    if 'zone_id' in update_data:
+        update_data['zone_id'] = await resolve_zone(update_data['zone_id'])
     if update_data:
         sets = []
         params = []
@@ -392,22 +2037,1377 @@ async def delete_driver(driver_id: str,
     return {"message": "Driver berhasil dihapus"}
 
 
-# =================== SIJ TRANSACTIONS ===================
+# =================== DRIVER TIMELINE ===================
+# One driver's history as a single newest-first stream. Every source is
+# read through a (driver_id, date) index and limited on its own, so a page
+# costs at most five index range scans of ``limit`` rows whatever the
+# driver's history length. Events are keyed (date, time, kind, ref);
+# day-level events (absence, manual RTS, mismatch) have an empty time and
+# so close out their day.
+
+TIMELINE_PAGE_SIZE = _env_int("TIMELINE_PAGE_SIZE", 100)
+TIMELINE_PAGE_MAX = 500
+
+# $1 limit, $2 driver. Filters: date_from/date_to and after (the cursor:
+# date, time, kind, ref). Each branch is a flattened subquery, so the same
+# predicates on its output columns reach every table as date bounds on
+# the index.
+_TIMELINE_BRANCH = """(SELECT * FROM (
+        SELECT date, {time} AS time, '{kind}' AS kind, {ref} AS ref,
+               json_build_object({detail})::text AS detail
+        FROM {table}
+        WHERE driver_id = $2{where}) b{{filters}}
+     ORDER BY date DESC, time DESC, ref DESC
+     LIMIT $1)"""
+TIMELINE_SOURCES = [
+    dict(table="sij_transactions",
+         kind="sij",
+         time="COALESCE(time, '')",
+         ref="transaction_id",
+         where="",
+         detail="'transaction_id', transaction_id, 'status', status, "
+         "'category', category, 'sheets', sheets, 'amount', amount, "
+         "'qris_ref', qris_ref, 'shift', shift, 'admin_name', admin_name, "
+         "'created_at', created_at"),
+    dict(table="ritase",
+         kind="ritase",
+         time="CASE WHEN waktu_ritase ~ '^[0-9]{2}:[0-9]{2}' "
+         "THEN waktu_ritase ELSE '' END",
+         ref="lpad(id::text, 12, '0')",
+         where="",
+         detail="'id', id, 'waktu_ritase', waktu_ritase, 'notes', notes, "
+         "'shift', shift, 'admin_name', admin_name, 'created_at', created_at"),
+    dict(table="driver_absences",
+         kind="absence",
+         time="''",
+         ref="''",
+         where="",
+         detail="'reason', reason"),
+    dict(table="manual_ritase_override",
+         kind="manual_ritase",
+         time="''",
+         ref="''",
+         where="",
+         detail="'manual_rts', manual_rts, 'updated_by', updated_by, "
+         "'updated_at', updated_at"),
+    dict(table="audit_log",
+         kind="mismatch",
+         time="''",
+         ref="''",
+         where=" AND mismatch",
+         detail="'has_sij', has_sij, 'has_trip', has_trip"),
+]
+register_filtered_query(
+    "drivers.timeline",
+    "SELECT * FROM (\n    " + "\n    UNION ALL\n    ".join(
+        _TIMELINE_BRANCH.format(**src) for src in TIMELINE_SOURCES) +
+    "\n) t ORDER BY date DESC, time DESC, kind DESC, ref DESC LIMIT $1", {
+        "date_from": "date >= {0}",
+        "date_to": "date <= {0}",
+        "after": "date <= {0} AND (date, time, kind, ref) < "
+        "({0}, {1}::text, {2}::text, {3}::text)",
+    })
+
+
+@api_router.get("/drivers/{driver_id}/timeline")
+async def get_driver_timeline(driver_id: str,
+                              response: Response,
+                              date_from: Optional[str] = None,
+                              date_to: Optional[str] = None,
+                              limit: int = Query(TIMELINE_PAGE_SIZE,
+                                                 ge=1,
+                                                 le=TIMELINE_PAGE_MAX),
+                              cursor: Optional[str] = None,
+                              user: dict = Depends(get_current_user)):
+    """SIJs (voids included), ritase, absences, manual RTS overrides and
+    mismatch flags of one driver, newest first.
+
+    When more events follow, ``X-Next-Cursor`` carries the cursor for the
+    next page.
+    """
+    db = reporting_pool(user)
+    if not await db.fetchrow(
+            "SELECT driver_id FROM drivers WHERE driver_id = $1", driver_id):
+        raise HTTPException(status_code=404, detail="Driver tidak ditemukan")
+    sql, args = filtered_query(
+        "drivers.timeline",
+        limit + 1,
+        driver_id,
+        date_from=date_from or None,
+        date_to=date_to or None,
+        after=tuple(decode_cursor(cursor, [str] * 4)) if cursor else None)
+    rows = await db.fetch(sql, *args)
+    events = [
+        dict(date=r['date'],
+             time=r['time'],
+             kind=r['kind'],
+             ref=r['ref'],
+             detail=json_module.loads(r['detail'])) for r in rows[:limit]
+    ]
+    if len(rows) > limit:
+        last = events[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            [last['date'], last['time'], last['kind'], last['ref']])
+    return events
 
 
-@api_router.post("/sij")
-async def create_sij(req: SIJCreateRequest,
-                     user: dict = Depends(require_admin)):
-    driver_row = await pool.fetchrow(
-        "SELECT * FROM drivers WHERE driver_id = $1 AND status = 'active'",
-        req.driver_id)
-    if not driver_row:
+# =================== POOL ZONES ===================
+
+
+async def resolve_zone(zone_id: Optional[str]) -> Optional[str]:
+    """Validate a driver's zone assignment; empty means unassigned."""
+    if not zone_id:
+        return None
+    if not await pool.fetchrow(QUERIES["zones.by_id"], zone_id):
+        raise HTTPException(status_code=400, detail="Zona tidak ditemukan")
+    return zone_id
+
+
+@api_router.get("/zones")
+async def get_zones(user: dict = Depends(get_current_user)):
+    rows = await pool.fetch(QUERIES["zones.list"])
+    return rows_to_list(rows)
+
+
+@api_router.post("/zones")
+async def create_zone(data: ZoneCreateRequest,
+                      user: dict = Depends(require_superadmin)):
+    if await pool.fetchrow(QUERIES["zones.by_id"], data.zone_id):
+        raise HTTPException(status_code=400, detail="Zona sudah ada")
+    await pool.execute(
+        "INSERT INTO pool_zones (zone_id, name) VALUES ($1, $2)",
+        data.zone_id, data.name)
+    await event_bus.publish("zone",
+                            dict(op="create",
+                                 zone_id=data.zone_id,
+                                 name=data.name),
+                            actor=user['user_id'])
+    return {"message": "Zona berhasil dibuat", "zone_id": data.zone_id}
+
+
+@api_router.put("/zones/{zone_id}")
+async def update_zone(zone_id: str,
+                      data: ZoneUpdateRequest,
+                      user: dict = Depends(require_superadmin)):
+    if not await pool.fetchrow(QUERIES["zones.by_id"], zone_id):
+        raise HTTPException(status_code=404, detail="Zona tidak ditemukan")
+    if data.name is not None:
+        await pool.execute("UPDATE pool_zones SET name = $1 WHERE zone_id = $2",
+                           data.name, zone_id)
+        await event_bus.publish("zone",
+                                dict(op="update",
+                                     zone_id=zone_id,
+                                     name=data.name),
+                                actor=user['user_id'])
+    return {"message": "Zona diperbarui"}
+
+
+@api_router.delete("/zones/{zone_id}")
+async def delete_zone(zone_id: str, user: dict = Depends(require_superadmin)):
+    if not await pool.fetchrow(QUERIES["zones.by_id"], zone_id):
+        raise HTTPException(status_code=404, detail="Zona tidak ditemukan")
+    # Drivers in the zone are released (ON DELETE SET NULL).
+    await pool.execute("DELETE FROM pool_zones WHERE zone_id = $1", zone_id)
+    await event_bus.publish("zone",
+                            dict(op="delete", zone_id=zone_id),
+                            actor=user['user_id'])
+    return {"message": "Zona berhasil dihapus"}
+
+
+# =================== IDEMPOTENCY ===================
+# Counter writes accept an Idempotency-Key header. The key is claimed in
+# the same transaction as the write and the response is stored alongside
+# it, so a retry after a dropped connection either replays the committed
+# response or (if the first attempt rolled back) runs the write again.
+# A concurrent retry blocks on the key's row until the first attempt
+# commits. Error responses are not stored. Keys are per user and expire
+# after IDEMPOTENCY_TTL_HOURS.
+
+IDEMPOTENCY_TTL_HOURS = _env_float('IDEMPOTENCY_TTL_HOURS', 24.0)
+IDEMPOTENCY_PURGE_INTERVAL = 3600.0
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+
+def request_fingerprint(body: BaseModel) -> str:
+    payload = json_module.dumps(body.model_dump(), sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+async def claim_idempotency_key(conn, user: dict, key: str, endpoint: str,
+                                body: BaseModel) -> Optional[dict]:
+    """Claim ``key`` for this write, or return the response to replay."""
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400,
+                            detail="Idempotency-Key terlalu panjang")
+    fingerprint = request_fingerprint(body)
+    ttl = IDEMPOTENCY_TTL_HOURS * 3600
+    if await conn.fetchval(QUERIES["idempotency.claim"], user['user_id'],
+                           key, endpoint, fingerprint, ttl):
+        return None
+    row = await conn.fetchrow(QUERIES["idempotency.get"], user['user_id'],
+                              key)
+    if row['endpoint'] != endpoint or row['request_hash'] != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key sudah dipakai untuk request lain")
+    return json_module.loads(row['response'])
+
+
+async def store_idempotent_response(conn, user: dict, key: str,
+                                    response: dict):
+    await conn.execute(QUERIES["idempotency.store"], user['user_id'], key,
+                       json_module.dumps(response))
+
+
+async def run_counter_write(endpoint: str, body: BaseModel, user: dict,
+                            idempotency_key: Optional[str], write) -> tuple:
+    """Run ``write(conn)`` in one transaction behind the idempotency key.
+
+    Returns (response, replayed). Connection failures propagate so the
+    caller can fall back to the offline buffer.
+    """
+    if pool is None:
+        raise ConnectionError("database pool not initialised")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if idempotency_key:
+                replay = await claim_idempotency_key(conn, user,
+                                                     idempotency_key,
+                                                     endpoint, body)
+                if replay is not None:
+                    return replay, True
+            response = await write(conn)
+            if idempotency_key:
+                await store_idempotent_response(conn, user, idempotency_key,
+                                                response)
+    return response, False
+
+
+def idempotent_replay(response: dict) -> JSONResponse:
+    return JSONResponse(response, headers={"Idempotent-Replayed": "true"})
+
+
+async def idempotency_purge_loop():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            await pool.execute(QUERIES["idempotency.purge"],
+                               IDEMPOTENCY_TTL_HOURS * 3600)
+        except Exception as e:
+            logger.warning(f"Idempotency key purge failed: {e}")
+
+
+# =================== OFFLINE WRITE BUFFER ===================
+# When Postgres cannot be reached, counter writes (SIJ, ritase, absences)
+# are journalled to a local SQLite file (WAL, synchronous=FULL) and
+# answered with 202 and a provisional receipt. A replay task applies them
+# in arrival order once the pool is back, through the same write functions
+# and idempotency keys as live requests. Writes that no longer apply
+# (driver suspended, SIJ already issued for that day) are kept with status
+# 'conflict' and the reason; any other error leaves the row 'failed' with
+# the error and replay moves on to the next one. An SIJ keeps its provisional transaction_id
+# and original issue time, so a receipt printed offline stays valid. Only
+# one worker replays at a time (flock on the journal). Set
+# OFFLINE_BUFFER_PATH="" to disable buffering.
+
+OFFLINE_BUFFER_PATH = os.environ.get(
+    'OFFLINE_BUFFER_PATH',
+    str(Path(__file__).parent / "offline_writes.sqlite3"))
+OFFLINE_REPLAY_INTERVAL = _env_float('OFFLINE_REPLAY_INTERVAL', 5.0)
+OFFLINE_REPLAY_BATCH = 500
+# Only errors that mean "cannot reach Postgres": anything else (timeouts,
+# driver misuse, bad SQL) must surface as a normal failure, not a 202 or 503.
+DB_UNAVAILABLE_ERRORS = (ConnectionError, asyncpg.PostgresConnectionError,
+                         asyncpg.CannotConnectNowError)
+OFFLINE_WRITE_MODELS = {
+    "sij": SIJCreateRequest,
+    "ritase": RitaseCreateRequest,
+    "absence": AbsenceRequest,
+}
+OFFLINE_WRITE_COLUMNS = ("offline_id, kind, user_id, driver_id, date, "
+                         "received_at, status, receipt_json, result_json, "
+                         "applied_at")
+
+
+def _offline_schema(db: sqlite3.Connection):
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=FULL")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS offline_writes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            offline_id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            user_json TEXT NOT NULL,
+            body_json TEXT NOT NULL,
+            idempotency_key TEXT,
+            driver_id TEXT,
+            date TEXT,
+            receipt_json TEXT NOT NULL,
+            received_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result_json TEXT,
+            applied_at TEXT
+        )
+    """)
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_offline_writes_status ON offline_writes (status, seq)"
+    )
+    db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_offline_writes_key ON offline_writes (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL"
+    )
+
+
+def _offline_row(row: sqlite3.Row) -> dict:
+    return {
+        "offline_id": row["offline_id"],
+        "kind": row["kind"],
+        "user_id": row["user_id"],
+        "driver_id": row["driver_id"],
+        "date": row["date"],
+        "received_at": row["received_at"],
+        "status": row["status"],
+        "receipt": json_module.loads(row["receipt_json"]),
+        "result": json_module.loads(row["result_json"])
+        if row["result_json"] else None,
+        "applied_at": row["applied_at"],
+    }
+
+
+class OfflineWriteBuffer:
+    """SQLite journal of counter writes taken while the DB was down."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.outage_since = None
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._db is None:
+                db = sqlite3.connect(self.path,
+                                     timeout=10,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+                db.row_factory = sqlite3.Row
+                _offline_schema(db)
+                self._db = db
+            return fn(self._db, *args)
+
+    async def call(self, fn, *args):
+        return await asyncio.to_thread(self._run, fn, *args)
+
+    async def accept(self,
+                     kind: str,
+                     body: BaseModel,
+                     user: dict,
+                     idempotency_key: Optional[str],
+                     error: Exception,
+                     receipt: dict,
+                     received_at: Optional[datetime] = None,
+                     date: Optional[str] = None) -> tuple:
+        """Journal one write; returns (receipt, newly_added)."""
+        if not self.enabled:
+            raise HTTPException(status_code=503,
+                                detail="Database tidak tersedia")
+        if self.outage_since is None:
+            self.outage_since = datetime.now(JAKARTA_TZ).isoformat()
+            logger.warning(f"Database unreachable ({error!r}); "
+                           f"buffering counter writes in {self.path}")
+        received_at = received_at or datetime.now(JAKARTA_TZ)
+        offline_id = f"OFF{int(time.time() * 1000)}{random.randint(100, 999)}"
+        receipt = {
+            **receipt, "provisional": True,
+            "offline_id": offline_id,
+            "status": "pending"
+        }
+        driver_id = getattr(body, "driver_id", None)
+        date = date or getattr(body, "date", None)
+
+        def append(db):
+            if idempotency_key:
+                row = db.execute(
+                    "SELECT receipt_json FROM offline_writes WHERE user_id = ? AND idempotency_key = ?",
+                    (user['user_id'], idempotency_key)).fetchone()
+                if row:
+                    return json_module.loads(row[0]), False
+            if kind == "sij" and db.execute(
+                    "SELECT 1 FROM offline_writes WHERE kind = 'sij' AND driver_id = ? AND date = ? AND status = 'pending'",
+                (driver_id, date)).fetchone():
+                return None, False
+            db.execute(
+                """INSERT INTO offline_writes (offline_id, kind, user_id, user_json, body_json,
+                    idempotency_key, driver_id, date, receipt_json, received_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (offline_id, kind, user['user_id'], json_module.dumps(user),
+                 json_module.dumps(body.model_dump()), idempotency_key,
+                 driver_id, date, json_module.dumps(receipt),
+                 received_at.isoformat()))
+            return receipt, True
+
+        stored, added = await self.call(append)
+        if stored is None:
+            raise HTTPException(
+                status_code=400,
+                detail=
+                f"Driver {receipt.get('driver_name', driver_id)} sudah memiliki SIJ aktif untuk tanggal {date}"
+            )
+        return stored, added
+
+    async def _apply(self, row: sqlite3.Row) -> dict:
+        kind = row["kind"]
+        user = json_module.loads(row["user_json"])
+        body = OFFLINE_WRITE_MODELS[kind](**json_module.loads(row["body_json"]))
+        # Rows taken without an Idempotency-Key still get one of their own,
+        # so a replay that dies between the commit and _mark returns the
+        # stored response next time instead of writing again.
+        key = row["idempotency_key"] or f"offline:{row['offline_id']}"
+        now = datetime.fromisoformat(row["received_at"])
+        if kind == "sij":
+            tx_id = json_module.loads(row["receipt_json"])["transaction_id"]
+            response, replayed = await run_counter_write(
+                "sij.create", body, user, key,
+                lambda conn: insert_sij(conn, body, user, now, tx_id))
+            if not replayed:
+                await publish_sij_created(response, user)
+        elif kind == "ritase":
+            response, replayed = await run_counter_write(
+                "ritase.create", body, user, key,
+                lambda conn: insert_ritase(conn, body, user, now))
+            if not replayed:
+                await publish_ritase_created(response, body, user)
+        else:
+            response, replayed = await run_counter_write(
+                "absence.set", body, user, key,
+                lambda conn: write_absence(conn, body))
+            if not replayed:
+                await publish_absence(body, user)
+        return response
+
+    def _mark(self, db, offline_id: str, status: str, result: dict):
+        db.execute(
+            "UPDATE offline_writes SET status = ?, result_json = ?, applied_at = ? WHERE offline_id = ?",
+            (status, json_module.dumps(result),
+             datetime.now(JAKARTA_TZ).isoformat(), offline_id))
+
+    async def replay(self) -> int:
+        """Apply pending writes in order; stops at the first DB failure.
+
+        Any other error is recorded on that row ('conflict' for rejected
+        writes, 'failed' for the rest) so one bad row never holds up the
+        journal.
+        """
+        if not self.enabled or pool is None or not os.path.exists(self.path):
+            return 0
+        with open(self.path + ".lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # another worker is replaying
+            rows = await self.call(lambda db: db.execute(
+                "SELECT * FROM offline_writes WHERE status = 'pending' ORDER BY seq LIMIT ?",
+                (OFFLINE_REPLAY_BATCH, )).fetchall())
+            applied = 0
+            for row in rows:
+                try:
+                    result = await self._apply(row)
+                    status = "applied"
+                    applied += 1
+                except DB_UNAVAILABLE_ERRORS:
+                    return applied
+                except HTTPException as e:
+                    result, status = {"detail": e.detail}, "conflict"
+                    logger.warning(
+                        f"Offline write {row['offline_id']} ({row['kind']}) "
+                        f"conflicts: {e.detail}")
+                except Exception as e:
+                    result = {"detail": str(e) or type(e).__name__}
+                    status = "failed"
+                    logger.exception(
+                        f"Offline write {row['offline_id']} ({row['kind']}) "
+                        f"failed")
+                await self.call(self._mark, row["offline_id"], status,
+                                result)
+        if applied:
+            logger.info(f"Replayed {applied} offline writes")
+        if len(rows) < OFFLINE_REPLAY_BATCH:
+            self.outage_since = None
+        return applied
+
+    async def stats(self, status: Optional[str], limit: int) -> dict:
+        if not self.enabled or not os.path.exists(self.path):
+            return {"enabled": self.enabled, "counts": {}, "writes": []}
+
+        def read(db):
+            counts = dict(
+                db.execute(
+                    "SELECT status, COUNT(*) FROM offline_writes GROUP BY status"
+                ).fetchall())
+            rows = db.execute(
+                f"SELECT {OFFLINE_WRITE_COLUMNS} FROM offline_writes WHERE (? IS NULL OR status = ?) ORDER BY seq DESC LIMIT ?",
+                (status, status, limit)).fetchall()
+            return counts, [_offline_row(r) for r in rows]
+
+        counts, writes = await self.call(read)
+        return {
+            "enabled": True,
+            "outage_since": self.outage_since,
+            "counts": counts,
+            "writes": writes,
+        }
+
+    async def get(self, offline_id: str) -> Optional[dict]:
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        row = await self.call(lambda db: db.execute(
+            f"SELECT {OFFLINE_WRITE_COLUMNS} FROM offline_writes WHERE offline_id = ?",
+            (offline_id, )).fetchone())
+        return _offline_row(row) if row else None
+
+
+offline_buffer = OfflineWriteBuffer(OFFLINE_BUFFER_PATH)
+
+
+async def buffer_sij_offline(req: SIJCreateRequest, user: dict,
+                             idempotency_key: Optional[str],
+                             error: Exception) -> tuple:
+    # Validated against the last known directory; replay re-checks it.
+    driver = driver_directory.get(req.driver_id)
+    if driver is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Database tidak tersedia dan driver tidak ada di cache")
+    if driver['status'] != 'active':
         raise HTTPException(status_code=400,
                             detail="Driver tidak ditemukan atau tidak aktif")
-    driver = dict(driver_row)
     now = datetime.now(JAKARTA_TZ)
+    tx = build_sij(req, user, driver, now)
+    return await offline_buffer.accept("sij",
+                                       req,
+                                       user,
+                                       idempotency_key,
+                                       error,
+                                       tx,
+                                       received_at=now,
+                                       date=tx["date"])
+
+
+async def offline_replay_loop():
+    while True:
+        try:
+            await offline_buffer.replay()
+        except Exception as e:
+            logger.warning(f"Offline write replay failed: {e}")
+        await asyncio.sleep(OFFLINE_REPLAY_INTERVAL)
+
+
+async def database_unavailable(request: Request, exc: Exception):
+    # Reads and non-buffered writes during an outage get a clean 503
+    # instead of a traceback.
+    logger.warning(f"{request.method} {request.url.path}: database "
+                   f"unavailable ({exc!r})")
+    return JSONResponse({"detail": "Database tidak tersedia"},
+                        status_code=503)
+
+
+for _error in DB_UNAVAILABLE_ERRORS:
+    app.add_exception_handler(_error, database_unavailable)
+
+
+@api_router.get("/offline-writes")
+async def list_offline_writes(status: Optional[str] = None,
+                              limit: int = Query(100, ge=1, le=1000),
+                              user: dict = Depends(require_admin)):
+    return await offline_buffer.stats(status, limit)
+
+
+@api_router.get("/offline-writes/{offline_id}")
+async def get_offline_write(offline_id: str,
+                            user: dict = Depends(require_admin)):
+    write = await offline_buffer.get(offline_id)
+    if write is None:
+        raise HTTPException(status_code=404,
+                            detail="Data offline tidak ditemukan")
+    return write
+
+
+# =================== COLD ARCHIVE ===================
+# Closed months older than ARCHIVE_HORIZON_MONTHS can be moved out of
+# Postgres into zstd-compressed Parquet files, one per table and month
+# (<ARCHIVE_DIR>/<table>/YYYY-MM.parquet), with `python -m backend.archive`.
+# Reads whose date range reaches an archived month (SIJ list, exports,
+# revenue report) scan the matching files with pyarrow and merge them with
+# the live rows; live rows win on a duplicate key. pyarrow is optional
+# (backend/requirements-optional.txt): it is only needed once something
+# has been archived.
+
+ARCHIVE_DIR = Path(
+    os.environ.get('ARCHIVE_DIR',
+                   str(Path(__file__).parent / "archive")))
+ARCHIVE_HORIZON_MONTHS = _env_int('ARCHIVE_HORIZON_MONTHS', 12)
+ARCHIVE_COLUMNS = {
+    "sij_transactions": {
+        "transaction_id": "string",
+        "driver_id": "string",
+        "driver_name": "string",
+        "category": "string",
+        "date": "string",
+        "time": "string",
+        "sheets": "int32",
+        "amount": "int64",
+        "qris_ref": "string",
+        "admin_id": "string",
+        "admin_name": "string",
+        "shift": "string",
+        "status": "string",
+        "created_at": "string",
+    },
+    "ritase": {
+        "id": "int64",
+        "driver_id": "string",
+        "driver_name": "string",
+        "date": "string",
+        "waktu_ritase": "string",
+        "notes": "string",
+        "admin_id": "string",
+        "admin_name": "string",
+        "shift": "string",
+        "created_at": "string",
+    },
+    "audit_log": {
+        "id": "int64",
+        "date": "string",
+        "driver_id": "string",
+        "has_sij": "bool_",
+        "has_trip": "bool_",
+        "mismatch": "bool_",
+    },
+}
+ARCHIVE_KEYS = {
+    "sij_transactions": ("transaction_id", ),
+    "ritase": ("id", ),
+    "audit_log": ("date", "driver_id"),
+}
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=503,
+            detail="Data arsip membutuhkan pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+class ColdArchive:
+    """Monthly Parquet files of rows moved out of Postgres."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def months(self, table: str) -> List[str]:
+        folder = self.root / table
+        if not folder.is_dir():
+            return []
+        return sorted(p.stem for p in folder.glob("*.parquet"))
+
+    def path(self, table: str, month: str) -> Path:
+        return self.root / table / f"{month}.parquet"
+
+    def covering(self, table: str, date_from: Optional[str],
+                 date_to: Optional[str]) -> List[Path]:
+        """Archive files that may hold rows in [date_from, date_to]."""
+        return [
+            self.path(table, m) for m in self.months(table)
+            if (not date_from or month_bounds(m)[1] > date_from) and (
+                not date_to or month_bounds(m)[0] <= date_to)
+        ]
+
+    def _read(self, paths: List[Path], columns, filters) -> List[dict]:
+        pa, pq = _load_pyarrow()
+        return pq.read_table([str(p) for p in paths],
+                             columns=columns,
+                             filters=filters or None).to_pylist()
+
+    async def scan(self,
+                   table: str,
+                   date_from: Optional[str] = None,
+                   date_to: Optional[str] = None,
+                   columns: Optional[List[str]] = None,
+                   search: Optional[str] = None,
+                   search_cols=(),
+                   **equals) -> List[dict]:
+        """Archived rows in the date range.
+
+        ``equals`` are column == value filters pushed down to the Parquet
+        reader; ``search`` is a case-insensitive substring over
+        ``search_cols``, like the ILIKE filters of the live queries.
+        """
+        paths = self.covering(table, date_from, date_to)
+        if not paths:
+            return []
+        filters = [(col, "==", val) for col, val in equals.items()
+                   if val is not None]
+        if date_from:
+            filters.append(("date", ">=", date_from))
+        if date_to:
+            filters.append(("date", "<=", date_to))
+        rows = await asyncio.to_thread(self._read, paths, columns, filters)
+        if search:
+            term = search.lower()
+            rows = [
+                r for r in rows
+                if any(term in (r.get(c) or "").lower() for c in search_cols)
+            ]
+        return rows
+
+    def write(self, table: str, month: str, rows: List[dict]) -> int:
+        pa, pq = _load_pyarrow()
+        path = self.path(table, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        schema = pa.schema([(col, getattr(pa, typ)())
+                            for col, typ in ARCHIVE_COLUMNS[table].items()])
+        if path.exists():
+            # Late rows for a month archived earlier are appended.
+            rows = merge_archived(rows,
+                                  pq.read_table(path).to_pylist(), table)
+        tmp = path.with_suffix(".parquet.tmp")
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema),
+                       tmp,
+                       compression="zstd")
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return len(rows)
+
+
+cold_archive = ColdArchive(ARCHIVE_DIR)
+
+
+def merge_archived(live: List[dict], archived: List[dict],
+                   table: str) -> List[dict]:
+    """Live rows plus archived rows whose key is not live."""
+    if not archived:
+        return live
+    key_cols = ARCHIVE_KEYS[table]
+    seen = {tuple(r[c] for c in key_cols) for r in live}
+    return live + [
+        r for r in archived if tuple(r[c] for c in key_cols) not in seen
+    ]
+
+
+def sort_rows(rows: List[dict], sort_by: str, descending: bool) -> List[dict]:
+    # NULLs last ascending and first descending, as Postgres orders them.
+    present = [r for r in rows if r.get(sort_by) is not None]
+    missing = [r for r in rows if r.get(sort_by) is None]
+    present.sort(key=lambda r: r[sort_by], reverse=descending)
+    return missing + present if descending else present + missing
+
+
+def archive_cutoff(today=None, horizon: int = ARCHIVE_HORIZON_MONTHS) -> str:
+    """First month that must stay live; older months may be archived."""
+    today = today or datetime.now(JAKARTA_TZ).date()
+    index = today.year * 12 + today.month - 1 - horizon
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+async def archive_month(db, table: str, month: str) -> int:
+    """Move one month of ``table`` to Parquet; returns the rows moved.
+
+    The file is written and renamed before the rows are deleted, inside the
+    caller's transaction: a crash in between leaves the month in both
+    places, which reads tolerate (live rows win), never in neither. The
+    month is locked against writes before it is read, so nothing can
+    commit into it between the SELECT and the DROP/DELETE.
+    """
+    start, end = month_bounds(month)
+    cols = list(ARCHIVE_COLUMNS[table])
+    partition = f"{table}_p{month.replace('-', '')}"
+    drop = table in PARTITIONED_TABLES and await db.fetchval(
+        "SELECT to_regclass($1)", partition)
+    if drop:
+        # Stray rows of the month may sit in the default partition.
+        await db.execute(
+            f"LOCK TABLE {partition}, {table}_default IN EXCLUSIVE MODE")
+    else:
+        await db.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+    rows = rows_to_list(await db.fetch(
+        f"SELECT {', '.join(cols)} FROM {table} WHERE date >= $1 AND date < $2",
+        start, end))
+    if not rows:
+        return 0
+    await asyncio.to_thread(cold_archive.write, table, month, rows)
+    if drop:
+        await db.execute(f"DROP TABLE {partition}")
+        await db.execute(
+            f"DELETE FROM {table}_default WHERE date >= $1 AND date < $2",
+            start, end)
+    else:
+        await db.execute(
+            f"DELETE FROM {table} WHERE date >= $1 AND date < $2", start,
+            end)
+    return len(rows)
+
+
+async def archive_closed_months(db,
+                                before: str,
+                                tables=tuple(ARCHIVE_COLUMNS)) -> dict:
+    """Archive every month older than ``before`` ('YYYY-MM')."""
+    moved = {}
+    for table in tables:
+        months = await db.fetch(
+            f"SELECT DISTINCT left(date, 7) AS month FROM {table} WHERE date < $1 ORDER BY 1",
+            f"{before}-01")
+        for r in months:
+            if _MONTH_RE.match(r['month'] or ""):
+                moved[f"{table}/{r['month']}"] = await archive_month(
+                    db, table, r['month'])
+    return moved
+
+
+@api_router.get("/archive")
+async def list_archive(user: dict = Depends(require_superadmin)):
+    return {
+        table: [{
+            "month": m,
+            "bytes": cold_archive.path(table, m).stat().st_size
+        } for m in cold_archive.months(table)]
+        for table in ARCHIVE_COLUMNS
+    }
+
+
+# =================== ANALYTICS REPLICA ===================
+# Optional (ANALYTICS_DUCKDB=":memory:" or a file path): each worker keeps
+# a DuckDB copy of sij_transactions, ritase, driver_absences and drivers,
+# and long-range reports run there with vectorized execution instead of on
+# the transactional Postgres. Row triggers log the key of every changed
+# row to analytics_changes; a refresh re-reads those keys in one
+# REPEATABLE READ snapshot and replaces them in DuckDB. The watermark is
+# the snapshot time of the last refresh, re-read with a small overlap so
+# a write that committed late is not missed. TRUNCATE, a watermark older
+# than the change retention, or an empty replica trigger a full reload.
+# Archived Parquet months are folded in by the sij_transactions/ritase
+# views. A full reload streams each table into a DuckDB staging table in
+# ANALYTICS_LOAD_BATCH rows at a time and swaps it in with the rest of the
+# refresh, so memory does not grow with the table. Needs duckdb and pyarrow
+# (backend/requirements-optional.txt).
+
+ANALYTICS_DUCKDB = os.environ.get('ANALYTICS_DUCKDB', '')
+ANALYTICS_REFRESH_INTERVAL = _env_float('ANALYTICS_REFRESH_INTERVAL', 30.0)
+ANALYTICS_MAX_LAG = _env_float('ANALYTICS_MAX_LAG', 120.0)
+ANALYTICS_CHANGE_RETENTION_HOURS = _env_int('ANALYTICS_CHANGE_RETENTION_HOURS',
+                                            24)
+ANALYTICS_OVERLAP = timedelta(minutes=5)
+ANALYTICS_LOAD_BATCH = 50000
+ANALYTICS_TABLES = {
+    "sij_transactions": ("transaction_id", ARCHIVE_COLUMNS["sij_transactions"]),
+    "ritase": ("id", ARCHIVE_COLUMNS["ritase"]),
+    "driver_absences": ("id", {
+        "id": "int64",
+        "driver_id": "string",
+        "date": "string",
+        "reason": "string",
+    }),
+    "drivers": ("driver_id", {
+        "driver_id": "string",
+        "name": "string",
+        "phone": "string",
+        "plate": "string",
+        "category": "string",
+        "status": "string",
+        "mismatch_count": "int64",
+        "total_sij_month": "int64",
+        "zone_id": "string",
+    }),
+}
+
+METRIC_HELP["raja_analytics_query_seconds"] = (
+    "histogram", "Report queries served by the DuckDB replica")
+METRIC_HELP["raja_analytics_refresh_seconds"] = (
+    "histogram", "Incremental refreshes of the DuckDB replica")
+
+register_query(
+    "analytics.changes",
+    """SELECT table_name, array_agg(DISTINCT row_key) AS row_keys
+    FROM analytics_changes WHERE changed_at >= $1 GROUP BY table_name""")
+register_query(
+    "analytics.purge",
+    "DELETE FROM analytics_changes WHERE changed_at < now() - make_interval(hours => $1)"
+)
+
+
+register_query(
+    "analytics.triggers",
+    "SELECT tgname FROM pg_trigger WHERE tgname = ANY($1::text[]) AND tgparentid = 0"
+)
+ANALYTICS_TRIGGERS = [
+    name for table in ANALYTICS_TABLES
+    for name in (f"{table}_analytics", f"{table}_analytics_truncate")
+]
+
+
+async def create_analytics_capture(db):
+    """Change-log table and function behind the analytics replica.
+
+    The triggers are installed when this worker runs with ANALYTICS_DUCKDB
+    set and are never removed implicitly: another worker may still depend
+    on them. Deployments that drop the replica remove them with
+    ``python -m backend.analytics --drop-triggers``.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_changes (
+            seq BIGSERIAL PRIMARY KEY,
+            table_name VARCHAR(30) NOT NULL,
+            row_key TEXT NOT NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analytics_changes_at ON analytics_changes (changed_at)"
+    )
+    # Identifies this database, so a replica file never resumes against a
+    # restored or recreated one.
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS analytics_epoch (epoch UUID NOT NULL DEFAULT gen_random_uuid())"
+    )
+    await db.execute(
+        "INSERT INTO analytics_epoch SELECT WHERE NOT EXISTS (SELECT 1 FROM analytics_epoch)"
+    )
+    await db.execute("""
+        CREATE OR REPLACE FUNCTION raja_analytics_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                INSERT INTO analytics_changes (table_name, row_key) VALUES (TG_ARGV[0], '*');
+                RETURN NULL;
+            END IF;
+            IF TG_OP <> 'INSERT' THEN
+                INSERT INTO analytics_changes (table_name, row_key)
+                VALUES (TG_ARGV[0], to_jsonb(OLD) ->> TG_ARGV[1]);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO analytics_changes (table_name, row_key)
+                VALUES (TG_ARGV[0], to_jsonb(NEW) ->> TG_ARGV[1]);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    if ANALYTICS_DUCKDB:
+        await install_analytics_triggers(db)
+
+
+async def install_analytics_triggers(db):
+    for table, (key, _) in ANALYTICS_TABLES.items():
+        await db.execute(f"""
+            CREATE OR REPLACE TRIGGER {table}_analytics AFTER INSERT OR UPDATE OR DELETE
+            ON {table} FOR EACH ROW EXECUTE FUNCTION raja_analytics_change('{table}', '{key}')
+        """)
+        await db.execute(f"""
+            CREATE OR REPLACE TRIGGER {table}_analytics_truncate AFTER TRUNCATE
+            ON {table} FOR EACH STATEMENT EXECUTE FUNCTION raja_analytics_change('{table}', '{key}')
+        """)
+
+
+async def drop_analytics_triggers(db):
+    for table in ANALYTICS_TABLES:
+        await db.execute(
+            f"DROP TRIGGER IF EXISTS {table}_analytics ON {table}")
+        await db.execute(
+            f"DROP TRIGGER IF EXISTS {table}_analytics_truncate ON {table}")
+    await db.execute("TRUNCATE analytics_changes")
+
+
+class AnalyticsReplica:
+    """DuckDB copy of the reporting tables with a pool-like fetch API."""
+
+    def __init__(self, path: str):
+        import duckdb
+        import pyarrow
+        self.pa = pyarrow
+        try:
+            self.con = duckdb.connect(path)
+        except duckdb.IOException as e:
+            # Another worker holds the file; keep a private copy instead.
+            logger.warning(f"Analytics file {path} busy ({e}); using memory")
+            self.con = duckdb.connect(":memory:")
+        self.path = path
+        self.write_lock = threading.Lock()
+        self.refreshed_at = None
+        self.last_refresh = {}
+        self.archive_months = None
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS _meta (key VARCHAR PRIMARY KEY, value VARCHAR)"
+        )
+        for table, (_, columns) in ANALYTICS_TABLES.items():
+            empty = self.pa.Table.from_pylist([], schema=self.schema(table))
+            self.con.register("_empty", empty)
+            self.con.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.live_table(table)} AS SELECT * FROM _empty"
+            )
+            self.con.unregister("_empty")
+        self.build_views()
+
+    def schema(self, table: str):
+        return self.pa.schema([
+            (col, getattr(self.pa, typ)())
+            for col, typ in ANALYTICS_TABLES[table][1].items()
+        ])
+
+    @staticmethod
+    def live_table(table: str) -> str:
+        return f"{table}_live" if table in ARCHIVE_COLUMNS else table
+
+    @staticmethod
+    def stage_table(table: str) -> str:
+        return f"_stage_{table}"
+
+    def meta(self, key: str) -> Optional[str]:
+        cur = self.con.cursor()
+        try:
+            row = cur.execute("SELECT value FROM _meta WHERE key = ?",
+                              [key]).fetchone()
+        finally:
+            cur.close()
+        return row[0] if row else None
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        value = self.meta("watermark")
+        return datetime.fromisoformat(value) if value else None
+
+    @property
+    def fresh(self) -> bool:
+        return (self.refreshed_at is not None and
+                time.monotonic() - self.refreshed_at < ANALYTICS_MAX_LAG)
+
+    def invalidate(self):
+        """Forget the watermark so the next refresh reloads everything."""
+        with self.write_lock:
+            cur = self.con.cursor()
+            try:
+                cur.execute("DELETE FROM _meta WHERE key = 'watermark'")
+            finally:
+                cur.close()
+        self.refreshed_at = None
+
+    def build_views(self):
+        """(Re)point the report views at live rows plus archived months."""
+        months = {t: cold_archive.months(t) for t in ("sij_transactions",
+                                                     "ritase")}
+        if months == self.archive_months:
+            return
+        for table, table_months in months.items():
+            key = ANALYTICS_TABLES[table][0]
+            cols = ", ".join(ANALYTICS_TABLES[table][1])
+            sql = f"SELECT {cols} FROM {table}_live"
+            if table_months:
+                files = ", ".join(f"'{cold_archive.path(table, m)}'"
+                                  for m in table_months)
+                sql += (f" UNION ALL SELECT {cols} FROM read_parquet([{files}])"
+                        f" WHERE {key} NOT IN (SELECT {key} FROM {table}_live)")
+            self.con.execute(f"CREATE OR REPLACE VIEW {table} AS {sql}")
+        self.archive_months = months
+
+    def stage(self, table: str, rows: Optional[List[dict]]):
+        """Start a full reload of ``table`` (``rows`` None) or add a batch."""
+        with self.write_lock:
+            cur = self.con.cursor()
+            try:
+                if rows is None:
+                    cur.execute(
+                        f"CREATE OR REPLACE TABLE {self.stage_table(table)} AS "
+                        f"SELECT * FROM {self.live_table(table)} LIMIT 0")
+                else:
+                    self._insert(cur, table, rows, self.stage_table(table))
+            finally:
+                cur.close()
+
+    def drop_stages(self, tables):
+        with self.write_lock:
+            cur = self.con.cursor()
+            try:
+                for table in tables:
+                    cur.execute(
+                        f"DROP TABLE IF EXISTS {self.stage_table(table)}")
+            finally:
+                cur.close()
+
+    def apply(self, epoch: str, snapshot: datetime, reloads: List[str],
+              changes: dict):
+        """Swap in the staged tables (``reloads``) and replace changed keys."""
+        with self.write_lock:
+            cur = self.con.cursor()
+            cur.execute("BEGIN")
+            try:
+                for table in reloads:
+                    live = self.live_table(table)
+                    stage = self.stage_table(table)
+                    cur.execute(f"DELETE FROM {live}")
+                    cur.execute(f"INSERT INTO {live} SELECT * FROM {stage}")
+                    cur.execute(f"DROP TABLE {stage}")
+                for table, (keys, rows) in changes.items():
+                    key = ANALYTICS_TABLES[table][0]
+                    key_schema = self.pa.schema([self.schema(table).field(key)])
+                    cur.register("_keys",
+                                 self.pa.table({key: keys}, schema=key_schema))
+                    cur.execute(
+                        f"DELETE FROM {self.live_table(table)} WHERE {key} IN (SELECT {key} FROM _keys)"
+                    )
+                    cur.unregister("_keys")
+                    self._insert(cur, table, rows)
+                cur.executemany("INSERT OR REPLACE INTO _meta VALUES (?, ?)",
+                                [["watermark", snapshot.isoformat()],
+                                 ["epoch", epoch]])
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+            self.build_views()
+
+    def _insert(self, cur, table: str, rows: List[dict],
+                target: Optional[str] = None):
+        if not rows:
+            return
+        cur.register("_rows",
+                     self.pa.Table.from_pylist(rows, schema=self.schema(table)))
+        cur.execute(
+            f"INSERT INTO {target or self.live_table(table)} SELECT * FROM _rows"
+        )
+        cur.unregister("_rows")
 
-    PRICE_MAP = {"standar": 40000, "premium": 60000}
+    def _query(self, sql: str, args) -> List[dict]:
+        cur = self.con.cursor()
+        try:
+            result = cur.execute(sql, list(args))
+            cols = [d[0] for d in result.description]
+            return [dict(zip(cols, row)) for row in result.fetchall()]
+        finally:
+            cur.close()
+
+    async def fetch(self, sql: str, *args) -> List[dict]:
+        started = time.perf_counter()
+        rows = await asyncio.to_thread(self._query, sql, args)
+        metrics.observe("raja_analytics_query_seconds",
+                        (time.perf_counter() - started) * 1000)
+        return rows
+
+    async def fetchrow(self, sql: str, *args) -> Optional[dict]:
+        rows = await self.fetch(sql, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, sql: str, *args):
+        row = await self.fetchrow(sql, *args)
+        return next(iter(row.values())) if row else None
+
+    def counts(self) -> dict:
+        cur = self.con.cursor()
+        try:
+            return {
+                table: cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+                [0]
+                for table in ANALYTICS_TABLES
+            }
+        finally:
+            cur.close()
+
+    async def refresh(self):
+        """Pull everything changed since the watermark from Postgres."""
+        started = time.perf_counter()
+        watermark, our_epoch = await asyncio.to_thread(
+            lambda: (self.watermark, self.meta("epoch")))
+        reloads, changes = [], {}
+        try:
+            snapshot, epoch = await self._read_changes(watermark, our_epoch,
+                                                       reloads, changes)
+            await asyncio.to_thread(self.apply, epoch, snapshot, reloads,
+                                    changes)
+        except BaseException:
+            if reloads:
+                await asyncio.to_thread(self.drop_stages, reloads)
+            raise
+        self.refreshed_at = time.monotonic()
+        self.last_refresh = {
+            "at": snapshot.isoformat(),
+            "seconds": round(time.perf_counter() - started, 3),
+            "reloaded": reloads,
+            "changed": {t: len(k) for t, (k, _) in changes.items()},
+        }
+        metrics.observe("raja_analytics_refresh_seconds",
+                        (time.perf_counter() - started) * 1000)
+
+    async def _read_changes(self, watermark: Optional[datetime],
+                            our_epoch: Optional[str], reloads: List[str],
+                            changes: dict) -> tuple:
+        """Stage full reloads and collect changed rows in one snapshot.
+
+        Returns (snapshot time, epoch); fills ``reloads`` with the staged
+        tables and ``changes`` with table -> (keys, rows).
+        """
+        retention = timedelta(hours=ANALYTICS_CHANGE_RETENTION_HOURS)
+        db = report_pool or pool
+        async with db.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read',
+                                        readonly=True):
+                installed = {
+                    r['tgname']
+                    for r in await conn.fetch(QUERIES["analytics.triggers"],
+                                              ANALYTICS_TRIGGERS)
+                }
+                missing = [t for t in ANALYTICS_TRIGGERS if t not in installed]
+                if missing:
+                    # Writes are not being captured: stop serving reports
+                    # and reload in full once the triggers are back.
+                    await asyncio.to_thread(self.invalidate)
+                    raise RuntimeError(
+                        f"change triggers missing: {', '.join(missing)}")
+                snapshot = await conn.fetchval("SELECT now()")
+                epoch = str(await conn.fetchval(
+                    "SELECT epoch FROM analytics_epoch"))
+                if (watermark is None or epoch != our_epoch or
+                        snapshot - watermark > retention - ANALYTICS_OVERLAP):
+                    changed = {t: ["*"] for t in ANALYTICS_TABLES}
+                else:
+                    changed = {
+                        r['table_name']: r['row_keys']
+                        for r in await conn.fetch(
+                            QUERIES["analytics.changes"],
+                            watermark - ANALYTICS_OVERLAP)
+                    }
+                for table, keys in changed.items():
+                    if table not in ANALYTICS_TABLES:
+                        continue
+                    key, columns = ANALYTICS_TABLES[table]
+                    select = f"SELECT {', '.join(columns)} FROM {table}"
+                    if "*" in keys:
+                        reloads.append(table)
+                        await asyncio.to_thread(self.stage, table, None)
+                        async for batch in self._batches(conn, select):
+                            await asyncio.to_thread(self.stage, table, batch)
+                        continue
+                    if columns[key] == "int64":
+                        keys = [int(k) for k in keys]
+                        cast = "bigint[]"
+                    else:
+                        cast = "text[]"
+                    rows = await conn.fetch(
+                        f"{select} WHERE {key} = ANY($1::{cast})", keys)
+                    changes[table] = (keys, rows_to_list(rows))
+        return snapshot, epoch
+
+    async def _batches(self, conn, sql: str):
+        batch = []
+        async for row in conn.cursor(sql, prefetch=ANALYTICS_LOAD_BATCH):
+            batch.append(dict(row))
+            if len(batch) >= ANALYTICS_LOAD_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.con.close()
+
+
+analytics: Optional[AnalyticsReplica] = None
+
+
+def analytics_pool(user: Optional[dict] = None):
+    """The DuckDB replica when it is fresh, else None (use Postgres).
+
+    Users who just wrote stay on Postgres for READ_YOUR_WRITES_WINDOW, as
+    with the read replica.
+    """
+    if analytics is None or not analytics.fresh or wrote_recently(user):
+        return None
+    return analytics
+
+
+def spans_months(date_from: Optional[str], date_to: Optional[str]) -> bool:
+    return not date_from or not date_to or date_from[:7] != date_to[:7]
+
+
+async def analytics_refresh_loop():
+    global analytics
+    while True:
+        try:
+            if analytics is None:
+                analytics = await asyncio.to_thread(AnalyticsReplica,
+                                                    ANALYTICS_DUCKDB)
+            await analytics.refresh()
+            await pool.execute(QUERIES["analytics.purge"],
+                               ANALYTICS_CHANGE_RETENTION_HOURS)
+        except Exception as e:
+            logger.warning(f"Analytics refresh failed: {e}")
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+
+@api_router.get("/_internal/analytics")
+async def analytics_status(user: dict = Depends(require_superadmin)):
+    if analytics is None:
+        return {"enabled": bool(ANALYTICS_DUCKDB), "ready": False}
+    return {
+        "enabled": True,
+        "ready": analytics.fresh,
+        "path": analytics.path,
+        "watermark": (await asyncio.to_thread(
+            lambda: analytics.watermark)).isoformat()
+        if analytics.refreshed_at else None,
+        "last_refresh": analytics.last_refresh,
+        "rows": await asyncio.to_thread(analytics.counts),
+    }
+
+
+# =================== SIJ TRANSACTIONS ===================
+# Transaction ids are <driver_id><YYYYMMDD><3 digits>, the date being the
+# SIJ's date. sij_transactions is keyed (transaction_id, date) because
+# the partition key must be in the primary key; since the id carries its
+# date, that key still keeps ids unique, and lookups by id derive the date
+# so they prune to one partition.
+
+_SIJ_ID_DATE = re.compile(r"(\d{4})(\d{2})(\d{2})\d{3}$")
+
+
+def sij_id_date(transaction_id: str) -> Optional[str]:
+    """The 'YYYY-MM-DD' date embedded in a transaction id, if any."""
+    m = _SIJ_ID_DATE.search(transaction_id)
+    if not m:
+        return None
+    try:
+        return datetime(*map(int, m.groups())).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+async def fetch_sij(transaction_id: str):
+    """One SIJ row by id, probing only its date's partition first.
+
+    Falls back to a lookup across partitions for ids that do not carry
+    their date (older formats, or a date changed after issue).
+    """
+    date = sij_id_date(transaction_id)
+    if date:
+        row = await pool.fetchrow(QUERIES["sij.by_id_date"], transaction_id,
+                                  date)
+        if row:
+            return row
+    return await pool.fetchrow(QUERIES["sij.by_id"], transaction_id)
+
+
+def build_sij(req: SIJCreateRequest,
+              user: dict,
+              driver: dict,
+              now: datetime,
+              transaction_id: Optional[str] = None) -> dict:
+    """Validate the request and lay out the SIJ row issued at ``now``."""
     category = driver.get("category", "standar")
     amount = PRICE_MAP.get(category, 40000)
 
@@ -434,57 +3434,93 @@ async def create_sij(req: SIJCreateRequest,
         date_str = now.strftime("%Y%m%d")
         date_iso = now.strftime("%Y-%m-%d")
 
-    time_str = now.strftime("%H:%M:%S")
-    existing = await pool.fetchrow(
-        "SELECT transaction_id FROM sij_transactions WHERE driver_id = $1 AND date = $2 AND status = 'active'",
-        req.driver_id, date_iso)
-    if existing:
-        raise HTTPException(
-            status_code=400,
-            detail=
-            f"Driver {driver['name']} sudah memiliki SIJ aktif untuk tanggal {date_iso}"
-        )
-
-    random_suffix = str(random.randint(100, 999))
-    transaction_id = f"{req.driver_id}{date_str}{random_suffix}"
-    created_at = now.isoformat()
-
-    await pool.execute(
-        """INSERT INTO sij_transactions (transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)""",
-        transaction_id, req.driver_id, driver['name'], category, date_iso,
-        time_str, req.sheets, amount, req.qris_ref, user['user_id'],
-        user['name'], detect_shift(), "active", created_at)
-    await pool.execute(
-        "UPDATE drivers SET total_sij_month = total_sij_month + 1 WHERE driver_id = $1",
-        req.driver_id)
-    await pool.execute(
-        """INSERT INTO audit_log (date, driver_id, has_sij, has_trip, mismatch)
-        VALUES ($1, $2, true, false, false)
-        ON CONFLICT (date, driver_id) DO UPDATE SET has_sij = true""",
-        date_iso, req.driver_id)
+    if transaction_id is None:
+        random_suffix = str(random.randint(100, 999))
+        transaction_id = f"{req.driver_id}{date_str}{random_suffix}"
     return {
         "transaction_id": transaction_id,
         "driver_id": req.driver_id,
         "driver_name": driver['name'],
         "category": category,
         "date": date_iso,
-        "time": time_str,
+        "time": now.strftime("%H:%M:%S"),
         "sheets": req.sheets,
         "amount": amount,
         "qris_ref": req.qris_ref,
         "admin_id": user['user_id'],
         "admin_name": user['name'],
-        "shift": detect_shift(),
+        "shift": detect_shift(now),
         "status": "active",
-        "created_at": created_at,
+        "created_at": now.isoformat(),
     }
 
 
-SIJ_SORT_COLS = {
-    "transaction_id", "driver_name", "driver_id", "date", "time", "admin_name",
-    "shift", "amount", "sheets", "status", "created_at"
-}
+async def insert_sij(conn,
+                     req: SIJCreateRequest,
+                     user: dict,
+                     now: Optional[datetime] = None,
+                     transaction_id: Optional[str] = None) -> dict:
+    driver = await lookup_driver(req.driver_id)
+    if not driver or driver['status'] != 'active':
+        raise HTTPException(status_code=400,
+                            detail="Driver tidak ditemukan atau tidak aktif")
+    tx = build_sij(req, user, driver, now or datetime.now(JAKARTA_TZ),
+                   transaction_id)
+    existing = await conn.fetchrow(QUERIES["sij.active_for_driver_date"],
+                                   req.driver_id, tx['date'])
+    if existing:
+        raise HTTPException(
+            status_code=400,
+            detail=
+            f"Driver {driver['name']} sudah memiliki SIJ aktif untuk tanggal {tx['date']}"
+        )
+    await conn.execute(QUERIES["sij.insert"], tx['transaction_id'],
+                       tx['driver_id'], tx['driver_name'], tx['category'],
+                       tx['date'], tx['time'], tx['sheets'], tx['amount'],
+                       tx['qris_ref'], tx['admin_id'], tx['admin_name'],
+                       tx['shift'], tx['status'], tx['created_at'])
+    await conn.execute(QUERIES["drivers.inc_sij_month"], req.driver_id)
+    await conn.execute(QUERIES["audit.mark_sij"], tx['date'], req.driver_id)
+    return tx
+
+
+async def publish_sij_created(transaction: dict, user: dict):
+    metrics.inc("raja_sij_issued_total",
+                shift=transaction["shift"],
+                category=transaction["category"])
+    await event_bus.publish("sij",
+                            dict(op="create", transaction=transaction),
+                            actor=user['user_id'])
+
+
+@api_router.post("/sij")
+async def create_sij(req: SIJCreateRequest,
+                     user: dict = Depends(require_admin),
+                     idempotency_key: Optional[str] = Header(
+                         None, alias="Idempotency-Key")):
+    printer = resolve_printer(req.printer_ip,
+                              req.printer_port) if req.printer_ip else None
+    try:
+        transaction, replayed = await run_counter_write(
+            "sij.create", req, user, idempotency_key,
+            lambda conn: insert_sij(conn, req, user))
+    except DB_UNAVAILABLE_ERRORS as e:
+        transaction, created = await buffer_sij_offline(
+            req, user, idempotency_key, e)
+        if printer and created:
+            await print_spooler.submit(printer,
+                                       render_sij_receipt(transaction),
+                                       transaction["transaction_id"])
+        return JSONResponse(transaction, status_code=202)
+    if replayed:
+        return idempotent_replay(transaction)
+    await publish_sij_created(transaction, user)
+    if printer:
+        job = await print_spooler.submit(printer,
+                                         render_sij_receipt(transaction),
+                                         transaction["transaction_id"])
+        return {**transaction, "print_job": job.to_dict()}
+    return transaction
 
 
 @api_router.get("/sij")
@@ -497,40 +3533,62 @@ async def get_sij_transactions(date: Optional[str] = None,
                                sort_by: str = "created_at",
                                sort_dir: str = "desc",
                                user: dict = Depends(get_current_user)):
-    conditions = []
-    params = []
-    idx = 1
-    if not include_void:
-        conditions.append("status = 'active'")
-    if date:
-        conditions.append(f"date = ${idx}")
-        params.append(date)
-        idx += 1
-    if date_from:
-        conditions.append(f"date >= ${idx}")
-        params.append(date_from)
-        idx += 1
-    if date_to:
-        conditions.append(f"date <= ${idx}")
-        params.append(date_to)
-        idx += 1
-    if shift:
-        conditions.append(f"shift = ${idx}")
-        params.append(shift)
-        idx += 1
-    if search:
-        conditions.append(
-            f"(driver_name ILIKE ${idx} OR driver_id ILIKE ${idx} OR transaction_id ILIKE ${idx})"
-        )
-        params.append(f"%{search}%")
-        idx += 1
-    where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    col = sort_by if sort_by in SIJ_SORT_COLS else "created_at"
-    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
-    rows = await pool.fetch(
-        f"SELECT transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at FROM sij_transactions {where} ORDER BY {col} {direction}",
-        *params)
-    return rows_to_list(rows)
+    sql, args = sorted_filtered_query("sij.list",
+                                      sort_by,
+                                      sort_dir,
+                                      "created_at",
+                                      active_only=not include_void,
+                                      date=date or None,
+                                      date_from=date_from or None,
+                                      date_to=date_to or None,
+                                      shift=shift or None,
+                                      search=like_pattern(search))
+    rows = rows_to_list(await pool.fetch(sql, *args))
+    # Only an explicit lower bound reaches into the archive; the default
+    # (unbounded) listing stays on live rows instead of reading every file.
+    lower = date or date_from
+    archived = await cold_archive.scan(
+        "sij_transactions",
+        lower,
+        date or date_to,
+        search=search,
+        search_cols=("driver_name", "driver_id", "transaction_id"),
+        status=None if include_void else "active",
+        shift=shift or None) if lower else []
+    if archived:
+        rows = sort_rows(
+            merge_archived(rows, archived, "sij_transactions"),
+            sort_by if sort_by in SIJ_SORT_COLS else "created_at",
+            sort_dir.lower() == "desc")
+    return rows
+
+
+SIJ_EXPORT_COLUMNS = [
+    "transaction_id", "driver_id", "driver_name", "category", "date", "time",
+    "sheets", "amount", "qris_ref", "admin_name", "shift", "status"
+]
+
+
+def export_pool(user: dict, date_from: Optional[str],
+                date_to: Optional[str]):
+    """Multi-month exports go to the analytics replica when it is up."""
+    if spans_months(date_from, date_to):
+        return analytics_pool(user) or reporting_pool(user)
+    return reporting_pool(user)
+
+
+async def with_archived_sij(data: List[dict], date_from: Optional[str],
+                            date_to: Optional[str]) -> List[dict]:
+    archived = await cold_archive.scan("sij_transactions",
+                                       date_from,
+                                       date_to,
+                                       columns=SIJ_EXPORT_COLUMNS,
+                                       status="active")
+    if not archived:
+        return data
+    data = merge_archived(data, archived, "sij_transactions")
+    data.sort(key=lambda d: (d["date"], d["time"] or ""), reverse=True)
+    return data
 
 
 @api_router.get("/sij/export/csv")
@@ -549,10 +3607,13 @@ async def export_sij_csv(date_from: Optional[str] = None,
         params.append(date_to)
         idx += 1
     where = "WHERE " + " AND ".join(conditions)
-    rows = await pool.fetch(
+    db = export_pool(user, date_from, date_to)
+    rows = await db.fetch(
         f"SELECT transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_name, shift, status FROM sij_transactions {where} ORDER BY date DESC, time DESC",
         *params)
     data = rows_to_list(rows)
+    if db is not analytics:
+        data = await with_archived_sij(data, date_from, date_to)
     output = io.StringIO()
     fields = [
         "transaction_id", "driver_id", "driver_name", "category", "date",
@@ -585,10 +3646,13 @@ async def export_sij_pdf(date_from: Optional[str] = None,
         params.append(date_to)
         idx += 1
     where = "WHERE " + " AND ".join(conditions)
-    rows = await pool.fetch(
+    db = export_pool(user, date_from, date_to)
+    rows = await db.fetch(
         f"SELECT transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_name, shift FROM sij_transactions {where} ORDER BY date DESC, time DESC",
         *params)
     data = rows_to_list(rows)
+    if db is not analytics:
+        data = await with_archived_sij(data, date_from, date_to)
     total_amount = sum(d['amount'] for d in data)
     total_sheets = sum(d['sheets'] for d in data)
     buf = io.BytesIO()
@@ -664,7 +3728,7 @@ async def export_sij_pdf(date_from: Optional[str] = None,
 async def export_revenue_csv(period: str = "monthly",
                              date: Optional[str] = None,
                              user: dict = Depends(get_current_user)):
-    rows, meta = await _revenue_report_data(period, date)
+    rows, meta = await _revenue_report_data(period, date, user)
     output = io.StringIO()
     fields = [
         "period_label", "qty_standar", "revenue_standar", "qty_premium",
@@ -702,7 +3766,7 @@ async def export_revenue_csv(period: str = "monthly",
 async def export_revenue_pdf(period: str = "monthly",
                              date: Optional[str] = None,
                              user: dict = Depends(get_current_user)):
-    rows, meta = await _revenue_report_data(period, date)
+    rows, meta = await _revenue_report_data(period, date, user)
     buf = io.BytesIO()
     doc = SimpleDocTemplate(buf,
                             pagesize=landscape(A4),
@@ -781,13 +3845,48 @@ async def export_revenue_pdf(period: str = "monthly",
         headers={"Content-Disposition": f"attachment; filename={fname}"})
 
 
-async def _revenue_report_data(period: str, date: Optional[str]):
+def merge_archived_revenue(rows, archived: List[dict],
+                           period: str) -> List[dict]:
+    """Fold archived SIJ rows into the per-hour or per-day revenue rows."""
+    totals = {r["period_label"]: dict(r) for r in rows}
+    for tx in archived:
+        label = f"{tx['time'][:2]}:00" if period == "daily" else tx["date"]
+        row = totals.setdefault(
+            label, {
+                "period_label": label,
+                "qty_standar": 0,
+                "revenue_standar": 0,
+                "qty_premium": 0,
+                "revenue_premium": 0,
+            })
+        if tx["category"] in ("standar", "premium"):
+            row[f"qty_{tx['category']}"] += 1
+            row[f"revenue_{tx['category']}"] += tx["amount"] or 0
+    return [totals[label] for label in sorted(totals)]
+
+
+async def _revenue_report_data(period: str,
+                               date: Optional[str],
+                               user: Optional[dict] = None):
     now = datetime.now(JAKARTA_TZ)
     target = datetime.strptime(date, "%Y-%m-%d") if date else now
-
     if period == "daily":
         date_from = date_to = target.strftime("%Y-%m-%d")
-        rows = await pool.fetch(
+    elif period == "weekly":
+        monday = target - timedelta(days=target.weekday())
+        date_from = monday.strftime("%Y-%m-%d")
+        date_to = (monday + timedelta(days=6)).strftime("%Y-%m-%d")
+    else:
+        date_from = target.strftime("%Y-%m-01")
+        last_day = (target.replace(day=28) +
+                    timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        date_to = last_day.strftime("%Y-%m-%d")
+    # Within one month the partition-pruned Postgres query is cheap; only
+    # ranges across months go to the analytics replica, as with exports.
+    db = export_pool(user, date_from, date_to)
+
+    if period == "daily":
+        rows = await db.fetch(
             """SELECT LPAD(EXTRACT(HOUR FROM time::time)::int::text, 2, '0') || ':00' AS period_label,
                       COUNT(*) FILTER (WHERE category='standar') AS qty_standar,
                       COALESCE(SUM(amount) FILTER (WHERE category='standar'), 0) AS revenue_standar,
@@ -798,11 +3897,7 @@ async def _revenue_report_data(period: str, date: Optional[str]):
                GROUP BY EXTRACT(HOUR FROM time::time)
                ORDER BY EXTRACT(HOUR FROM time::time)""", date_from)
     elif period == "weekly":
-        monday = target - timedelta(days=target.weekday())
-        sunday = monday + timedelta(days=6)
-        date_from = monday.strftime("%Y-%m-%d")
-        date_to = sunday.strftime("%Y-%m-%d")
-        rows = await pool.fetch(
+        rows = await db.fetch(
             """SELECT date::text AS period_label,
                       COUNT(*) FILTER (WHERE category='standar') AS qty_standar,
                       COALESCE(SUM(amount) FILTER (WHERE category='standar'), 0) AS revenue_standar,
@@ -811,13 +3906,9 @@ async def _revenue_report_data(period: str, date: Optional[str]):
                FROM sij_transactions
                WHERE date >= $1 AND date <= $2 AND status = 'active'
                GROUP BY date
-               ORDER BY date""", date_from, date_to)
-    else:
-        date_from = target.strftime("%Y-%m-01")
-        last_day = (target.replace(day=28) +
-                    timedelta(days=4)).replace(day=1) - timedelta(days=1)
-        date_to = last_day.strftime("%Y-%m-%d")
-        rows = await pool.fetch(
+               ORDER BY date""", date_from, date_to)
+    else:
+        rows = await db.fetch(
             """SELECT date::text AS period_label,
                       COUNT(*) FILTER (WHERE category='standar') AS qty_standar,
                       COALESCE(SUM(amount) FILTER (WHERE category='standar'), 0) AS revenue_standar,
@@ -828,6 +3919,22 @@ async def _revenue_report_data(period: str, date: Optional[str]):
                GROUP BY date
                ORDER BY date""", date_from, date_to)
 
+    # The analytics views already include archived months.
+    archived = [] if db is analytics else await cold_archive.scan(
+        "sij_transactions",
+        date_from,
+        date_to,
+        columns=["transaction_id", "date", "time", "category", "amount"],
+        status="active")
+    if archived:
+        # A month caught between archive and delete is in both places.
+        live = await db.fetch(
+            "SELECT transaction_id FROM sij_transactions WHERE date >= $1 AND date <= $2",
+            date_from, date_to)
+        archived = merge_archived([dict(r) for r in live], archived,
+                                  "sij_transactions")[len(live):]
+        rows = merge_archived_revenue(rows, archived, period)
+
     result = []
     for r in rows:
         rv_s = int(r["revenue_standar"])
@@ -848,15 +3955,13 @@ async def _revenue_report_data(period: str, date: Optional[str]):
 async def get_revenue_report(period: str = "monthly",
                              date: Optional[str] = None,
                              user: dict = Depends(get_current_user)):
-    rows, meta = await _revenue_report_data(period, date)
+    rows, meta = await _revenue_report_data(period, date, user)
     return {"rows": rows, "meta": meta}
 
 
 @api_router.patch("/sij/{transaction_id}/void")
 async def void_sij(transaction_id: str, user: dict = Depends(require_admin)):
-    tx = await pool.fetchrow(
-        "SELECT * FROM sij_transactions WHERE transaction_id = $1",
-        transaction_id)
+    tx = await fetch_sij(transaction_id)
     if not tx:
         raise HTTPException(status_code=404,
                             detail="Transaksi tidak ditemukan")
@@ -872,9 +3977,15 @@ async def void_sij(transaction_id: str, user: dict = Depends(require_admin)):
                 detail="Tidak dapat void transaksi lebih dari 24 jam")
     except ValueError:
         pass
-    await pool.execute(
-        "UPDATE sij_transactions SET status = 'void' WHERE transaction_id = $1",
-        transaction_id)
+    await pool.execute(QUERIES["sij.void"], transaction_id, tx_dict['date'])
+    metrics.inc("raja_sij_voided_total",
+                shift=tx_dict.get('shift') or "",
+                category=tx_dict.get('category') or "")
+    await event_bus.publish("sij",
+                            dict(op="void",
+                                 before=dict(tx),
+                                 transaction=dict(tx_dict, status='void')),
+                            actor=user['user_id'])
     return {"message": "Transaksi di-void"}
 
 
@@ -882,17 +3993,13 @@ async def void_sij(transaction_id: str, user: dict = Depends(require_admin)):
 async def update_sij(transaction_id: str,
                      data: SIJUpdateRequest,
                      user: dict = Depends(require_superadmin)):
-    existing = await pool.fetchrow(
-        "SELECT * FROM sij_transactions WHERE transaction_id = $1",
-        transaction_id)
+    existing = await fetch_sij(transaction_id)
     if not existing:
         raise HTTPException(status_code=404,
                             detail="Transaksi tidak ditemukan")
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if 'driver_id' in update_data:
-        driver_row = await pool.fetchrow(
-            "SELECT name, category FROM drivers WHERE driver_id = $1",
-            update_data['driver_id'])
+        driver_row = await lookup_driver(update_data['driver_id'])
         if not driver_row:
             raise HTTPException(status_code=400,
                                 detail="Driver tidak ditemukan")
@@ -906,33 +4013,371 @@ async def update_sij(transaction_id: str,
             sets.append(f"{k} = ${idx}")
             params.append(v)
             idx += 1
-        params.append(transaction_id)
+        params += [transaction_id, existing['date']]
         await pool.execute(
-            f"UPDATE sij_transactions SET {', '.join(sets)} WHERE transaction_id = ${idx}",
+            f"UPDATE sij_transactions SET {', '.join(sets)} WHERE transaction_id = ${idx} AND date = ${idx + 1}",
             *params)
+        await event_bus.publish("sij",
+                                dict(op="update",
+                                     before=dict(existing),
+                                     transaction={
+                                         **dict(existing),
+                                         **update_data
+                                     }),
+                                actor=user['user_id'])
     return {"message": "Transaksi SIJ diperbarui"}
 
 
 @api_router.delete("/sij/{transaction_id}")
 async def delete_sij(transaction_id: str,
                      user: dict = Depends(require_superadmin)):
-    existing = await pool.fetchrow(
-        "SELECT transaction_id FROM sij_transactions WHERE transaction_id = $1",
-        transaction_id)
+    existing = await fetch_sij(transaction_id)
     if not existing:
         raise HTTPException(status_code=404,
                             detail="Transaksi tidak ditemukan")
     await pool.execute(
-        "DELETE FROM sij_transactions WHERE transaction_id = $1",
-        transaction_id)
+        "DELETE FROM sij_transactions WHERE transaction_id = $1 AND date = $2",
+        transaction_id, existing['date'])
+    await event_bus.publish("sij",
+                            dict(op="delete", transaction=dict(existing)),
+                            actor=user['user_id'])
     return {"message": "Transaksi berhasil dihapus"}
 
 
-# =================== RITASE ===================
-
-RITASE_SORT_COLS = {
-    "id", "driver_name", "driver_id", "date", "waktu_ritase", "created_at"
+# =================== PRINT SPOOLER ===================
+# Server-side printing to ESC/POS thermal printers on the LAN (raw TCP,
+# usually port 9100). Each printer gets its own asyncio queue and worker
+# that keeps one TCP connection open between jobs, so receipts from
+# several counters never interleave. Failed sends reconnect and retry with
+# exponential backoff. The queues and open connections belong to the
+# worker that accepted the job, but every status change is written to
+# print_jobs so any worker can answer /print/jobs. The last PRINT_JOBS_KEEP
+# jobs also stay in memory, which keeps the spooler printing while the
+# database is down (offline SIJ receipts).
+
+PRINTER_CONNECT_TIMEOUT = _env_float('PRINTER_CONNECT_TIMEOUT', 3.0)
+PRINTER_WRITE_TIMEOUT = _env_float('PRINTER_WRITE_TIMEOUT', 10.0)
+PRINTER_IDLE_TIMEOUT = _env_float('PRINTER_IDLE_TIMEOUT', 60.0)
+PRINTER_MAX_ATTEMPTS = _env_int('PRINTER_MAX_ATTEMPTS', 5)
+PRINTER_BACKOFF_BASE = _env_float('PRINTER_BACKOFF_BASE', 0.5)
+PRINTER_BACKOFF_MAX = 30.0
+PRINT_JOBS_KEEP = 500
+PRINT_JOBS_RETENTION_DAYS = _env_int('PRINT_JOBS_RETENTION_DAYS', 30)
+# Printers must sit on these networks and listen on these ports, so the
+# spooler cannot be pointed at other services (databases, caches, the API
+# itself). Loopback is not allowed unless listed explicitly.
+PRINTER_ALLOWED_NETWORKS = [
+    ipaddress.ip_network(n.strip()) for n in os.environ.get(
+        'PRINTER_ALLOWED_NETWORKS',
+        '10.0.0.0/8,172.16.0.0/12,192.168.0.0/16').split(',') if n.strip()
+]
+PRINTER_ALLOWED_PORTS = {
+    int(p)
+    for p in os.environ.get('PRINTER_ALLOWED_PORTS', '9100').split(',')
+    if p.strip().isdigit()
 }
+METRIC_HELP["raja_print_jobs_total"] = ("counter",
+                                        "Print jobs by final status")
+
+ESC, GS, LF = b"\x1b", b"\x1d", b"\n"
+ESCPOS_INIT = ESC + b"@"
+ESCPOS_CENTER = ESC + b"a\x01"
+ESCPOS_LEFT = ESC + b"a\x00"
+ESCPOS_BOLD_ON = ESC + b"E\x01"
+ESCPOS_BOLD_OFF = ESC + b"E\x00"
+ESCPOS_DOUBLE_HEIGHT = GS + b"!\x11"
+ESCPOS_NORMAL_SIZE = GS + b"!\x00"
+ESCPOS_CUT = GS + b"VA\x00"
+ESCPOS_DASHES = b"-" * 32
+
+
+def render_sij_receipt(tx: dict) -> bytes:
+    """58mm ESC/POS receipt, one cut sheet per lembar (as SIJInput.jsx)."""
+
+    def text(value) -> bytes:
+        return str(value).encode("ascii", errors="replace")
+
+    amount = f"{tx.get('amount') or 40000:,}".replace(",", ".")
+    category = "PREMIUM" if tx.get("category") == "premium" else "STANDAR"
+    sheets = tx.get("sheets") or 1
+    out = bytearray()
+    for i in range(sheets):
+        out += ESCPOS_INIT + ESCPOS_CENTER
+        out += ESCPOS_BOLD_ON + ESCPOS_DOUBLE_HEIGHT
+        out += b"RAJA DIGITAL SYSTEM" + LF
+        out += ESCPOS_NORMAL_SIZE + ESCPOS_BOLD_OFF
+        out += b"SIJ - Soetta Airport" + LF + ESCPOS_DASHES + LF
+        out += ESCPOS_BOLD_ON + ESCPOS_DOUBLE_HEIGHT
+        out += text(tx["transaction_id"]) + LF
+        out += ESCPOS_NORMAL_SIZE + ESCPOS_BOLD_OFF + ESCPOS_DASHES + LF
+        out += ESCPOS_LEFT
+        out += b"Driver   : " + text(tx.get("driver_name", ""))[:20] + LF
+        out += b"Kategori : " + text(category) + LF
+        out += b"Tanggal  : " + text(tx.get("date", "")) + LF
+        out += b"Jam      : " + text(tx.get("time", "")) + LF
+        out += b"Admin    : " + text(tx.get("admin_name", "")) + LF
+        out += b"Lembar   : " + text(f"{i + 1} / {sheets}") + LF
+        out += ESCPOS_CENTER + ESCPOS_DASHES + LF
+        out += ESCPOS_BOLD_ON + ESCPOS_DOUBLE_HEIGHT
+        out += text(f"Rp {amount}") + LF
+        out += ESCPOS_NORMAL_SIZE + ESCPOS_BOLD_OFF + ESCPOS_DASHES + LF
+        out += b"QRIS: " + text(tx.get("qris_ref", "")) + LF + LF + LF
+        out += ESCPOS_CUT
+    return bytes(out)
+
+
+def resolve_printer(ip: str, port: int) -> tuple:
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        raise HTTPException(status_code=400,
+                            detail="Alamat IP printer tidak valid")
+    if port not in PRINTER_ALLOWED_PORTS:
+        raise HTTPException(status_code=400,
+                            detail="Port printer tidak diizinkan")
+    if not any(addr in net for net in PRINTER_ALLOWED_NETWORKS):
+        raise HTTPException(status_code=400,
+                            detail="Alamat printer tidak diizinkan")
+    return str(addr), port
+
+
+class PrintJob:
+
+    def __init__(self, printer: tuple, data: bytes,
+                 transaction_id: Optional[str]):
+        self.job_id = f"PJ{int(time.time() * 1000)}{random.randint(100, 999)}"
+        self.printer = printer
+        self.data = data
+        self.transaction_id = transaction_id
+        self.status = "queued"
+        self.attempts = 0
+        self.error = None
+        self.created_at = datetime.now(JAKARTA_TZ)
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "printer": f"{self.printer[0]}:{self.printer[1]}",
+            "transaction_id": self.transaction_id,
+            "bytes": len(self.data),
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at and self.finished_at.isoformat(),
+        }
+
+
+register_query(
+    "print.save", """INSERT INTO print_jobs (job_id, printer, transaction_id, bytes, status,
+                                          attempts, error, created_at, finished_at)
+       VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+       ON CONFLICT (job_id) DO UPDATE SET
+           status = EXCLUDED.status, attempts = EXCLUDED.attempts,
+           error = EXCLUDED.error, finished_at = EXCLUDED.finished_at""")
+register_query("print.get", "SELECT * FROM print_jobs WHERE job_id = $1")
+register_query(
+    "print.list",
+    "SELECT * FROM print_jobs ORDER BY created_at DESC LIMIT $1")
+register_query(
+    "print.list_status", """SELECT * FROM print_jobs WHERE status = $2
+       ORDER BY created_at DESC LIMIT $1""")
+register_query("print.prune", "DELETE FROM print_jobs WHERE created_at < $1")
+
+
+def print_job_row(row) -> dict:
+    job = dict(row)
+    for key in ("created_at", "finished_at"):
+        if job[key] is not None:
+            job[key] = job[key].astimezone(JAKARTA_TZ).isoformat()
+    return job
+
+
+class PrinterQueue:
+    """One printer: a FIFO of jobs and a persistent TCP connection."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.queue = asyncio.Queue()
+        self.reader = None
+        self.writer = None
+        self.task = asyncio.create_task(self._run())
+
+    @property
+    def connected(self) -> bool:
+        return (self.writer is not None and not self.writer.is_closing()
+                and not self.reader.at_eof())
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            PRINTER_CONNECT_TIMEOUT)
+
+    async def _disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            with contextlib.suppress(Exception):
+                await self.writer.wait_closed()
+        self.reader = self.writer = None
+
+    async def _send(self, job: PrintJob):
+        while True:
+            job.attempts += 1
+            job.status = "printing"
+            await print_spooler.persist(job)
+            try:
+                if not self.connected:
+                    await self._disconnect()
+                    await self._connect()
+                self.writer.write(job.data)
+                await asyncio.wait_for(self.writer.drain(),
+                                       PRINTER_WRITE_TIMEOUT)
+                job.status = "done"
+                job.error = None
+                return
+            except (OSError, asyncio.TimeoutError) as e:
+                await self._disconnect()
+                job.error = str(e) or type(e).__name__
+                if job.attempts >= PRINTER_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    logger.warning(
+                        f"Print job {job.job_id} to {self.host}:{self.port} "
+                        f"failed after {job.attempts} attempts: {job.error}")
+                    return
+                job.status = "retrying"
+                await print_spooler.persist(job)
+                delay = min(PRINTER_BACKOFF_MAX,
+                            PRINTER_BACKOFF_BASE * 2**(job.attempts - 1))
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    job = await asyncio.wait_for(self.queue.get(),
+                                                 PRINTER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    await self._disconnect()
+                    continue
+                await self._send(job)
+                job.finished_at = datetime.now(JAKARTA_TZ)
+                await print_spooler.persist(job)
+                metrics.inc("raja_print_jobs_total", status=job.status)
+        finally:
+            await self._disconnect()
+
+
+class PrintSpooler:
+
+    def __init__(self):
+        self.printers = {}  # (host, port) -> PrinterQueue
+        self.jobs = collections.OrderedDict()  # job_id -> PrintJob
+        self.pruned_at = 0.0
+
+    async def persist(self, job: PrintJob):
+        """Best effort: a database outage must not stop the printers."""
+        try:
+            await pool.execute(QUERIES["print.save"], job.job_id,
+                               job.to_dict()["printer"], job.transaction_id,
+                               len(job.data), job.status, job.attempts,
+                               job.error, job.created_at, job.finished_at)
+            if job.finished_at and time.monotonic() - self.pruned_at > 3600:
+                self.pruned_at = time.monotonic()
+                await pool.execute(
+                    QUERIES["print.prune"],
+                    job.finished_at - timedelta(days=PRINT_JOBS_RETENTION_DAYS))
+        except Exception as e:
+            logger.debug(f"Print job {job.job_id} status not saved: {e}")
+
+    async def submit(self,
+                     printer: tuple,
+                     data: bytes,
+                     transaction_id: Optional[str] = None) -> PrintJob:
+        job = PrintJob(printer, data, transaction_id)
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > PRINT_JOBS_KEEP:
+            self.jobs.popitem(last=False)
+        await self.persist(job)
+        queue = self.printers.get(printer)
+        if queue is None or queue.task.done():
+            queue = self.printers[printer] = PrinterQueue(*printer)
+        queue.queue.put_nowait(job)
+        return job
+
+    def stats(self) -> list:
+        return [{
+            "printer": f"{host}:{port}",
+            "queued": q.queue.qsize(),
+            "connected": q.connected,
+        } for (host, port), q in self.printers.items()]
+
+    async def stop(self):
+        for q in self.printers.values():
+            q.task.cancel()
+        await asyncio.gather(*(q.task for q in self.printers.values()),
+                             return_exceptions=True)
+        self.printers.clear()
+
+
+print_spooler = PrintSpooler()
+
+
+@api_router.post("/print/network")
+async def print_network(req: PrintNetworkRequest,
+                        user: dict = Depends(require_admin)):
+    printer = resolve_printer(req.ip, req.port)
+    try:
+        data = bytes.fromhex(req.hex_data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="hex_data tidak valid")
+    if not data:
+        raise HTTPException(status_code=400, detail="hex_data kosong")
+    return (await print_spooler.submit(printer, data)).to_dict()
+
+
+@api_router.post("/sij/{transaction_id}/print")
+async def print_sij(transaction_id: str,
+                    req: PrintSIJRequest,
+                    user: dict = Depends(require_admin)):
+    printer = resolve_printer(req.ip, req.port)
+    tx = await fetch_sij(transaction_id)
+    if not tx:
+        raise HTTPException(status_code=404,
+                            detail="Transaksi tidak ditemukan")
+    job = await print_spooler.submit(printer, render_sij_receipt(dict(tx)),
+                                     transaction_id)
+    return job.to_dict()
+
+
+@api_router.get("/print/jobs")
+async def list_print_jobs(status: Optional[str] = None,
+                          user: dict = Depends(require_admin)):
+    if status is None:
+        rows = await pool.fetch(QUERIES["print.list"], 100)
+    else:
+        rows = await pool.fetch(QUERIES["print.list_status"], 100, status)
+    # Printer queues are per worker; the job list covers all of them.
+    return {
+        "printers": print_spooler.stats(),
+        "jobs": [print_job_row(r) for r in rows]
+    }
+
+
+@api_router.get("/print/jobs/{job_id}")
+async def get_print_job(job_id: str, user: dict = Depends(require_admin)):
+    job = print_spooler.jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    row = await pool.fetchrow(QUERIES["print.get"], job_id)
+    if row is None:
+        raise HTTPException(status_code=404,
+                            detail="Job cetak tidak ditemukan")
+    return print_job_row(row)
+
+
+# =================== RITASE ===================
 
 
 @api_router.get("/ritase")
@@ -942,51 +4387,87 @@ async def get_ritase(date_from: Optional[str] = None,
                      sort_by: str = "created_at",
                      sort_dir: str = "desc",
                      user: dict = Depends(require_admin)):
-    conditions = []
-    params = []
-    idx = 1
-    if date_from:
-        conditions.append(f"date >= ${idx}")
-        params.append(date_from)
-        idx += 1
-    if date_to:
-        conditions.append(f"date <= ${idx}")
-        params.append(date_to)
-        idx += 1
-    if search:
-        conditions.append(
-            f"(driver_name ILIKE ${idx} OR driver_id ILIKE ${idx})")
-        params.append(f"%{search}%")
-        idx += 1
-    where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    col = sort_by if sort_by in RITASE_SORT_COLS else "created_at"
-    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
-    rows = await pool.fetch(
-        f"SELECT id, driver_id, driver_name, date, waktu_ritase, notes, admin_name, shift, created_at FROM ritase {where} ORDER BY {col} {direction}",
-        *params)
+    sql, args = sorted_filtered_query("ritase.list",
+                                      sort_by,
+                                      sort_dir,
+                                      "created_at",
+                                      date_from=date_from or None,
+                                      date_to=date_to or None,
+                                      search=like_pattern(search))
+    rows = await pool.fetch(sql, *args)
     return rows_to_list(rows)
 
 
-@api_router.post("/ritase")
-async def create_ritase(data: RitaseCreateRequest,
-                        user: dict = Depends(require_admin)):
-    driver_row = await pool.fetchrow(
-        "SELECT name FROM drivers WHERE driver_id = $1", data.driver_id)
+async def insert_ritase(conn,
+                        data: RitaseCreateRequest,
+                        user: dict,
+                        now: Optional[datetime] = None) -> dict:
+    driver_row = await lookup_driver(data.driver_id)
     if not driver_row:
         raise HTTPException(status_code=400, detail="Driver tidak ditemukan")
-    now = datetime.now(JAKARTA_TZ)
+    now = now or datetime.now(JAKARTA_TZ)
     created_at = now.isoformat()
-    await pool.execute(
-        """INSERT INTO ritase (driver_id, driver_name, date, waktu_ritase, notes, admin_id, admin_name, shift, created_at)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)""", data.driver_id,
+    ritase_id = await conn.fetchval(
+        QUERIES["ritase.insert"], data.driver_id,
         driver_row['name'], data.date, data.waktu_ritase, data.notes,
-        user['user_id'], user['name'], detect_shift(), created_at)
-    await pool.execute(
-        """INSERT INTO audit_log (date, driver_id, has_sij, has_trip, mismatch)
-        VALUES ($1, $2, false, true, false)
-        ON CONFLICT (date, driver_id) DO UPDATE SET has_trip = true""",
-        data.date, data.driver_id)
-    return {"message": "Ritase berhasil ditambahkan"}
+        user['user_id'], user['name'], detect_shift(now), created_at)
+    await conn.execute(QUERIES["audit.mark_trip"], data.date, data.driver_id)
+    return {"message": "Ritase berhasil ditambahkan", "id": ritase_id}
+
+
+async def publish_ritase_created(response: dict, data: RitaseCreateRequest,
+                                 user: dict):
+    await event_bus.publish("ritase",
+                            dict(op="create",
+                                 ritase_id=response["id"],
+                                 driver_id=data.driver_id,
+                                 date=data.date),
+                            actor=user['user_id'])
+
+
+@api_router.post("/ritase")
+async def create_ritase(data: RitaseCreateRequest,
+                        user: dict = Depends(require_admin),
+                        idempotency_key: Optional[str] = Header(
+                            None, alias="Idempotency-Key")):
+    try:
+        response, replayed = await run_counter_write(
+            "ritase.create", data, user, idempotency_key,
+            lambda conn: insert_ritase(conn, data, user))
+    except DB_UNAVAILABLE_ERRORS as e:
+        receipt, _ = await offline_buffer.accept(
+            "ritase", data, user, idempotency_key, e, {
+                "message": "Ritase disimpan sementara (database offline)",
+            })
+        return JSONResponse(receipt, status_code=202)
+    if replayed:
+        return idempotent_replay(response)
+    await publish_ritase_created(response, data, user)
+    return response
+
+
+RITASE_EXPORT_COLUMNS = [
+    "id", "driver_id", "driver_name", "date", "waktu_ritase", "notes",
+    "admin_name", "shift"
+]
+
+
+async def with_archived_ritase(data: List[dict], date_from: Optional[str],
+                               date_to: Optional[str]) -> List[dict]:
+    archived = await cold_archive.scan("ritase",
+                                       date_from,
+                                       date_to,
+                                       columns=RITASE_EXPORT_COLUMNS +
+                                       ["created_at"])
+    if not archived:
+        return data
+    archived.sort(key=lambda d: (d["date"], d["created_at"] or ""),
+                  reverse=True)
+    for d in archived:
+        del d["created_at"]
+    data = merge_archived(data, archived, "ritase")
+    data.sort(key=lambda d: d["date"], reverse=True)
+    return data
 
 
 @api_router.get("/ritase/export/csv")
@@ -1005,10 +4486,13 @@ async def export_ritase_csv(date_from: Optional[str] = None,
         params.append(date_to)
         idx += 1
     where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    rows = await pool.fetch(
+    db = export_pool(user, date_from, date_to)
+    rows = await db.fetch(
         f"SELECT id, driver_id, driver_name, date, waktu_ritase, notes, admin_name, shift FROM ritase {where} ORDER BY date DESC, created_at DESC",
         *params)
     data = rows_to_list(rows)
+    if db is not analytics:
+        data = await with_archived_ritase(data, date_from, date_to)
     output = io.StringIO()
     fields = [
         "id", "driver_id", "driver_name", "date", "waktu_ritase", "notes",
@@ -1041,10 +4525,13 @@ async def export_ritase_pdf(date_from: Optional[str] = None,
         params.append(date_to)
         idx += 1
     where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    rows = await pool.fetch(
+    db = export_pool(user, date_from, date_to)
+    rows = await db.fetch(
         f"SELECT id, driver_id, driver_name, date, waktu_ritase, notes, admin_name, shift FROM ritase {where} ORDER BY date DESC, created_at DESC",
         *params)
     data = rows_to_list(rows)
+    if db is not analytics:
+        data = await with_archived_ritase(data, date_from, date_to)
     buf = io.BytesIO()
     doc = SimpleDocTemplate(buf,
                             pagesize=landscape(A4),
@@ -1114,15 +4601,12 @@ async def export_ritase_pdf(date_from: Optional[str] = None,
 async def update_ritase(ritase_id: int,
                         data: RitaseUpdateRequest,
                         user: dict = Depends(require_superadmin)):
-    existing = await pool.fetchrow("SELECT id FROM ritase WHERE id = $1",
-                                   ritase_id)
+    existing = await pool.fetchrow(QUERIES["ritase.by_id"], ritase_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Ritase tidak ditemukan")
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if 'driver_id' in update_data:
-        driver_row = await pool.fetchrow(
-            "SELECT name FROM drivers WHERE driver_id = $1",
-            update_data['driver_id'])
+        driver_row = await lookup_driver(update_data['driver_id'])
         if not driver_row:
             raise HTTPException(status_code=400,
                                 detail="Driver tidak ditemukan")
@@ -1138,17 +4622,31 @@ async def update_ritase(ritase_id: int,
         params.append(ritase_id)
         await pool.execute(
             f"UPDATE ritase SET {', '.join(sets)} WHERE id = ${idx}", *params)
+        await event_bus.publish("ritase",
+                                dict(op="update",
+                                     ritase_id=ritase_id,
+                                     driver_id=update_data.get(
+                                         'driver_id', existing['driver_id']),
+                                     date=update_data.get(
+                                         'date', existing['date']),
+                                     before=dict(existing)),
+                                actor=user['user_id'])
     return {"message": "Ritase diperbarui"}
 
 
 @api_router.delete("/ritase/{ritase_id}")
 async def delete_ritase(ritase_id: int,
                         user: dict = Depends(require_superadmin)):
-    existing = await pool.fetchrow("SELECT id FROM ritase WHERE id = $1",
-                                   ritase_id)
+    existing = await pool.fetchrow(QUERIES["ritase.by_id"], ritase_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Ritase tidak ditemukan")
     await pool.execute("DELETE FROM ritase WHERE id = $1", ritase_id)
+    await event_bus.publish("ritase",
+                            dict(op="delete",
+                                 ritase_id=ritase_id,
+                                 driver_id=existing['driver_id'],
+                                 date=existing['date']),
+                            actor=user['user_id'])
     return {"message": "Ritase berhasil dihapus"}
 
 
@@ -1180,6 +4678,9 @@ async def create_user(data: UserCreateRequest,
         "INSERT INTO users (user_id, name, role, shift, email, password_hash) VALUES ($1, $2, $3, $4, $5, $6)",
         data.user_id, data.name, data.role, data.shift, data.email,
         password_hash)
+    await event_bus.publish("user",
+                            dict(op="create", user_id=data.user_id),
+                            actor=user['user_id'])
     return {"message": "User berhasil dibuat"}
 
 
@@ -1211,6 +4712,11 @@ async def update_user(user_id: str,
         await pool.execute(
             f"UPDATE users SET {', '.join(sets)} WHERE user_id = ${idx}",
             *params)
+        await event_bus.publish("user",
+                                dict(op="update",
+                                     user_id=user_id,
+                                     fields=sorted(update_data)),
+                                actor=current_user['user_id'])
     return {"message": "User berhasil diperbarui"}
 
 
@@ -1225,31 +4731,26 @@ async def delete_user(user_id: str,
     if not existing:
         raise HTTPException(status_code=404, detail="User tidak ditemukan")
     await pool.execute("DELETE FROM users WHERE user_id = $1", user_id)
+    await event_bus.publish("user",
+                            dict(op="delete", user_id=user_id),
+                            actor=current_user['user_id'])
     return {"message": "User berhasil dihapus"}
 
 
 # =================== DASHBOARD ===================
 
 
-@api_router.get("/dashboard/admin")
-async def admin_dashboard(user: dict = Depends(get_current_user)):
-    shift = user.get('shift', detect_shift())
+async def admin_dashboard_snapshot(shift: str) -> dict:
     today = datetime.now(JAKARTA_TZ).strftime("%Y-%m-%d")
-
-    sij_today_shift = await pool.fetchval(
-        "SELECT COUNT(*) FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active'",
-        today, shift)
-    revenue_shift = await pool.fetchval(
-        "SELECT COALESCE(SUM(amount), 0) FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active'",
-        today, shift)
+    sij_today_shift = await pool.fetchval(QUERIES["dashboard.shift_count"],
+                                          today, shift)
+    revenue_shift = await pool.fetchval(QUERIES["dashboard.shift_revenue"],
+                                        today, shift)
     active_drivers = await pool.fetchval(
-        "SELECT COUNT(*) FROM drivers WHERE status = 'active'")
-    mismatch_rows = await pool.fetch(
-        "SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers WHERE mismatch_count > 0 ORDER BY mismatch_count DESC LIMIT 50"
-    )
-    recent_sij_rows = await pool.fetch(
-        "SELECT transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at FROM sij_transactions WHERE date = $1 AND shift = $2 AND status = 'active' ORDER BY created_at DESC LIMIT 20",
-        today, shift)
+        QUERIES["dashboard.active_driver_count"])
+    mismatch_rows = await pool.fetch(QUERIES["dashboard.mismatch_top50"])
+    recent_sij_rows = await pool.fetch(QUERIES["dashboard.recent_sij"],
+                                       today, shift)
     return {
         "sij_today_shift": sij_today_shift,
         "revenue_shift": revenue_shift,
@@ -1261,41 +4762,47 @@ async def admin_dashboard(user: dict = Depends(get_current_user)):
     }
 
 
+@api_router.get("/dashboard/admin")
+async def admin_dashboard(user: dict = Depends(get_current_user)):
+    return await admin_dashboard_snapshot(user.get('shift', detect_shift()))
+
+
 @api_router.get("/dashboard/superadmin")
 async def superadmin_dashboard(user: dict = Depends(get_current_user)):
     if user.get('role') not in ['superadmin', 'viewer']:
         raise HTTPException(status_code=403, detail="Akses ditolak")
+    db = reporting_pool(user)
     now = datetime.now(JAKARTA_TZ)
     today = now.strftime("%Y-%m-%d")
     current_month = now.strftime("%Y-%m")
-    month_prefix = f"{current_month}%"
+    month_start, month_end = month_bounds(current_month)
 
-    total_sij_today = await pool.fetchval(
+    total_sij_today = await db.fetchval(
         "SELECT COUNT(*) FROM sij_transactions WHERE date = $1 AND status = 'active'",
         today)
-    total_revenue_today = await pool.fetchval(
+    total_revenue_today = await db.fetchval(
         "SELECT COALESCE(SUM(amount), 0) FROM sij_transactions WHERE date = $1 AND status = 'active'",
         today)
-    monthly_row = await pool.fetchrow(
-        "SELECT COUNT(*) as sij, COALESCE(SUM(amount), 0) as rev FROM sij_transactions WHERE date LIKE $1 AND status = 'active'",
-        month_prefix)
+    monthly_row = await db.fetchrow(
+        "SELECT COUNT(*) as sij, COALESCE(SUM(amount), 0) as rev FROM sij_transactions WHERE date >= $1 AND date < $2 AND status = 'active'",
+        month_start, month_end)
     monthly_sij = monthly_row['sij'] if monthly_row else 0
     monthly_revenue = monthly_row['rev'] if monthly_row else 0
-    total_drivers = await pool.fetchval("SELECT COUNT(*) FROM drivers")
-    active_drivers = await pool.fetchval(
+    total_drivers = await db.fetchval("SELECT COUNT(*) FROM drivers")
+    active_drivers = await db.fetchval(
         "SELECT COUNT(*) FROM drivers WHERE status = 'active'")
-    suspended_drivers = await pool.fetchval(
+    suspended_drivers = await db.fetchval(
         "SELECT COUNT(*) FROM drivers WHERE status = 'suspend'")
-    shift1_sij = await pool.fetchval(
+    shift1_sij = await db.fetchval(
         "SELECT COUNT(*) FROM sij_transactions WHERE date = $1 AND shift = 'Shift1' AND status = 'active'",
         today)
-    shift2_sij = await pool.fetchval(
+    shift2_sij = await db.fetchval(
         "SELECT COUNT(*) FROM sij_transactions WHERE date = $1 AND shift = 'Shift2' AND status = 'active'",
         today)
     daily_trend = []
     for i in range(6, -1, -1):
         day = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-        row = await pool.fetchrow(
+        row = await db.fetchrow(
             "SELECT COUNT(*) as cnt, COALESCE(SUM(amount), 0) as total FROM sij_transactions WHERE date = $1 AND status = 'active'",
             day)
         daily_trend.append({
@@ -1304,13 +4811,13 @@ async def superadmin_dashboard(user: dict = Depends(get_current_user)):
             "revenue": row['total']
         })
 
-    mismatch_list = await pool.fetch(
+    mismatch_list = await db.fetch(
         "SELECT driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month FROM drivers WHERE mismatch_count > 0 ORDER BY mismatch_count DESC LIMIT 100"
     )
-    ritase_ranking = await pool.fetch(
-        "SELECT r.driver_id, r.driver_name, COUNT(*) as trip_count FROM ritase r WHERE r.date LIKE $1 GROUP BY r.driver_id, r.driver_name ORDER BY trip_count DESC LIMIT 10",
-        month_prefix)
-    total_ritase_today = await pool.fetchval(
+    ritase_ranking = await (analytics_pool(user) or db).fetch(
+        "SELECT r.driver_id, r.driver_name, COUNT(*) as trip_count FROM ritase r WHERE r.date >= $1 AND r.date < $2 GROUP BY r.driver_id, r.driver_name ORDER BY trip_count DESC LIMIT 10",
+        month_start, month_end)
+    total_ritase_today = await db.fetchval(
         "SELECT COUNT(*) FROM ritase WHERE date = $1", today)
     return {
         "total_sij_today":
@@ -1351,113 +4858,425 @@ async def superadmin_dashboard(user: dict = Depends(get_current_user)):
 
 
 @api_router.get("/pool-dashboard")
-async def get_pool_dashboard():
+async def get_pool_dashboard(request: Request,
+                             zone: Optional[str] = None,
+                             page: int = Query(0, ge=0),
+                             page_size: int = Query(0, ge=0, le=500)):
+    if not (presence_board.live and driver_directory.live):
+        return paginate_board(await pool_dashboard_from_db(zone), page,
+                              page_size)
+    if zone is not None and zone not in presence_board.zones:
+        raise HTTPException(status_code=404, detail="Zona tidak ditemukan")
+    body, etag = await presence_board.body(zone, page, page_size)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body,
+                    media_type="application/json",
+                    headers=headers)
+
+
+async def pool_dashboard_from_db(zone: Optional[str] = None) -> dict:
     today = datetime.now(JAKARTA_TZ).strftime("%Y-%m-%d")
+    zone_name = None
+    if zone is not None:
+        zone_row = await pool.fetchrow(QUERIES["zones.by_id"], zone)
+        if not zone_row:
+            raise HTTPException(status_code=404,
+                                detail="Zona tidak ditemukan")
+        zone_name = zone_row['name']
 
     # 1. Ambil semua driver aktif
-    all_drivers_rows = await pool.fetch(
-        "SELECT driver_id, name, plate FROM drivers WHERE status = 'active'")
-    all_drivers = rows_to_list(all_drivers_rows)
+    sql, args = filtered_query("pool.active_drivers", zone=zone)
+    all_drivers_rows = await pool.fetch(sql, *args)
 
     # 2. Ambil driver yang absen hari ini
-    absent_rows = await pool.fetch(
-        "SELECT driver_id, reason FROM driver_absences WHERE date = $1", today)
+    sql, args = filtered_query("pool.absences_for_date", today, zone=zone)
+    absent_rows = await pool.fetch(sql, *args)
     absent_map = {r['driver_id']: r['reason'] for r in absent_rows}
 
     # 3. Ambil transaksi SIJ hari ini untuk cari yang On-Duty
-    sij_rows = await pool.fetch(
-        """
-        SELECT driver_id, MIN(time) as first_sij 
-        FROM sij_transactions 
-        WHERE date = $1 AND status = 'active'
-        GROUP BY driver_id
-    """, today)
+    sql, args = filtered_query("pool.first_sij_for_date", today, zone=zone)
+    sij_rows = await pool.fetch(sql, *args)
     sij_map = {r['driver_id']: r['first_sij'] for r in sij_rows}
 
-    active_list = []
-    absent_list = []
-    unknown_list = []
-
     # 4. Kelompokkan driver ke 3 kolom
-    for d in all_drivers:
-        did = d['driver_id']
-        if did in sij_map:
-            active_list.append({
-                "name": d['name'],
-                "plate": d['plate'],
-                "time": str(sij_map[did])[:5]  # Ambil Jam:Menit saja
-            })
-        elif did in absent_map:
-            absent_list.append({"name": d['name'], "reason": absent_map[did]})
-        else:
-            unknown_list.append({"name": d['name'], "plate": d['plate']})
+    board = partition_presence(rows_to_list(all_drivers_rows), absent_map,
+                               sij_map)
+    return dict(board, zone=zone, zone_name=zone_name)
 
-    # Urutkan yang aktif berdasarkan jam masuk terbaru
-    active_list.sort(key=lambda x: x['time'], reverse=True)
 
-    return {
-        "active": active_list,
-        "absent": absent_list,
-        "unknown": unknown_list
-    }
+# =================== LIVE DASHBOARD ===================
+
+DASHBOARD_WS_HEARTBEAT = _env_float('DASHBOARD_WS_HEARTBEAT', 25.0)
+DASHBOARD_WS_SEND_TIMEOUT = _env_float('DASHBOARD_WS_SEND_TIMEOUT', 5.0)
+DASHBOARD_MISMATCH_LIMIT = 50
+
+
+def shift_contribution(tx: Optional[dict], today: str, shift: str) -> tuple:
+    """(count, revenue) that a transaction adds to a shift's KPI cards."""
+    if (not tx or tx.get('status') != 'active' or tx.get('date') != today
+            or tx.get('shift') != shift):
+        return 0, 0
+    return 1, tx.get('amount') or 0
+
+
+class DashboardHub:
+    """Pushes admin dashboard changes to websocket clients, per shift.
+
+    A client gets one snapshot when it connects; after that it only
+    receives deltas derived from bus events.  A fresh snapshot goes out
+    whenever the bus resyncs (events may have been missed) or the Jakarta
+    day rolls over.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.today = None
+        self._drivers_state = None
+        self._held = {}  # ws -> messages queued while its snapshot is built
+
+    def add(self, shift: str, ws: WebSocket):
+        self.clients.setdefault(shift, set()).add(ws)
+
+    def remove(self, shift: str, ws: WebSocket):
+        self.clients.get(shift, set()).discard(ws)
+        self._held.pop(ws, None)
+
+    def count(self) -> int:
+        return sum(len(c) for c in self.clients.values())
+
+    async def _send(self, ws: WebSocket, text: str) -> bool:
+        try:
+            await asyncio.wait_for(ws.send_text(text),
+                                   DASHBOARD_WS_SEND_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def broadcast(self, shift: str, message: dict):
+        clients = list(self.clients.get(shift, ()))
+        if not clients:
+            return
+        text = json_module.dumps(message, default=str)
+        for ws in [ws for ws in clients if ws in self._held]:
+            self._held[ws].append((message, text))
+            clients.remove(ws)
+        sent = await asyncio.gather(*(self._send(ws, text) for ws in clients))
+        for ws, ok in zip(clients, sent):
+            if not ok:
+                self.remove(shift, ws)
+
+    async def snapshot(self, shift: str) -> dict:
+        data = await admin_dashboard_snapshot(shift)
+        self.today = data['today']
+        return {"type": "snapshot", "data": data}
+
+    async def send_snapshot(self, shift: str, ws: WebSocket) -> bool:
+        """Snapshot one client without losing deltas published meanwhile.
+
+        The client is registered and its deltas held before the snapshot
+        is read, then replayed after it. A held SIJ creation the snapshot
+        already lists is dropped so it is not counted twice.
+        """
+        self._held[ws] = []
+        self.add(shift, ws)
+        try:
+            message = await self.snapshot(shift)
+        except BaseException:
+            self._held.pop(ws, None)
+            raise
+        if not await self._send(ws, json_module.dumps(message, default=str)):
+            return False
+        listed = {tx['transaction_id'] for tx in message['data']['recent_sij']}
+        while self._held.get(ws):
+            held, text = self._held[ws].pop(0)
+            if (held.get('type') == 'sij' and held.get('op') == 'create'
+                    and held.get('transaction_id') in listed):
+                continue
+            if not await self._send(ws, text):
+                return False
+        self._held.pop(ws, None)
+        return True
+
+    async def resync(self):
+        for shift in [s for s, c in self.clients.items() if c]:
+            await self.broadcast(shift, await self.snapshot(shift))
+        self._drivers_state = None
+
+    def _rolled_over(self) -> bool:
+        return datetime.now(JAKARTA_TZ).strftime("%Y-%m-%d") != self.today
+
+    async def on_sij(self, event: dict):
+        if not self.count():
+            return
+        if self._rolled_over():
+            await self.resync()
+            return
+        op = event.get('op')
+        before = event.get('before')
+        after = event.get('transaction')
+        if op == 'delete':
+            before, after = after, None
+        current = after or before or {}
+        for shift in [s for s, c in self.clients.items() if c]:
+            old = shift_contribution(before, self.today, shift)
+            new = shift_contribution(after, self.today, shift)
+            if old == new == (0, 0):
+                continue
+            await self.broadcast(
+                shift, {
+                    "type": "sij",
+                    "op": op,
+                    "transaction_id": current.get('transaction_id'),
+                    "transaction": after if new[0] else None,
+                    "delta": {
+                        "sij_today_shift": new[0] - old[0],
+                        "revenue_shift": new[1] - old[1],
+                    },
+                })
+
+    def drivers_state(self) -> dict:
+        mismatched = (d for d in driver_directory.drivers.values()
+                      if (d.get('mismatch_count') or 0) > 0)
+        return {
+            "active_drivers":
+            len(driver_directory.active()),
+            "mismatch_list":
+            heapq.nlargest(DASHBOARD_MISMATCH_LIMIT,
+                           mismatched,
+                           key=lambda d: d['mismatch_count']),
+        }
+
+    async def on_driver(self, event: dict):
+        if not self.count() or not driver_directory.live:
+            return
+        state = self.drivers_state()
+        if state == self._drivers_state:
+            return
+        self._drivers_state = state
+        for shift in list(self.clients):
+            await self.broadcast(shift, dict(state, type="drivers"))
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(DASHBOARD_WS_HEARTBEAT)
+            if not self.count():
+                continue
+            try:
+                if self._rolled_over():
+                    await self.resync()
+                else:
+                    for shift in list(self.clients):
+                        await self.broadcast(shift, {"type": "ping"})
+            except Exception as e:
+                logger.warning(f"Dashboard heartbeat failed: {e}")
+
+
+dashboard_hub = DashboardHub()
+event_bus.subscribe("sij", dashboard_hub.on_sij)
+event_bus.subscribe("driver", dashboard_hub.on_driver)
+event_bus.on_resync(dashboard_hub.resync)
+
+
+@api_router.websocket("/ws/dashboard/admin")
+async def admin_dashboard_feed(websocket: WebSocket, token: str = Query(...)):
+    # Browsers cannot set headers on a websocket handshake, so the JWT
+    # travels as a query parameter.
+    try:
+        user = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except Exception:
+        await websocket.close(code=4401)
+        return
+    if not event_bus.live:
+        # Without LISTEN there is nothing to push; the client falls back
+        # to polling /dashboard/admin.
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    shift = user.get('shift', detect_shift())
+    try:
+        if not await dashboard_hub.send_snapshot(shift, websocket):
+            return
+        while True:
+            try:
+                message = json_module.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get('type') == 'resync':
+                if not await dashboard_hub.send_snapshot(shift, websocket):
+                    return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        dashboard_hub.remove(shift, websocket)
 
 
 # =================== AUDIT LOG ===================
 
-AUDIT_SORT_COLS = {"date", "driver_id", "has_sij", "has_trip", "mismatch"}
+
+AUDIT_PAGE_SIZE = _env_int("AUDIT_PAGE_SIZE", 500)
+AUDIT_PAGE_MAX = _env_int("AUDIT_PAGE_MAX", 2000)
+AUDIT_EXPORT_BATCH = _env_int("AUDIT_EXPORT_BATCH", 2000)
+AUDIT_EXPORT_FIELDS = [
+    "date", "driver_id", "driver_name", "has_sij", "has_trip", "mismatch"
+]
+
+
+def audit_range(date: Optional[str], date_from: Optional[str],
+                date_to: Optional[str]):
+    """``date`` is shorthand for a one-day range."""
+    return (date_from or date or None), (date_to or date or None)
 
 
 @api_router.get("/audit")
-async def get_audit_log(date: Optional[str] = None,
+async def get_audit_log(response: Response,
+                        date: Optional[str] = None,
+                        date_from: Optional[str] = None,
+                        date_to: Optional[str] = None,
                         search: Optional[str] = None,
+                        mismatch_only: bool = False,
                         sort_by: str = "date",
                         sort_dir: str = "desc",
+                        limit: int = Query(AUDIT_PAGE_SIZE,
+                                           ge=1,
+                                           le=AUDIT_PAGE_MAX),
+                        cursor: Optional[str] = None,
                         user: dict = Depends(require_admin)):
-    conditions = []
-    params = []
-    idx = 1
-    if date:
-        conditions.append(f"date = ${idx}")
-        params.append(date)
-        idx += 1
-    if search:
-        conditions.append(f"driver_id ILIKE ${idx}")
-        params.append(f"%{search}%")
-        idx += 1
-    where = "WHERE " + " AND ".join(conditions) if conditions else ""
-    col = sort_by if sort_by in AUDIT_SORT_COLS else "date"
-    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
-    rows = await pool.fetch(
-        f"SELECT date, driver_id, has_sij, has_trip, mismatch FROM audit_log {where} ORDER BY {col} {direction} LIMIT 1000",
-        *params)
-    return rows_to_list(rows)
+    """One page of the audit log.
+
+    When more rows follow, ``X-Next-Cursor`` carries the cursor for the
+    next page; pass it back with the same filters and sort.
+    """
+    if sort_by not in AUDIT_SORT_COLS:
+        sort_by = "date"
+    date_from, date_to = audit_range(date, date_from, date_to)
+    columns = audit_key_columns(sort_by)
+    key = (tuple(
+        decode_cursor(cursor, [
+            bool if AUDIT_COLUMN_TYPES[c] == "boolean" else str
+            for c in columns
+        ])) if cursor else None)
+    sql, args = sorted_filtered_query("audit.page",
+                                      sort_by,
+                                      sort_dir,
+                                      "date",
+                                      limit + 1,
+                                      date_from=date_from,
+                                      date_to=date_to,
+                                      search=like_pattern(search),
+                                      mismatch=mismatch_only,
+                                      after=key)
+    rows = rows_to_list(await reporting_pool(user).fetch(sql, *args))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            [rows[-1][c] for c in columns])
+    return rows
+
+
+@api_router.get("/audit/summary")
+async def get_audit_summary(date: Optional[str] = None,
+                            date_from: Optional[str] = None,
+                            date_to: Optional[str] = None,
+                            search: Optional[str] = None,
+                            user: dict = Depends(require_admin)):
+    date_from, date_to = audit_range(date, date_from, date_to)
+    sql, args = filtered_query("audit.summary",
+                               date_from=date_from,
+                               date_to=date_to,
+                               search=like_pattern(search))
+    row = await reporting_pool(user).fetchrow(sql, *args)
+    return {
+        "total": row["total"],
+        "mismatch": row["mismatch"],
+        "ok": row["total"] - row["mismatch"],
+    }
+
+
+async def audit_csv_chunks(db, date_from: Optional[str],
+                           date_to: Optional[str], search: Optional[str],
+                           mismatch_only: bool):
+    """CSV text of the whole filtered audit log, newest first.
+
+    Live rows come AUDIT_EXPORT_BATCH at a time, each batch a short keyset
+    query of its own, so memory stays flat and a slow download holds no
+    connection or snapshot between batches. Archived months follow the
+    live rows.
+    """
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=AUDIT_EXPORT_FIELDS)
+    writer.writeheader()
+    archived_months = {
+        p.stem
+        for p in cold_archive.covering("audit_log", date_from, date_to)
+    }
+    # Keys of live rows in months that also have an archive file; only a
+    # crash mid-archive leaves a month in both places.
+    seen = set()
+    after = None
+    while True:
+        sql, args = filtered_query("audit.page:date:DESC",
+                                   AUDIT_EXPORT_BATCH,
+                                   date_from=date_from,
+                                   date_to=date_to,
+                                   search=like_pattern(search),
+                                   mismatch=mismatch_only,
+                                   after=after)
+        rows = await db.fetch(sql, *args)
+        for row in rows:
+            if row["date"][:7] in archived_months:
+                seen.add((row["date"], row["driver_id"]))
+            writer.writerow(dict(row))
+        if output.tell() >= 64 * 1024:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if len(rows) < AUDIT_EXPORT_BATCH:
+            break
+        after = (rows[-1]["date"], rows[-1]["driver_id"])
+    if archived_months:
+        archived = await cold_archive.scan(
+            "audit_log",
+            date_from,
+            date_to,
+            columns=["date", "driver_id", "has_sij", "has_trip", "mismatch"],
+            mismatch=True if mismatch_only else None)
+        for row in archived:
+            driver = driver_directory.get(row["driver_id"]) or {}
+            row["driver_name"] = driver.get("name")
+        if search:
+            # Driver id or name, like the live query's ILIKE.
+            term = search.lower()
+            archived = [
+                r for r in archived if term in r["driver_id"].lower()
+                or term in (r["driver_name"] or "").lower()
+            ]
+        archived.sort(key=lambda r: (r["date"], r["driver_id"]),
+                      reverse=True)
+        for row in archived:
+            if (row["date"], row["driver_id"]) not in seen:
+                writer.writerow(row)
+    yield output.getvalue()
 
 
 @api_router.get("/audit/export")
 async def export_audit_csv(date: Optional[str] = None,
+                           date_from: Optional[str] = None,
+                           date_to: Optional[str] = None,
+                           search: Optional[str] = None,
+                           mismatch_only: bool = False,
                            user: dict = Depends(require_admin)):
-    if date:
-        rows = await pool.fetch(
-            "SELECT date, driver_id, has_sij, has_trip, mismatch FROM audit_log WHERE date = $1 ORDER BY date DESC",
-            date)
-    else:
-        rows = await pool.fetch(
-            "SELECT date, driver_id, has_sij, has_trip, mismatch FROM audit_log ORDER BY date DESC LIMIT 10000"
-        )
-    logs = rows_to_list(rows)
-    output = io.StringIO()
-    writer = csv.DictWriter(
-        output,
-        fieldnames=["date", "driver_id", "has_sij", "has_trip", "mismatch"])
-    writer.writeheader()
-    writer.writerows(logs)
-    output.seek(0)
+    date_from, date_to = audit_range(date, date_from, date_to)
+    db = reporting_pool(user)
+    label = (date_from if date_from == date_to else
+             f"{date_from or 'awal'}_{date_to or 'akhir'}")
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
+        audit_csv_chunks(db, date_from, date_to, search, mismatch_only),
         media_type="text/csv",
         headers={
             "Content-Disposition":
-            f"attachment; filename=audit_{date or 'all'}.csv"
+            f"attachment; filename=audit_{label or 'all'}.csv"
         })
 
 
@@ -1474,31 +5293,65 @@ async def get_absences(start_date: str = Query(...),
     return rows_to_list(rows)
 
 
-@api_router.post("/absences")
-async def set_absence(data: AbsenceRequest,
-                      user: dict = Depends(require_admin)):
+async def write_absence(conn, data: AbsenceRequest) -> dict:
+    """Set or clear one driver's absence for a date."""
     if data.reason and data.reason not in ABSENCE_REASONS:
         raise HTTPException(status_code=400, detail="Alasan absen tidak valid")
-    existing = await pool.fetchrow(
+    existing = await conn.fetchrow(
         "SELECT id FROM driver_absences WHERE driver_id = $1 AND date = $2",
         data.driver_id, data.date)
     if data.reason == "":
         if existing:
-            await pool.execute(
+            await conn.execute(
                 "DELETE FROM driver_absences WHERE driver_id = $1 AND date = $2",
                 data.driver_id, data.date)
         return {"message": "Keterangan absen dihapus"}
     if existing:
-        await pool.execute(
+        await conn.execute(
             "UPDATE driver_absences SET reason = $1 WHERE driver_id = $2 AND date = $3",
             data.reason, data.driver_id, data.date)
     else:
-        await pool.execute(
+        await conn.execute(
             "INSERT INTO driver_absences (driver_id, date, reason) VALUES ($1, $2, $3)",
             data.driver_id, data.date, data.reason)
     return {"message": "Keterangan absen disimpan"}
 
 
+async def publish_absence(data: AbsenceRequest, user: dict):
+    if data.reason == "":
+        event = dict(op="clear", driver_id=data.driver_id, date=data.date)
+    else:
+        event = dict(op="set",
+                     driver_id=data.driver_id,
+                     date=data.date,
+                     reason=data.reason)
+    await event_bus.publish("absence", event, actor=user['user_id'])
+
+
+@api_router.post("/absences")
+async def set_absence(data: AbsenceRequest,
+                      user: dict = Depends(require_admin),
+                      idempotency_key: Optional[str] = Header(
+                          None, alias="Idempotency-Key")):
+    if data.reason and data.reason not in ABSENCE_REASONS:
+        raise HTTPException(status_code=400, detail="Alasan absen tidak valid")
+    try:
+        response, replayed = await run_counter_write(
+            "absence.set", data, user, idempotency_key,
+            lambda conn: write_absence(conn, data))
+    except DB_UNAVAILABLE_ERRORS as e:
+        receipt, _ = await offline_buffer.accept(
+            "absence", data, user, idempotency_key, e, {
+                "message":
+                "Keterangan absen disimpan sementara (database offline)",
+            })
+        return JSONResponse(receipt, status_code=202)
+    if replayed:
+        return idempotent_replay(response)
+    await publish_absence(data, user)
+    return response
+
+
 @api_router.get("/absence-reasons")
 async def get_absence_reasons(user: dict = Depends(get_current_user)):
     return ABSENCE_REASONS
@@ -1522,6 +5375,12 @@ async def set_manual_ritase(data: ManualRitaseRequest,
            ON CONFLICT (driver_id, date) DO UPDATE
            SET manual_rts = $3, updated_by = $4, updated_at = NOW()""",
         data.driver_id, data.date, data.manual_rts, user['name'])
+    await event_bus.publish("ritase",
+                            dict(op="manual",
+                                 driver_id=data.driver_id,
+                                 date=data.date,
+                                 manual_rts=data.manual_rts),
+                            actor=user['user_id'])
     return {
         "driver_id": data.driver_id,
         "date": data.date,
@@ -1530,25 +5389,23 @@ async def set_manual_ritase(data: ManualRitaseRequest,
     }
 
 
-@api_router.get("/weekly-report")
-async def get_weekly_report(start_date: str = Query(...),
-                            end_date: str = Query(...),
-                            user: dict = Depends(get_current_user)):
-    drivers = await pool.fetch(
-        "SELECT driver_id, name, plate, category FROM drivers ORDER BY name")
-    sij_rows = await pool.fetch(
-        "SELECT DISTINCT driver_id, date FROM sij_transactions WHERE date >= $1 AND date <= $2 AND status = 'active'",
-        start_date, end_date)
-    ritase_rows = await pool.fetch(
-        "SELECT driver_id, date, COUNT(*) as cnt FROM ritase WHERE date >= $1 AND date <= $2 GROUP BY driver_id, date",
-        start_date, end_date)
-    absence_rows = await pool.fetch(
-        "SELECT driver_id, date, reason FROM driver_absences WHERE date >= $1 AND date <= $2",
-        start_date, end_date)
-    manual_rows = await pool.fetch(
-        "SELECT driver_id, date, manual_rts FROM manual_ritase_override WHERE date >= $1 AND date <= $2",
-        start_date, end_date)
+def weekly_days(start_date: str, end_date: str) -> List[str]:
+    from datetime import date as date_type
+    start = date_type.fromisoformat(start_date)
+    end = date_type.fromisoformat(end_date)
+    num_days = (end - start).days + 1
+    if num_days < 1 or num_days > 7:
+        num_days = 7
+    days = []
+    for i in range(num_days):
+        d = start + timedelta(days=i)
+        days.append(d.isoformat())
+    return days
+
 
+def build_weekly_rows(drivers, days, sij_rows, ritase_rows, absence_rows,
+                      manual_rows) -> List[dict]:
+    """Per-driver KHD/RTS cells and totals of the weekly grid."""
     sij_set = set()
     for r in sij_rows:
         sij_set.add((r['driver_id'], r['date']))
@@ -1565,17 +5422,6 @@ async def get_weekly_report(start_date: str = Query(...),
     for r in manual_rows:
         manual_map[(r['driver_id'], r['date'])] = r['manual_rts']
 
-    from datetime import date as date_type
-    start = date_type.fromisoformat(start_date)
-    end = date_type.fromisoformat(end_date)
-    num_days = (end - start).days + 1
-    if num_days < 1 or num_days > 7:
-        num_days = 7
-    days = []
-    for i in range(num_days):
-        d = start + timedelta(days=i)
-        days.append(d.isoformat())
-
     result = []
     for drv in drivers:
         did = drv['driver_id']
@@ -1606,15 +5452,216 @@ async def get_weekly_report(start_date: str = Query(...),
             "total_khd": total_khd,
             "total_rts": total_rts,
         })
+    return result
+
+
+@api_router.get("/weekly-report")
+async def get_weekly_report(start_date: str = Query(...),
+                            end_date: str = Query(...),
+                            user: dict = Depends(get_current_user)):
+    db = analytics_pool(user) or reporting_pool(user)
+    drivers = await db.fetch(
+        "SELECT driver_id, name, plate, category FROM drivers ORDER BY name")
+    sij_rows = await db.fetch(
+        "SELECT DISTINCT driver_id, date FROM sij_transactions WHERE date >= $1 AND date <= $2 AND status = 'active'",
+        start_date, end_date)
+    ritase_rows = await db.fetch(
+        "SELECT driver_id, date, COUNT(*) as cnt FROM ritase WHERE date >= $1 AND date <= $2 GROUP BY driver_id, date",
+        start_date, end_date)
+    absence_rows = await db.fetch(
+        "SELECT driver_id, date, reason FROM driver_absences WHERE date >= $1 AND date <= $2",
+        start_date, end_date)
+    manual_rows = await reporting_pool(user).fetch(
+        "SELECT driver_id, date, manual_rts FROM manual_ritase_override WHERE date >= $1 AND date <= $2",
+        start_date, end_date)
 
+    days = weekly_days(start_date, end_date)
     return {
         "start_date": start_date,
         "end_date": end_date,
         "days": days,
-        "drivers": result
+        "drivers": build_weekly_rows(drivers, days, sij_rows, ritase_rows,
+                                     absence_rows, manual_rows)
+    }
+
+
+WEEKLY_BATCH_MAX = _env_int("WEEKLY_BATCH_MAX", 5000)
+
+
+class WeeklyCellEdit(BaseModel):
+    driver_id: str
+    date: str
+    # "" clears the absence; None leaves it alone.
+    reason: Optional[str] = None
+    manual_rts: Optional[int] = None
+    clear_manual: bool = False
+
+
+class WeeklyCellBatch(BaseModel):
+    start_date: str
+    end_date: str
+    edits: List[WeeklyCellEdit]
+
+
+register_query(
+    "weekly.set_absences", """INSERT INTO driver_absences (driver_id, date, reason)
+    SELECT * FROM unnest($1::text[], $2::text[], $3::text[])
+    ON CONFLICT (driver_id, date) DO UPDATE SET reason = EXCLUDED.reason""")
+register_query(
+    "weekly.clear_absences", """DELETE FROM driver_absences
+    WHERE (driver_id, date) IN (SELECT * FROM unnest($1::text[], $2::text[]))""")
+register_query(
+    "weekly.set_manual", """INSERT INTO manual_ritase_override (driver_id, date, manual_rts, updated_by, updated_at)
+    SELECT driver_id, date, manual_rts, $4, NOW()
+    FROM unnest($1::text[], $2::text[], $3::int[]) AS u(driver_id, date, manual_rts)
+    ON CONFLICT (driver_id, date) DO UPDATE
+    SET manual_rts = EXCLUDED.manual_rts, updated_by = EXCLUDED.updated_by, updated_at = NOW()""")
+register_query(
+    "weekly.clear_manual", """DELETE FROM manual_ritase_override
+    WHERE (driver_id, date) IN (SELECT * FROM unnest($1::text[], $2::text[]))""")
+register_query(
+    "weekly.drivers",
+    "SELECT driver_id, name, plate, category FROM drivers WHERE driver_id = ANY($1::text[]) ORDER BY name"
+)
+register_query(
+    "weekly.sij",
+    "SELECT DISTINCT driver_id, date FROM sij_transactions WHERE date >= $1 AND date <= $2 AND driver_id = ANY($3::text[]) AND status = 'active'"
+)
+register_query(
+    "weekly.ritase",
+    "SELECT driver_id, date, COUNT(*) as cnt FROM ritase WHERE date >= $1 AND date <= $2 AND driver_id = ANY($3::text[]) GROUP BY driver_id, date"
+)
+register_query(
+    "weekly.absences",
+    "SELECT driver_id, date, reason FROM driver_absences WHERE date >= $1 AND date <= $2 AND driver_id = ANY($3::text[])"
+)
+register_query(
+    "weekly.manual",
+    "SELECT driver_id, date, manual_rts FROM manual_ritase_override WHERE date >= $1 AND date <= $2 AND driver_id = ANY($3::text[])"
+)
+
+
+def _unzip(items, width: int) -> List[list]:
+    return [list(col) for col in zip(*items)] if items else [[]] * width
+
+
+async def write_weekly_cells(conn, absences: dict, manual: dict,
+                             days: List[str], user: dict) -> dict:
+    """Apply grouped cell edits set-wise and recompute the touched rows."""
+    driver_ids = sorted({did for did, _ in (*absences, *manual)})
+    drivers = await conn.fetch(QUERIES["weekly.drivers"], driver_ids)
+    missing = set(driver_ids) - {d['driver_id'] for d in drivers}
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Driver tidak ditemukan: {', '.join(sorted(missing))}")
+
+    set_absences = [(*k, r) for k, r in absences.items() if r]
+    cleared_absences = [k for k, r in absences.items() if not r]
+    set_manual = [(*k, n) for k, n in manual.items() if n is not None]
+    cleared_manual = [k for k, n in manual.items() if n is None]
+    if set_absences:
+        await conn.execute(QUERIES["weekly.set_absences"],
+                           *_unzip(set_absences, 3))
+    if cleared_absences:
+        await conn.execute(QUERIES["weekly.clear_absences"],
+                           *_unzip(cleared_absences, 2))
+    if set_manual:
+        await conn.execute(QUERIES["weekly.set_manual"],
+                           *_unzip(set_manual, 3), user['name'])
+    if cleared_manual:
+        await conn.execute(QUERIES["weekly.clear_manual"],
+                           *_unzip(cleared_manual, 2))
+
+    args = (days[0], days[-1], driver_ids)
+    sij_rows = await conn.fetch(QUERIES["weekly.sij"], *args)
+    ritase_rows = await conn.fetch(QUERIES["weekly.ritase"], *args)
+    absence_rows = await conn.fetch(QUERIES["weekly.absences"], *args)
+    manual_rows = await conn.fetch(QUERIES["weekly.manual"], *args)
+    return {
+        "updated": len(absences) + len(manual),
+        "days": days,
+        "drivers": build_weekly_rows(drivers, days, sij_rows, ritase_rows,
+                                     absence_rows, manual_rows),
     }
 
 
+@api_router.post("/weekly-report/cells")
+async def edit_weekly_cells(data: WeeklyCellBatch,
+                            user: dict = Depends(require_admin),
+                            idempotency_key: Optional[str] = Header(
+                                None, alias="Idempotency-Key")):
+    """Apply many weekly-grid edits in one transaction.
+
+    Each edit sets or clears (``reason: ""``) an absence, sets
+    ``manual_rts`` or drops the override with ``clear_manual``. Later edits
+    of the same cell win. Returns the recomputed rows of the drivers
+    touched, in the shape of ``/weekly-report``'s ``drivers``.
+    """
+    if not data.edits:
+        raise HTTPException(status_code=400, detail="Tidak ada perubahan")
+    if len(data.edits) > WEEKLY_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maksimal {WEEKLY_BATCH_MAX} sel per permintaan")
+    try:
+        days = weekly_days(data.start_date, data.end_date)
+        for edit in data.edits:
+            datetime.strptime(edit.date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Format tanggal tidak valid (gunakan YYYY-MM-DD)")
+    outside = sorted({e.date for e in data.edits} - set(days))
+    if outside:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tanggal di luar minggu {days[0]} s/d {days[-1]}: "
+            f"{', '.join(outside)}")
+    absences, manual = {}, {}
+    for edit in data.edits:
+        key = (edit.driver_id, edit.date)
+        if edit.reason is not None:
+            if edit.reason and edit.reason not in ABSENCE_REASONS:
+                raise HTTPException(status_code=400,
+                                    detail="Alasan absen tidak valid")
+            absences[key] = edit.reason
+        if edit.clear_manual:
+            manual[key] = None
+        elif edit.manual_rts is not None:
+            if edit.manual_rts < 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Ritase manual tidak boleh negatif")
+            manual[key] = edit.manual_rts
+        if (edit.reason is None and edit.manual_rts is None
+                and not edit.clear_manual):
+            raise HTTPException(status_code=400,
+                                detail="Edit sel tidak berisi perubahan")
+
+    response, replayed = await run_counter_write(
+        "weekly.cells", data, user, idempotency_key,
+        lambda conn: write_weekly_cells(conn, absences, manual, days, user))
+    if replayed:
+        return idempotent_replay(response)
+    absence_events = [
+        dict(op="set", driver_id=did, date=date, reason=reason)
+        if reason else dict(op="clear", driver_id=did, date=date)
+        for (did, date), reason in absences.items()
+    ]
+    manual_events = [
+        dict(op="manual", driver_id=did, date=date, manual_rts=n)
+        for (did, date), n in manual.items()
+    ]
+    await event_bus.publish_many("absence",
+                                 absence_events,
+                                 actor=user['user_id'])
+    await event_bus.publish_many("ritase",
+                                 manual_events,
+                                 actor=user['user_id'])
+    return response
+
+
 @api_router.get("/weekly-report/export/csv")
 async def export_weekly_csv(start_date: str = Query(...),
                             end_date: str = Query(...),
@@ -1827,6 +5874,641 @@ async def export_weekly_pdf(start_date: str = Query(...),
         headers={"Content-Disposition": f"attachment; filename={fname}"})
 
 
+# =================== DRIVER SCORES ===================
+# Per-driver scores over rolling windows (SCORE_WINDOWS days, ending
+# today): attendance rate (days with an active SIJ), SIJ/ritase ratio,
+# mismatch frequency and absence patterns, folded into one 0-100 score.
+# Rows live in driver_scores, one per driver and window, with the rank
+# among active drivers stored alongside, so the leaderboard is a single
+# index range read. Statement triggers on the source tables append the
+# touched driver ids to driver_score_changes (plain inserts, so writers
+# never wait on the refresher); the maintenance loop recomputes just
+# those drivers, and everyone once a day when the windows move on. With
+# SCORE_REFRESH_INTERVAL <= 0 nothing consumes that log, so the triggers
+# are not installed and scores change only through POST /scores/refresh.
+
+
+def _score_windows() -> tuple:
+    try:
+        windows = {
+            int(w)
+            for w in os.environ.get("SCORE_WINDOWS", "7,30,90").split(",")
+        }
+    except ValueError:
+        windows = set()
+    return tuple(sorted(w for w in windows if w > 0)) or (7, 30, 90)
+
+
+SCORE_WINDOWS = _score_windows()
+SCORE_REFRESH_INTERVAL = _env_float("SCORE_REFRESH_INTERVAL", 60.0)
+SCORE_LOCK_KEY = 7261002
+SCORE_PAGE_SIZE = 50
+SCORE_PAGE_MAX = 1000
+# Share of the score held by attendance, mismatch-free days and days
+# without an unexplained absence.
+SCORE_WEIGHTS = {"attendance": 0.6, "mismatch": 0.25, "unexcused": 0.15}
+UNEXCUSED_ABSENCE_REASONS = ["TANPA KETERANGAN"]
+SCORE_SOURCE_TABLES = ("sij_transactions", "ritase", "audit_log",
+                       "driver_absences", "drivers")
+# Leaderboard sort columns and the Python type of their cursor values.
+SCORE_SORT_COLS = {
+    "score": float,
+    "attendance_rate": float,
+    "mismatch_rate": float,
+    "active_days": int,
+    "sij_count": int,
+    "ritase_count": int,
+    "absence_days": int,
+    "unexcused_days": int,
+}
+
+METRIC_HELP["raja_score_refresh_seconds"] = (
+    "histogram", "Driver score refreshes (incremental and daily)")
+
+
+async def create_driver_scores(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS driver_scores (
+            driver_id VARCHAR(50) NOT NULL,
+            window_days INTEGER NOT NULL,
+            window_start VARCHAR(10) NOT NULL,
+            window_end VARCHAR(10) NOT NULL,
+            active_days INTEGER NOT NULL,
+            attendance_rate DOUBLE PRECISION NOT NULL,
+            sij_count INTEGER NOT NULL,
+            ritase_count INTEGER NOT NULL,
+            sij_ritase_ratio DOUBLE PRECISION,
+            mismatch_days INTEGER NOT NULL,
+            mismatch_rate DOUBLE PRECISION NOT NULL,
+            absence_days INTEGER NOT NULL,
+            unexcused_days INTEGER NOT NULL,
+            absence_reasons JSONB NOT NULL,
+            absence_weekdays JSONB NOT NULL,
+            score DOUBLE PRECISION NOT NULL,
+            rank INTEGER,
+            computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (driver_id, window_days)
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_driver_scores_score ON driver_scores (window_days, score, driver_id)"
+    )
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS driver_score_changes (
+            seq BIGSERIAL PRIMARY KEY,
+            driver_id VARCHAR(50) NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE OR REPLACE FUNCTION raja_score_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO driver_score_changes (driver_id)
+            SELECT DISTINCT driver_id FROM changed_rows;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    if SCORE_REFRESH_INTERVAL <= 0:
+        return
+    # Transition tables allow a single event per trigger.
+    for table in SCORE_SOURCE_TABLES:
+        for event, rows in (("INSERT", "NEW"), ("UPDATE", "NEW"),
+                            ("DELETE", "OLD")):
+            await db.execute(f"""
+                CREATE OR REPLACE TRIGGER {table}_score_{event.lower()} AFTER {event}
+                ON {table} REFERENCING {rows} TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION raja_score_change()
+            """)
+
+
+def _weekday_counts() -> str:
+    return ", ".join(
+        f"COUNT(*) FILTER (WHERE extract(isodow FROM date::date) = {d})"
+        for d in range(1, 8))
+
+
+# $1 window days, $2/$3 window start/end, $4 unexcused absence reasons;
+# the scores.refresh_drivers variant takes the driver ids as $5. A separate
+# text rather than a NULL-able filter, so a generic plan of the incremental
+# refresh still reads only those drivers' rows.
+for _name, _only in (("scores.refresh", False),
+                     ("scores.refresh_drivers", True)):
+    _ids = "\n          AND driver_id = ANY($5::text[])" if _only else ""
+    _stats_ids = "\n        WHERE d.driver_id = ANY($5::text[])" if _only else ""
+    register_query(
+        _name, f"""WITH sij AS (
+        SELECT driver_id, COUNT(DISTINCT date) AS active_days, COUNT(*) AS sij_count
+        FROM sij_transactions
+        WHERE date >= $2 AND date <= $3 AND status = 'active'{_ids}
+        GROUP BY driver_id
+    ), trips AS (
+        SELECT driver_id, COUNT(*) AS ritase_count FROM ritase
+        WHERE date >= $2 AND date <= $3{_ids}
+        GROUP BY driver_id
+    ), mismatches AS (
+        SELECT driver_id, COUNT(*) AS mismatch_days FROM audit_log
+        WHERE mismatch AND date >= $2 AND date <= $3{_ids}
+        GROUP BY driver_id
+    ), absences AS (
+        SELECT driver_id, COUNT(*) AS absence_days,
+               COUNT(*) FILTER (WHERE reason = ANY($4::text[])) AS unexcused_days,
+               jsonb_build_array({_weekday_counts()}) AS absence_weekdays
+        FROM driver_absences
+        WHERE date >= $2 AND date <= $3{_ids}
+        GROUP BY driver_id
+    ), reasons AS (
+        SELECT driver_id, jsonb_object_agg(reason, n) AS absence_reasons
+        FROM (SELECT driver_id, reason, COUNT(*) AS n FROM driver_absences
+              WHERE date >= $2 AND date <= $3{_ids}
+              GROUP BY driver_id, reason) r
+        GROUP BY driver_id
+    ), stats AS (
+        SELECT d.driver_id,
+               COALESCE(s.active_days, 0) AS active_days,
+               COALESCE(s.sij_count, 0) AS sij_count,
+               COALESCE(t.ritase_count, 0) AS ritase_count,
+               COALESCE(m.mismatch_days, 0) AS mismatch_days,
+               COALESCE(a.absence_days, 0) AS absence_days,
+               COALESCE(a.unexcused_days, 0) AS unexcused_days,
+               COALESCE(a.absence_weekdays, '[0, 0, 0, 0, 0, 0, 0]') AS absence_weekdays,
+               COALESCE(r.absence_reasons, '{{}}') AS absence_reasons
+        FROM drivers d
+        LEFT JOIN sij s ON s.driver_id = d.driver_id
+        LEFT JOIN trips t ON t.driver_id = d.driver_id
+        LEFT JOIN mismatches m ON m.driver_id = d.driver_id
+        LEFT JOIN absences a ON a.driver_id = d.driver_id
+        LEFT JOIN reasons r ON r.driver_id = d.driver_id{_stats_ids}
+    )
+    INSERT INTO driver_scores (driver_id, window_days, window_start, window_end,
+        active_days, attendance_rate, sij_count, ritase_count, sij_ritase_ratio,
+        mismatch_days, mismatch_rate, absence_days, unexcused_days,
+        absence_reasons, absence_weekdays, score, computed_at)
+    SELECT driver_id, $1::int, $2, $3,
+           active_days, round(active_days / $1::int::numeric, 4),
+           sij_count, ritase_count,
+           CASE WHEN ritase_count > 0 THEN round(sij_count / ritase_count::numeric, 4) END,
+           mismatch_days, round(mismatch_days / $1::int::numeric, 4),
+           absence_days, unexcused_days,
+           absence_reasons, absence_weekdays,
+           round(100 * ({SCORE_WEIGHTS['attendance']} * active_days
+                        + {SCORE_WEIGHTS['mismatch']} * ($1::int - mismatch_days)
+                        + {SCORE_WEIGHTS['unexcused']} * ($1::int - unexcused_days)) / $1::int::numeric, 1),
+           now()
+    FROM stats
+    ON CONFLICT (driver_id, window_days) DO UPDATE SET
+        window_start = EXCLUDED.window_start, window_end = EXCLUDED.window_end,
+        active_days = EXCLUDED.active_days, attendance_rate = EXCLUDED.attendance_rate,
+        sij_count = EXCLUDED.sij_count, ritase_count = EXCLUDED.ritase_count,
+        sij_ritase_ratio = EXCLUDED.sij_ritase_ratio,
+        mismatch_days = EXCLUDED.mismatch_days, mismatch_rate = EXCLUDED.mismatch_rate,
+        absence_days = EXCLUDED.absence_days, unexcused_days = EXCLUDED.unexcused_days,
+        absence_reasons = EXCLUDED.absence_reasons,
+        absence_weekdays = EXCLUDED.absence_weekdays,
+        score = EXCLUDED.score, computed_at = EXCLUDED.computed_at""")
+# Ranks among active drivers; everyone else is unranked.
+register_query(
+    "scores.rank", """UPDATE driver_scores s SET rank = r.rank
+    FROM (SELECT s.driver_id,
+                 CASE WHEN d.status = 'active'
+                      THEN rank() OVER (PARTITION BY d.status = 'active' ORDER BY s.score DESC)
+                 END AS rank
+          FROM driver_scores s JOIN drivers d ON d.driver_id = s.driver_id
+          WHERE s.window_days = $1) r
+    WHERE s.window_days = $1 AND s.driver_id = r.driver_id
+      AND s.rank IS DISTINCT FROM r.rank""")
+register_query(
+    "scores.prune", """DELETE FROM driver_scores s
+    WHERE NOT EXISTS (SELECT 1 FROM drivers d WHERE d.driver_id = s.driver_id)"""
+)
+register_query(
+    "scores.prune_drivers", """DELETE FROM driver_scores s
+    WHERE s.driver_id = ANY($1::text[])
+      AND NOT EXISTS (SELECT 1 FROM drivers d WHERE d.driver_id = s.driver_id)"""
+)
+register_query(
+    "scores.state",
+    "SELECT array_agg(DISTINCT window_days) AS windows, MIN(window_end) AS oldest FROM driver_scores"
+)
+# Takes exactly the rows visible to this transaction; changes committed
+# meanwhile stay queued for the next run.
+register_query("scores.take_changes",
+               "DELETE FROM driver_score_changes RETURNING driver_id")
+register_query(
+    "scores.card", """SELECT s.*,
+           (SELECT COUNT(c.rank) FROM driver_scores c
+            WHERE c.window_days = s.window_days) AS ranked_drivers
+    FROM driver_scores s WHERE s.driver_id = $1 ORDER BY s.window_days""")
+
+# Leaderboard filters: window, status, category and after (the cursor:
+# sort value, driver_id); $1 is the limit.
+for _col in SCORE_SORT_COLS:
+    _type = "float8" if SCORE_SORT_COLS[_col] is float else "integer"
+    for _direction, _op in (("ASC", ">"), ("DESC", "<")):
+        register_filtered_query(
+            f"scores.board:{_col}:{_direction}",
+            """SELECT s.driver_id, d.name, d.plate, d.category, d.status,
+           s.rank, s.score, s.attendance_rate, s.active_days, s.sij_count,
+           s.ritase_count, s.sij_ritase_ratio, s.mismatch_days, s.mismatch_rate,
+           s.absence_days, s.unexcused_days, s.window_start, s.window_end
+    FROM driver_scores s JOIN drivers d ON d.driver_id = s.driver_id""", {
+                "window": "s.window_days = {0}",
+                "status": "d.status = {0}",
+                "category": "d.category = {0}",
+                "after":
+                f"(s.{_col}, s.driver_id) {_op} ({{0}}::{_type}, {{1}}::text)",
+            }, f"""
+    ORDER BY s.{_col} {_direction}, s.driver_id {_direction}
+    LIMIT $1""")
+
+
+async def refresh_scores(conn, driver_ids: Optional[List[str]] = None,
+                         today=None):
+    """Recompute every window for ``driver_ids`` (all drivers if None)."""
+    today = today or datetime.now(JAKARTA_TZ).date()
+    if driver_ids is None:
+        await conn.execute(QUERIES["scores.prune"])
+    else:
+        await conn.execute(QUERIES["scores.prune_drivers"], driver_ids)
+    for window in SCORE_WINDOWS:
+        start = (today - timedelta(days=window - 1)).isoformat()
+        args = [window, start, today.isoformat(), UNEXCUSED_ABSENCE_REASONS]
+        if driver_ids is None:
+            await conn.execute(QUERIES["scores.refresh"], *args)
+        else:
+            await conn.execute(QUERIES["scores.refresh_drivers"], *args,
+                               driver_ids)
+        await conn.execute(QUERIES["scores.rank"], window)
+
+
+async def maintain_scores(conn, full: bool = False) -> Optional[int]:
+    """Bring driver_scores up to date; returns the drivers recomputed.
+
+    Run inside a transaction. Everyone is recomputed when the windows have
+    moved to a new day or SCORE_WINDOWS changed, otherwise only drivers
+    with logged changes. None when another worker holds the lock.
+    """
+    if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)",
+                               SCORE_LOCK_KEY):
+        return None
+    started = time.perf_counter()
+    today = datetime.now(JAKARTA_TZ).date()
+    state = await conn.fetchrow(QUERIES["scores.state"])
+    if (sorted(state['windows'] or []) != list(SCORE_WINDOWS)
+            or state['oldest'] != today.isoformat()):
+        full = True
+    changed = {
+        r['driver_id']
+        for r in await conn.fetch(QUERIES["scores.take_changes"])
+    }
+    if full:
+        await conn.execute(
+            "DELETE FROM driver_scores WHERE window_days <> ALL($1::int[])",
+            list(SCORE_WINDOWS))
+        driver_ids = None
+    elif not changed:
+        return 0
+    else:
+        driver_ids = sorted(changed)
+    await refresh_scores(conn, driver_ids, today)
+    metrics.observe("raja_score_refresh_seconds",
+                    (time.perf_counter() - started) * 1000)
+    if driver_ids is None:
+        return await conn.fetchval("SELECT COUNT(*) FROM drivers")
+    return len(driver_ids)
+
+
+async def score_maintenance_loop():
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await maintain_scores(conn)
+        except Exception as e:
+            logger.warning(f"Score maintenance failed: {e}")
+        await asyncio.sleep(SCORE_REFRESH_INTERVAL)
+
+
+def score_card(row) -> dict:
+    card = dict(row)
+    for col in ("absence_reasons", "absence_weekdays"):
+        card[col] = json_module.loads(card[col])
+    card.pop("driver_id")
+    return card
+
+
+@api_router.get("/scores")
+async def get_score_leaderboard(response: Response,
+                                window: int = SCORE_WINDOWS[0],
+                                sort_by: str = "score",
+                                sort_dir: str = "desc",
+                                status: str = "active",
+                                category: Optional[str] = None,
+                                limit: int = Query(SCORE_PAGE_SIZE,
+                                                   ge=1,
+                                                   le=SCORE_PAGE_MAX),
+                                cursor: Optional[str] = None,
+                                user: dict = Depends(get_current_user)):
+    """One page of the leaderboard for a window; ``status=""`` includes
+    suspended drivers (unranked).
+
+    When more rows follow, ``X-Next-Cursor`` carries the cursor for the
+    next page; pass it back with the same filters and sort.
+    """
+    if window not in SCORE_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=
+            f"Window tidak tersedia (pilih {', '.join(map(str, SCORE_WINDOWS))})"
+        )
+    if sort_by not in SCORE_SORT_COLS:
+        sort_by = "score"
+    key = (tuple(decode_cursor(cursor, [SCORE_SORT_COLS[sort_by], str]))
+           if cursor else None)
+    sql, args = sorted_filtered_query("scores.board",
+                                      sort_by,
+                                      sort_dir,
+                                      "score",
+                                      limit + 1,
+                                      window=window,
+                                      status=status or None,
+                                      category=category or None,
+                                      after=key)
+    rows = rows_to_list(await reporting_pool(user).fetch(sql, *args))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            [rows[-1][sort_by], rows[-1]["driver_id"]])
+    return rows
+
+
+@api_router.get("/scores/drivers/{driver_id}")
+async def get_driver_scorecard(driver_id: str,
+                               user: dict = Depends(get_current_user)):
+    db = reporting_pool(user)
+    driver = await db.fetchrow(
+        "SELECT driver_id, name, plate, category, status FROM drivers WHERE driver_id = $1",
+        driver_id)
+    if not driver:
+        raise HTTPException(status_code=404, detail="Driver tidak ditemukan")
+    rows = await db.fetch(QUERIES["scores.card"], driver_id)
+    return dict(driver, windows=[score_card(r) for r in rows])
+
+
+@api_router.post("/scores/refresh")
+async def refresh_driver_scores(user: dict = Depends(require_superadmin)):
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            drivers = await maintain_scores(conn, full=True)
+    if drivers is None:
+        raise HTTPException(status_code=409,
+                            detail="Perhitungan skor sedang berjalan")
+    return {"drivers": drivers, "windows": list(SCORE_WINDOWS)}
+
+
+# =================== INTERNAL ===================
+
+
+@api_router.get("/_internal/pool-stats")
+async def get_pool_stats(user: dict = Depends(require_superadmin)):
+    return {
+        "interactive": pool.stats() if pool else None,
+        "reporting": report_pool.stats() if report_pool else None,
+        "replica": replica_pool.stats() if replica_pool else None,
+        "config": {
+            "acquire_timeout": POOL_ACQUIRE_TIMEOUT,
+            "max_idle_lifetime": POOL_MAX_IDLE_LIFETIME,
+            "statement_timeout": STATEMENT_TIMEOUT,
+            "report_statement_timeout": REPORT_STATEMENT_TIMEOUT,
+            "replica_max_lag": REPLICA_MAX_LAG,
+            "read_your_writes_window": READ_YOUR_WRITES_WINDOW,
+        },
+    }
+
+
+@api_router.get("/_internal/query-stats")
+async def get_query_stats(user: dict = Depends(require_superadmin)):
+    return query_stats.snapshot()
+
+
+@api_router.get("/_internal/loop-stalls")
+async def get_loop_stalls(user: dict = Depends(require_superadmin)):
+    return {
+        "enabled": loop_watchdog.enabled,
+        "threshold_ms": LOOP_WATCHDOG_MS,
+        "stalls": list(loop_watchdog.stalls),
+    }
+
+
+@api_router.get("/_internal/profile")
+async def profile_server(seconds: float = Query(5.0,
+                                                gt=0,
+                                                le=PROFILE_MAX_SECONDS),
+                         interval_ms: float = Query(10.0, ge=1, le=1000),
+                         include_idle: bool = False,
+                         user: dict = Depends(require_superadmin)):
+    if profile_lock.locked():
+        raise HTTPException(status_code=409,
+                            detail="Profiling sedang berjalan")
+    async with profile_lock:
+        counts = await asyncio.to_thread(sample_stacks, seconds,
+                                         interval_ms / 1000, include_idle)
+    body = "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items()))
+    return Response(
+        body,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition":
+            f"attachment; filename=profile_{int(time.time())}.folded"
+        })
+
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=403,
+                            detail="Metrics nonaktif (METRICS_TOKEN belum diatur)")
+    if not hmac.compare_digest(
+            request.headers.get("authorization", "").encode(),
+            f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token tidak valid")
+    return Response(metrics.render(),
+                    media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# =================== PARTITIONING ===================
+# sij_transactions and ritase are range-partitioned by month on ``date``
+# ('YYYY-MM-DD' strings sort chronologically, so text ranges work).
+# Queries that filter on date only touch the partitions they need; the
+# dashboards and reports stay proportional to the current month instead
+# of the whole history. Partitions are named <table>_pYYYYMM; rows whose
+# month has no partition yet land in <table>_default and are moved out by
+# the maintenance task, which also creates PARTITION_MONTHS_AHEAD months in
+# advance. A pre-existing unpartitioned table is migrated in place on the
+# first startup (see create_partitioned_table).
+
+PARTITIONED_TABLES = ("sij_transactions", "ritase")
+PARTITION_MONTHS_AHEAD = _env_int('PARTITION_MONTHS_AHEAD', 3)
+PARTITION_MAINTENANCE_INTERVAL = _env_float('PARTITION_MAINTENANCE_INTERVAL',
+                                            6 * 3600)
+_MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def month_bounds(month: str) -> tuple:
+    """('YYYY-MM-01', first day of the next month) for a 'YYYY-MM' month."""
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{month}-01", f"{year + mon // 12:04d}-{mon % 12 + 1:02d}-01"
+
+
+def months_between(start, end) -> List[str]:
+    months = []
+    year, mon = start.year, start.month
+    while (year, mon) <= (end.year, end.month):
+        months.append(f"{year:04d}-{mon:02d}")
+        year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return months
+
+
+async def ensure_partitions(db, table: str, months) -> List[str]:
+    """Create the monthly partitions of ``table`` for ``months``.
+
+    Rows of those months already sitting in the default partition are
+    moved into the new partition before it is attached. Callers hold
+    SCHEMA_LOCK_KEY so workers cannot race on the DDL.
+    """
+    created = []
+    default = f"{table}_default"
+    for month in sorted(set(months)):
+        if not _MONTH_RE.match(month):
+            continue
+        name = f"{table}_p{month.replace('-', '')}"
+        if await db.fetchval("SELECT to_regclass($1)", name):
+            continue
+        start, end = month_bounds(month)
+        stray = await db.fetchval(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE date >= $1 AND date < $2)",
+            start, end)
+        if stray:
+            await db.execute(
+                f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            await db.execute(
+                f"""WITH moved AS (DELETE FROM {default} WHERE date >= $1 AND date < $2 RETURNING *)
+                INSERT INTO {name} SELECT * FROM moved""", start, end)
+            await db.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        else:
+            await db.execute(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        created.append(name)
+    return created
+
+
+async def create_partitioned_table(db, table: str, columns: str):
+    """CREATE the partitioned ``table``, migrating an old heap table.
+
+    An unpartitioned table from an earlier release is renamed aside (with
+    its indexes and serial sequences), its rows are copied into monthly
+    partitions and it is dropped, all inside the caller's schema
+    transaction. The copy is a single INSERT ... SELECT; for very large
+    histories run it off-peak with a long enough statement timeout.
+    """
+    relkind = await db.fetchval(
+        "SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)", table)
+    legacy = None
+    if relkind == 'r':
+        legacy = f"{table}_unpartitioned"
+        await db.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        for idx in await db.fetch(
+                "SELECT indexname FROM pg_indexes WHERE tablename = $1",
+                legacy):
+            await db.execute(
+                f"ALTER INDEX {idx['indexname']} RENAME TO {idx['indexname'][:48]}_unpartitioned"
+            )
+        for seq in await db.fetch(
+                """SELECT s.relname FROM pg_class s JOIN pg_depend d ON d.objid = s.oid
+                WHERE s.relkind = 'S' AND d.refobjid = $1::regclass AND d.deptype IN ('a', 'i')""",
+                legacy):
+            await db.execute(
+                f"ALTER SEQUENCE {seq['relname']} RENAME TO {seq['relname'][:48]}_unpartitioned"
+            )
+    await db.execute(
+        f"CREATE TABLE IF NOT EXISTS {table} ({columns}) PARTITION BY RANGE (date)"
+    )
+    await db.execute(
+        f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+    )
+    await db.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_date_driver ON {table} (date, driver_id)"
+    )
+    await db.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_driver_date ON {table} (driver_id, date)"
+    )
+    if legacy is None:
+        return
+
+    def table_columns(name):
+        return db.fetch(
+            "SELECT attname FROM pg_attribute WHERE attrelid = $1::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+            name)
+
+    legacy_cols = {r['attname'] for r in await table_columns(legacy)}
+    cols = [
+        r['attname'] for r in await table_columns(table)
+        if r['attname'] in legacy_cols
+    ]
+    # The partition key is NOT NULL now; undated rows fall back to the day
+    # they were created (or the default partition).
+    select = ", ".join("COALESCE(date, left(created_at, 10), '')" if c ==
+                       "date" else c for c in cols)
+    months = [
+        r['month'] for r in await db.fetch(
+            f"SELECT DISTINCT left(COALESCE(date, left(created_at, 10)), 7) AS month FROM {legacy}"
+        ) if r['month']
+    ]
+    await ensure_partitions(db, table, months)
+    moved = await db.execute(
+        f"INSERT INTO {table} ({', '.join(cols)}) SELECT {select} FROM {legacy}"
+    )
+    if "id" in cols:
+        await db.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), max(id)) FROM {table}"
+        )
+    await db.execute(f"DROP TABLE {legacy}")
+    logger.info(f"Partitioned {table}: {moved.split()[-1]} rows moved into "
+                f"{len(set(months))} monthly partitions")
+
+
+async def maintain_partitions(db, today=None) -> List[str]:
+    """Create upcoming partitions and drain months out of the defaults."""
+    today = today or datetime.now(JAKARTA_TZ).date()
+    ahead = today + timedelta(days=31 * PARTITION_MONTHS_AHEAD)
+    created = []
+    for table in PARTITIONED_TABLES:
+        stray = await db.fetch(
+            f"SELECT DISTINCT left(date, 7) AS month FROM {table}_default")
+        months = months_between(today.replace(day=1), ahead)
+        created += await ensure_partitions(
+            db, table, months + [r['month'] for r in stray])
+    return created
+
+
+async def partition_maintenance_loop():
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                                       SCHEMA_LOCK_KEY)
+                    created = await maintain_partitions(conn)
+            if created:
+                logger.info(f"Created partitions: {', '.join(created)}")
+        except Exception as e:
+            logger.warning(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
 # =================== SEED DATA ===================
 
 ADMIN_NAMES = {
@@ -1853,8 +6535,8 @@ DRIVER_NAMES = [
 ]
 
 
-async def create_tables():
-    await pool.execute("""
+async def create_tables(db):
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS users (
             user_id VARCHAR(50) PRIMARY KEY,
             name VARCHAR(100) NOT NULL,
@@ -1864,7 +6546,7 @@ async def create_tables():
             password_hash TEXT NOT NULL
         )
     """)
-    await pool.execute("""
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS drivers (
             driver_id VARCHAR(50) PRIMARY KEY,
             name VARCHAR(100) NOT NULL,
@@ -1876,13 +6558,25 @@ async def create_tables():
             total_sij_month INTEGER DEFAULT 0
         )
     """)
-    await pool.execute("""
-        CREATE TABLE IF NOT EXISTS sij_transactions (
-            transaction_id VARCHAR(100) PRIMARY KEY,
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS pool_zones (
+            zone_id VARCHAR(50) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL
+        )
+    """)
+    await db.execute(
+        "ALTER TABLE drivers ADD COLUMN IF NOT EXISTS zone_id VARCHAR(50) REFERENCES pool_zones(zone_id) ON DELETE SET NULL"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_drivers_zone_status ON drivers (zone_id, status)"
+    )
+    await create_partitioned_table(
+        db, "sij_transactions", """
+            transaction_id VARCHAR(100) NOT NULL,
             driver_id VARCHAR(50) NOT NULL,
             driver_name VARCHAR(100),
             category VARCHAR(20),
-            date VARCHAR(10),
+            date VARCHAR(10) NOT NULL,
             time VARCHAR(10),
             sheets INTEGER DEFAULT 5,
             amount INTEGER DEFAULT 0,
@@ -1891,10 +6585,10 @@ async def create_tables():
             admin_name VARCHAR(100),
             shift VARCHAR(10),
             status VARCHAR(20) DEFAULT 'active',
-            created_at TEXT
-        )
-    """)
-    await pool.execute("""
+            created_at TEXT,
+            PRIMARY KEY (transaction_id, date)
+        """)
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS audit_log (
             id SERIAL PRIMARY KEY,
             date VARCHAR(10) NOT NULL,
@@ -1905,9 +6599,15 @@ async def create_tables():
             UNIQUE(date, driver_id)
         )
     """)
-    await pool.execute("""
-        CREATE TABLE IF NOT EXISTS ritase (
-            id SERIAL PRIMARY KEY,
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_driver_date ON audit_log (driver_id, date)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_mismatch ON audit_log (date, driver_id) WHERE mismatch"
+    )
+    await create_partitioned_table(
+        db, "ritase", """
+            id SERIAL,
             driver_id VARCHAR(50) NOT NULL,
             driver_name VARCHAR(100),
             date VARCHAR(10) NOT NULL,
@@ -1916,22 +6616,36 @@ async def create_tables():
             admin_id VARCHAR(50),
             admin_name VARCHAR(100),
             shift VARCHAR(10),
-            created_at TEXT
-        )
-    """)
+            created_at TEXT,
+            PRIMARY KEY (id, date)
+        """)
     for col in ["trip_details", "origin", "destination", "passengers"]:
         try:
-            await pool.execute(
+            await db.execute(
                 f"ALTER TABLE ritase DROP COLUMN IF EXISTS {col}")
         except Exception:
             pass
     try:
-        await pool.execute(
+        await db.execute(
             "ALTER TABLE ritase ADD COLUMN IF NOT EXISTS waktu_ritase VARCHAR(20) DEFAULT ''"
         )
     except Exception:
         pass
-    await pool.execute("""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id VARCHAR(50) NOT NULL,
+            key VARCHAR(100) NOT NULL,
+            endpoint VARCHAR(30) NOT NULL,
+            request_hash CHAR(32) NOT NULL,
+            response TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (user_id, key)
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)"
+    )
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS driver_absences (
             id SERIAL PRIMARY KEY,
             driver_id VARCHAR(50) NOT NULL,
@@ -1940,115 +6654,490 @@ async def create_tables():
             UNIQUE(driver_id, date)
         )
     """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS manual_ritase_override (
+            id SERIAL PRIMARY KEY,
+            driver_id VARCHAR(50) NOT NULL,
+            date VARCHAR(10) NOT NULL,
+            manual_rts INTEGER NOT NULL,
+            updated_by VARCHAR(100),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE(driver_id, date)
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS print_jobs (
+            job_id VARCHAR(50) PRIMARY KEY,
+            printer VARCHAR(60) NOT NULL,
+            transaction_id VARCHAR(50),
+            bytes INTEGER NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL,
+            finished_at TIMESTAMPTZ
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_print_jobs_created ON print_jobs (created_at DESC)")
+    await create_search_indexes(db)
+    await maintain_partitions(db)
+    await create_analytics_capture(db)
+    await create_driver_scores(db)
+    await db.execute(f"""
+        CREATE OR REPLACE FUNCTION raja_notify_driver() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{EVENT_CHANNEL_PREFIX}driver', json_build_object(
+                    'op', TG_OP, 'driver_id', OLD.driver_id)::text);
+                RETURN OLD;
+            END IF;
+            PERFORM pg_notify('{EVENT_CHANNEL_PREFIX}driver', json_build_object(
+                'op', TG_OP, 'driver_id', NEW.driver_id,
+                'row', row_to_json(NEW))::text);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    await db.execute("""
+        CREATE OR REPLACE TRIGGER drivers_notify AFTER INSERT OR UPDATE OR DELETE
+        ON drivers FOR EACH ROW EXECUTE FUNCTION raja_notify_driver()
+    """)
+
+
+TRGM_AVAILABLE = False
+SCHEMA_LOCK_KEY = 7261001
+
+
+async def create_search_indexes(db):
+    """Indexes behind the ILIKE searches and /api/drivers/search.
+
+    Prefix (text_pattern_ops) indexes are always created. GIN trigram
+    indexes are added when pg_trgm can be enabled; without them substring
+    searches fall back to plain ILIKE scans.
+    """
+    global TRGM_AVAILABLE
+    for col in ["lower(name)", "lower(driver_id)", "lower(plate)", "phone"]:
+        idx_name = col.replace("lower(", "").rstrip(")")
+        await db.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_drivers_{idx_name}_prefix ON drivers ({col} text_pattern_ops)"
+        )
+    try:
+        # Savepoint: a failed CREATE EXTENSION must not abort the caller's
+        # schema transaction.
+        async with db.transaction():
+            await db.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        TRGM_AVAILABLE = True
+    except Exception as e:
+        TRGM_AVAILABLE = bool(await db.fetchval(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+        if not TRGM_AVAILABLE:
+            logger.warning(
+                f"pg_trgm unavailable ({e}); driver search uses ILIKE scans")
+            return
+    trgm_columns = {
+        "drivers": ["name", "driver_id", "plate", "phone"],
+        "sij_transactions": ["driver_name", "driver_id", "transaction_id"],
+        "ritase": ["driver_name", "driver_id"],
+    }
+    for table, cols in trgm_columns.items():
+        for col in cols:
+            await db.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_{col}_trgm ON {table} USING gin ({col} gin_trgm_ops)"
+            )
+
+
+SEED_USERS = [
+    ("admin1", "Admin 1", "admin", "Shift1", "admin1@raja.id", "admin123"),
+    ("admin2", "Admin 2", "admin", "Shift1", "admin2@raja.id", "admin123"),
+    ("admin3", "Admin 3", "admin", "Shift2", "admin3@raja.id", "admin123"),
+    ("admin4", "Admin 4", "admin", "Shift2", "admin4@raja.id", "admin123"),
+    ("superadmin", "Super Admin", "superadmin", None, "superadmin@raja.id",
+     "superadmin123"),
+]
+SEED_COLUMNS = {
+    "users":
+    ["user_id", "name", "role", "shift", "email", "password_hash"],
+    "drivers": [
+        "driver_id", "name", "phone", "plate", "category", "status",
+        "mismatch_count", "total_sij_month"
+    ],
+    "sij_transactions": [
+        "transaction_id", "driver_id", "driver_name", "category", "date",
+        "time", "sheets", "amount", "qris_ref", "admin_id", "admin_name",
+        "shift", "status", "created_at"
+    ],
+    "ritase": [
+        "driver_id", "driver_name", "date", "waktu_ritase", "notes",
+        "admin_id", "admin_name", "shift", "created_at"
+    ],
+    "driver_absences": ["driver_id", "date", "reason"],
+    "audit_log": ["date", "driver_id", "has_sij", "has_trip", "mismatch"],
+}
+SEED_COPY_BATCH = _env_int('SEED_COPY_BATCH', 5000)
+SEED_RANDOM_SEED = _env_int('SEED_RANDOM_SEED', 2025)
+# Demo fleet loaded on first startup: fixed statuses so the UI always has
+# suspended and warned drivers to show.
+DEMO_STATUS = {
+    "driver003": "suspend",
+    "driver007": "suspend",
+    "driver015": "suspend",
+    "driver010": "warning",
+    "driver020": "warning",
+    "driver030": "warning",
+    "driver040": "warning",
+}
+# Weighted distributions observed at the pool counter.
+SEED_SHIFT_WEIGHTS = {"Shift1": 55, "Shift2": 45}
+SEED_SHIFT_HOURS = {
+    "Shift1": list(range(7, 17)),
+    "Shift2": list(range(17, 24)) + list(range(0, 7)),
+}
+SEED_SHIFT_ADMINS = {
+    "Shift1": ["admin1", "admin2"],
+    "Shift2": ["admin3", "admin4"],
+}
+SEED_SHEETS_WEIGHTS = {1: 4, 2: 8, 3: 18, 4: 24, 5: 26, 6: 12, 7: 8}
+SEED_ABSENCE_WEIGHTS = {
+    "SAKIT": 30,
+    "IZIN": 25,
+    "TANPA KETERANGAN": 15,
+    "UNIT MAINTENANCE": 10,
+    "CUTI": 8,
+    "GANTI UNIT": 5,
+    "GANGGUAN G.A.": 4,
+    "PINDAH PREMIUM": 1,
+    "TAKEDOWN": 1,
+    "AKUN BLOKIR": 1,
+}
+
+
+class SeedWriter:
+    """Buffers rows per table and writes them with COPY in fixed batches."""
+
+    def __init__(self, db, batch_size: int = SEED_COPY_BATCH):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.buffers = {table: [] for table in SEED_COLUMNS}
+        self.counts = {table: 0 for table in SEED_COLUMNS}
+
+    async def add(self, table: str, row: tuple):
+        buf = self.buffers[table]
+        buf.append(row)
+        if len(buf) >= self.batch_size:
+            await self._copy(table)
+
+    async def _copy(self, table: str):
+        rows = self.buffers[table]
+        if not rows:
+            return
+        await self.db.copy_records_to_table(table,
+                                            records=rows,
+                                            columns=SEED_COLUMNS[table])
+        self.counts[table] += len(rows)
+        self.buffers[table] = []
+
+    async def flush(self):
+        for table in SEED_COLUMNS:
+            await self._copy(table)
+
+
+def _weighted(rng: random.Random, weights: dict):
+    return rng.choices(list(weights), list(weights.values()))[0]
+
+
+async def seed_fleet(db,
+                     drivers: int,
+                     days: int,
+                     seed: int,
+                     today=None,
+                     include_today: bool = False,
+                     id_width: int = 5,
+                     statuses: Optional[dict] = None,
+                     batch_size: int = SEED_COPY_BATCH) -> dict:
+    """Bulk-load users, ``drivers`` drivers and ``days`` days of history.
+
+    Everything is drawn from ``random.Random(seed)``, so the same arguments
+    (and ``today``) always produce the same rows. Rows go out with COPY in
+    batches of ``batch_size``; drivers are written last so their
+    ``total_sij_month`` and ``mismatch_count`` come from the generated
+    history instead of per-driver queries. ``statuses`` pins driver
+    statuses; without it they are drawn at random. Today is left empty
+    unless ``include_today`` is set.
+    """
+    rng = random.Random(seed)
+    today = today or datetime.now(JAKARTA_TZ).date()
+    writer = SeedWriter(db, batch_size)
+    # Same lock as schema changes; a no-op when the caller already holds it.
+    await db.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_KEY)
+    for table in PARTITIONED_TABLES:
+        await ensure_partitions(
+            db, table, months_between(today - timedelta(days=days), today))
+
+    hashes = {}
+    for user_id, name, role, shift, email, pwd in SEED_USERS:
+        if pwd not in hashes:
+            hashes[pwd] = bcrypt.hashpw(pwd.encode(),
+                                        bcrypt.gensalt()).decode()
+        await writer.add("users",
+                         (user_id, name, role, shift, email, hashes[pwd]))
+
+    fleet = []
+    for i in range(drivers):
+        driver_id = f"driver{i + 1:0{id_width}d}"
+        if statuses is not None:
+            status = statuses.get(driver_id, "active")
+        else:
+            status = rng.choices(["active", "warning", "suspend"],
+                                 [90, 6, 4])[0]
+        name = DRIVER_NAMES[i % len(DRIVER_NAMES)]
+        fleet.append({
+            "driver_id": driver_id,
+            "name": name if drivers <= len(DRIVER_NAMES) else f"{name} {i + 1}",
+            "phone": f"0812{10000000 + i:08d}",
+            "plate":
+            f"B {1000 + i} {rng.choice('ABCDEFGHJK')}{rng.choice('XYZ')}",
+            "category": "premium" if i % 3 == 0 else "standar",
+            "status": status,
+            # Some drivers work the counter nearly every day, others rarely.
+            "turnout": rng.uniform(0.45, 0.9),
+        })
+    on_duty = [d for d in fleet if d["status"] != "suspend"]
+
+    mismatches = {}
+    month_counts = {}
+    current_month = today.strftime("%Y-%m")
+    first_offset = 0 if include_today else 1
+    for offset in range(first_offset, days + first_offset):
+        day = today - timedelta(days=offset)
+        date_iso = day.strftime("%Y-%m-%d")
+        date_compact = day.strftime("%Y%m%d")
+        for d in on_duty:
+            did = d["driver_id"]
+            has_sij = rng.random() < d["turnout"]
+            voided = False
+            shift = _weighted(rng, SEED_SHIFT_WEIGHTS)
+            if has_sij:
+                time_str = (f"{rng.choice(SEED_SHIFT_HOURS[shift]):02d}:"
+                            f"{rng.randint(0, 59):02d}:00")
+                admin_id = rng.choice(SEED_SHIFT_ADMINS[shift])
+                sheets = _weighted(rng, SEED_SHEETS_WEIGHTS)
+                voided = rng.random() < 0.01
+                await writer.add(
+                    "sij_transactions",
+                    (f"{did}{date_compact}{rng.randint(100, 999)}", did,
+                     d["name"], d["category"], date_iso, time_str, sheets,
+                     PRICE_MAP.get(d["category"], 40000),
+                     f"QRIS{rng.randint(100000, 999999)}", admin_id,
+                     ADMIN_NAMES[admin_id], shift,
+                     "void" if voided else "active",
+                     f"{date_iso}T{time_str}+07:00"))
+                if not voided and date_iso.startswith(current_month):
+                    month_counts[did] = month_counts.get(did, 0) + 1
+            trips = rng.choices([1, 2, 3], [50, 35, 15])[0] if has_sij else (
+                1 if rng.random() < 0.03 else 0)
+            for _ in range(trips):
+                hour = rng.choice(SEED_SHIFT_HOURS[shift])
+                admin_id = rng.choice(SEED_SHIFT_ADMINS[shift])
+                await writer.add(
+                    "ritase",
+                    (did, d["name"], date_iso,
+                     f"{hour:02d}:{rng.randint(0, 59):02d}", "", admin_id,
+                     ADMIN_NAMES[admin_id], shift,
+                     f"{date_iso}T{hour:02d}:00:00+07:00"))
+            active_sij = has_sij and not voided
+            if not has_sij and not trips and rng.random() < 0.25:
+                await writer.add(
+                    "driver_absences",
+                    (did, date_iso, _weighted(rng, SEED_ABSENCE_WEIGHTS)))
+            if has_sij or trips:
+                mismatch = bool(trips) and not active_sij
+                await writer.add("audit_log", (date_iso, did, active_sij,
+                                               bool(trips), mismatch))
+                if mismatch:
+                    mismatches[did] = mismatches.get(did, 0) + 1
+
+    for d in fleet:
+        did = d["driver_id"]
+        await writer.add("drivers",
+                         (did, d["name"], d["phone"], d["plate"],
+                          d["category"], d["status"], mismatches.get(did, 0),
+                          month_counts.get(did, 0)))
+    await writer.flush()
+    return {
+        **writer.counts,
+        "active_driver_ids":
+        [d["driver_id"] for d in fleet if d["status"] == "active"],
+    }
 
 
-async def seed_initial_data():
-    count = await pool.fetchval("SELECT COUNT(*) FROM users")
+async def seed_initial_data(db):
+    count = await db.fetchval("SELECT COUNT(*) FROM users")
     if count > 0:
         return
     logger.info("Seeding initial data...")
-    users = [
-        ("admin1", "Admin 1", "admin", "Shift1", "admin1@raja.id", "admin123"),
-        ("admin2", "Admin 2", "admin", "Shift1", "admin2@raja.id", "admin123"),
-        ("admin3", "Admin 3", "admin", "Shift2", "admin3@raja.id", "admin123"),
-        ("admin4", "Admin 4", "admin", "Shift2", "admin4@raja.id", "admin123"),
-        ("superadmin", "Super Admin", "superadmin", None, "superadmin@raja.id",
-         "superadmin123"),
-    ]
-    for user_id, name, role, shift, email, pwd in users:
-        password_hash = bcrypt.hashpw(pwd.encode(), bcrypt.gensalt()).decode()
-        await pool.execute(
-            "INSERT INTO users (user_id, name, role, shift, email, password_hash) VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT DO NOTHING",
-            user_id, name, role, shift, email, password_hash)
-
-    SUSPEND_IDS = {"driver003", "driver007", "driver015"}
-    WARNING_IDS = {"driver010", "driver020", "driver030", "driver040"}
-    MISMATCH_DATA = {
-        "driver001": 3,
-        "driver005": 2,
-        "driver012": 1,
-        "driver023": 2,
-        "driver037": 1
-    }
+    counts = await seed_fleet(db,
+                              len(DRIVER_NAMES),
+                              7,
+                              SEED_RANDOM_SEED,
+                              include_today=True,
+                              id_width=3,
+                              statuses=DEMO_STATUS)
+    logger.info(
+        f"Seed selesai: {counts['users']} users, {counts['drivers']} drivers, "
+        f"{counts['sij_transactions']} SIJ transactions")
+
+
+def make_ssl_context() -> ssl.SSLContext:
+    ssl_ctx = ssl.create_default_context()
+    ssl_ctx.check_hostname = False
+    ssl_ctx.verify_mode = ssl.CERT_NONE
+    return ssl_ctx
+
+
+def is_transaction_pooled(database_url: str) -> bool:
+    return 'pgbouncer=true' in database_url
+
+
+def strip_pgbouncer_flag(database_url: str) -> str:
+    return database_url.replace('?pgbouncer=true',
+                                '').replace('&pgbouncer=true', '')
+
+
+async def create_db_pool(name: str,
+                         database_url: str,
+                         min_size: int,
+                         max_size: int,
+                         command_timeout: float,
+                         max_lag: Optional[float] = None) -> TrackedPool:
+    ssl_ctx = make_ssl_context()
+    # Session mode keeps every registered statement prepared per
+    # connection (plus headroom for filter combinations and ad-hoc SQL);
+    # transaction-mode pgbouncer cannot hold named statements, so asyncpg
+    # falls back to unnamed extended-protocol statements with the same
+    # stable text.
+    pool_kwargs = dict(min_size=min_size,
+                       max_size=max_size,
+                       ssl=ssl_ctx,
+                       command_timeout=command_timeout,
+                       max_inactive_connection_lifetime=POOL_MAX_IDLE_LIFETIME,
+                       statement_cache_size=len(QUERIES) +
+                       2 * len(FILTERED_QUERIES) + 64)
+    if is_transaction_pooled(database_url):
+        database_url = strip_pgbouncer_flag(database_url)
+        pool_kwargs['statement_cache_size'] = 0
+    raw = await asyncpg.create_pool(database_url, **pool_kwargs)
+    logger.info(
+        f"Pool '{name}' ready (min={min_size}, max={max_size}), "
+        f"{len(QUERIES)} registered statements "
+        f"{'unnamed (transaction pooling)' if pool_kwargs['statement_cache_size'] == 0 else 'prepared per connection'}"
+    )
+    return TrackedPool(name, raw, min_size, max_size, max_lag)
 
-    for i in range(50):
-        did = f"driver{str(i+1).zfill(3)}"
-        status = "suspend" if did in SUSPEND_IDS else (
-            "warning" if did in WARNING_IDS else "active")
-        await pool.execute(
-            "INSERT INTO drivers (driver_id, name, phone, plate, category, status, mismatch_count, total_sij_month) VALUES ($1, $2, $3, $4, $5, $6, $7, $8) ON CONFLICT DO NOTHING",
-            did, DRIVER_NAMES[i], f"0812{str(10000000+i).zfill(8)}",
-            f"B {1000+i} XY", "premium" if i % 3 == 0 else "standar", status,
-            MISMATCH_DATA.get(did, 0), 0)
-
-    active_dids = [
-        f"driver{str(i+1).zfill(3)}" for i in range(50)
-        if f"driver{str(i+1).zfill(3)}" not in SUSPEND_IDS
-    ]
-    used_per_day = {}
-    for i in range(7):
-        day = (datetime.now(JAKARTA_TZ) -
-               timedelta(days=i)).strftime("%Y-%m-%d")
-        used_per_day[day] = set()
-
-    tx_count = 0
-    attempts = 0
-    while tx_count < 200 and attempts < 3000:
-        attempts += 1
-        day_offset = random.randint(0, 6)
-        now_j = datetime.now(JAKARTA_TZ)
-        day = (now_j - timedelta(days=day_offset)).strftime("%Y-%m-%d")
-        date_compact = (now_j - timedelta(days=day_offset)).strftime("%Y%m%d")
-        did = random.choice(active_dids)
-        if did in used_per_day[day]:
-            continue
-        used_per_day[day].add(did)
-        shift = random.choice(["Shift1", "Shift2"])
-        admin_id = random.choice(["admin1", "admin2"] if shift ==
-                                 "Shift1" else ["admin3", "admin4"])
-        sheets = random.randint(1, 7)
-        hour = random.randint(7, 16) if shift == "Shift1" else random.choice(
-            list(range(17, 24)) + list(range(0, 7)))
-        time_str = f"{str(hour).zfill(2)}:{random.randint(0,59):02d}:00"
-        tx_id = f"{did}{date_compact}{random.randint(100,999)}"
-        driver_idx = int(did[6:]) - 1
-        await pool.execute(
-            """INSERT INTO sij_transactions (transaction_id, driver_id, driver_name, category, date, time, sheets, amount, qris_ref, admin_id, admin_name, shift, status, created_at)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14) ON CONFLICT DO NOTHING""",
-            tx_id, did, DRIVER_NAMES[driver_idx],
-            "premium" if driver_idx % 3 == 0 else "standar", day, time_str,
-            sheets, 40000, f"QRIS{random.randint(100000,999999)}", admin_id,
-            ADMIN_NAMES[admin_id], shift, "active", f"{day}T{time_str}+07:00")
-        tx_count += 1
-
-    current_month = datetime.now(JAKARTA_TZ).strftime("%Y-%m")
-    month_prefix = f"{current_month}%"
-    for did in active_dids:
-        cnt = await pool.fetchval(
-            "SELECT COUNT(*) FROM sij_transactions WHERE driver_id = $1 AND date LIKE $2 AND status = 'active'",
-            did, month_prefix)
-        await pool.execute(
-            "UPDATE drivers SET total_sij_month = $1 WHERE driver_id = $2",
-            cnt, did)
-
-    for day_offset in range(7):
-        day = (datetime.now(JAKARTA_TZ) -
-               timedelta(days=day_offset)).strftime("%Y-%m-%d")
-        for did in active_dids[:30]:
-            has_sij = did in used_per_day.get(day, set())
-            has_trip = random.choice([True, True, False])
-            await pool.execute(
-                """INSERT INTO audit_log (date, driver_id, has_sij, has_trip, mismatch)
-                VALUES ($1, $2, $3, $4, $5) ON CONFLICT (date, driver_id) DO NOTHING""",
-                day, did, has_sij, has_trip, has_trip and not has_sij)
 
-    logger.info(
-        f"Seed selesai: 5 users, 50 drivers, {tx_count} SIJ transactions")
+async def pool_health_loop():
+    while True:
+        await asyncio.sleep(POOL_HEALTHCHECK_INTERVAL)
+        for p in (pool, report_pool, replica_pool):
+            if p is not None:
+                await p.health_check()
+
+
+background_tasks: List[asyncio.Task] = []
+
+
+DB_RECONNECT_INTERVAL = _env_float('DB_RECONNECT_INTERVAL', 10.0)
+
+
+async def connect_database(database_url: str) -> bool:
+    global pool, report_pool
+    try:
+        pool = await create_db_pool("interactive", database_url,
+                                    POOL_MIN_SIZE, POOL_MAX_SIZE,
+                                    STATEMENT_TIMEOUT)
+        if REPORT_POOL_MAX_SIZE > 0:
+            report_pool = await create_db_pool("reporting", database_url,
+                                               REPORT_POOL_MIN_SIZE,
+                                               REPORT_POOL_MAX_SIZE,
+                                               REPORT_STATEMENT_TIMEOUT)
+        # Every worker runs this; the transaction-scoped advisory lock makes
+        # them take turns so concurrent DDL cannot collide (and it holds
+        # under transaction-mode pgbouncer, unlike a session lock).
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                                   SCHEMA_LOCK_KEY)
+                await create_tables(conn)
+                await seed_initial_data(conn)
+        logger.info("Database connection established successfully.")
+        return True
+    except Exception as e:
+        logger.warning(
+            f"Failed to connect to database: {e}. Counter writes are "
+            f"buffered offline; retrying every {DB_RECONNECT_INTERVAL:g}s.")
+        for p in (pool, report_pool):
+            if p is not None:
+                with contextlib.suppress(Exception):
+                    await asyncio.wait_for(p.close(), 5)
+        pool = report_pool = None
+        return False
+
+
+async def reconnect_database(database_url: str):
+    # Counter writes go to the offline buffer meanwhile; once the pool is
+    # up they are replayed straight away.
+    while not await connect_database(database_url):
+        await asyncio.sleep(DB_RECONNECT_INTERVAL)
+    await start_database_services(database_url)
+    await offline_buffer.replay()
+
+
+async def start_database_services(database_url: str):
+    global replica_pool
+    listen_url = os.environ.get('DATABASE_LISTEN_URL') or (
+        None if is_transaction_pooled(database_url) else database_url)
+    if listen_url:
+        try:
+            await event_bus.start(listen_url)
+        except Exception as e:
+            logger.warning(
+                f"Event bus unavailable ({e}); in-process caches are bypassed"
+            )
+    else:
+        logger.info("No session-mode URL for LISTEN; event bus disabled")
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        try:
+            replica_pool = await create_db_pool("replica",
+                                                replica_url,
+                                                REPLICA_POOL_MIN_SIZE,
+                                                REPLICA_POOL_MAX_SIZE,
+                                                REPORT_STATEMENT_TIMEOUT,
+                                                max_lag=REPLICA_MAX_LAG)
+            await replica_pool.health_check()
+        except Exception as e:
+            logger.warning(
+                f"Failed to connect to read replica: {e}. "
+                "Reporting queries will use the primary.")
+    if POOL_HEALTHCHECK_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(pool_health_loop()))
+    background_tasks.append(asyncio.create_task(idempotency_purge_loop()))
+    background_tasks.append(asyncio.create_task(partition_maintenance_loop()))
+    if SCORE_REFRESH_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(score_maintenance_loop()))
+    if ANALYTICS_DUCKDB:
+        background_tasks.append(asyncio.create_task(analytics_refresh_loop()))
+    if DASHBOARD_WS_HEARTBEAT > 0:
+        background_tasks.append(
+            asyncio.create_task(dashboard_hub.heartbeat_loop()))
 
 
 @app.on_event("startup")
 async def startup_event():
-    global pool
+    if LOOP_LAG_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(loop_lag_monitor()))
+    if LOOP_WATCHDOG_MS > 0:
+        loop_watchdog.start()
     database_url = os.environ.get('SUPABASE_DATABASE_URL') or os.environ.get(
         'DATABASE_URL')
     if not database_url:
@@ -2057,29 +7146,28 @@ async def startup_event():
             "Database features will be unavailable until configured."
         )
         return
-    try:
-        ssl_ctx = ssl.create_default_context()
-        ssl_ctx.check_hostname = False
-        ssl_ctx.verify_mode = ssl.CERT_NONE
-        pool_kwargs = dict(min_size=2, max_size=10, ssl=ssl_ctx)
-        if 'pgbouncer=true' in database_url:
-            database_url = database_url.replace('?pgbouncer=true',
-                                                '').replace('&pgbouncer=true', '')
-            pool_kwargs['statement_cache_size'] = 0
-        pool = await asyncpg.create_pool(database_url, **pool_kwargs)
-        await create_tables()
-        await seed_initial_data()
-        logger.info("Database connection established successfully.")
-    except Exception as e:
-        logger.warning(
-            f"Failed to connect to database during startup: {e}. "
-            "Server will continue running but database features will be unavailable."
-        )
+    background_tasks.append(asyncio.create_task(offline_replay_loop()))
+    if not await connect_database(database_url):
+        background_tasks.append(
+            asyncio.create_task(reconnect_database(database_url)))
+        return
+    await start_database_services(database_url)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global pool
+    global pool, report_pool, replica_pool
+    loop_watchdog.stop()
+    for task in background_tasks:
+        task.cancel()
+    await print_spooler.stop()
+    if analytics is not None:
+        analytics.close()
+    await event_bus.stop()
+    if replica_pool:
+        await replica_pool.close()
+    if report_pool:
+        await report_pool.close()
     if pool:
         await pool.close()
 
@@ -2087,79 +7175,148 @@ async def shutdown_event():
 app.include_router(api_router)
 
 
-import json as json_module
-
 def _esc(s):
     return str(s).replace("&","&amp;").replace("<","&lt;").replace(">","&gt;").replace('"',"&quot;")
 
-def _build_pool_html(data):
-    active = data.get("active", [])
-    absent = data.get("absent", [])
-    unknown = data.get("unknown", [])
 
-    active_html = ""
-    for d in active:
-        active_html += f'<div class="item item-active"><div><div class="name">{_esc(d["name"])}</div><div class="plate">{_esc(d["plate"])}</div></div><div style="text-align:right"><div class="time-val">{_esc(d["time"])}</div><div class="time-label">Input SIJ</div></div></div>'
+# The /pool-dashboard page is a fixed shell around three driver lists.
+# CSS and JS are served as content-hashed assets that browsers cache
+# forever; the shell is split once at import so a request only renders
+# the list fragments and joins bytes.
+
+POOL_CSS = """*{margin:0;padding:0;box-sizing:border-box}
+body{background:#09090b;color:#fff;font-family:system-ui,-apple-system,sans-serif;overflow:hidden}
+.header{display:flex;justify-content:space-between;align-items:center;padding:24px;background:#18181b;border-bottom:2px solid #27272a}
+.title{font-size:1.875rem;font-weight:900;color:#f59e0b;letter-spacing:0.05em}
+.subtitle{color:#a1a1aa;font-size:1.125rem;margin-top:4px}
+.clock{font-size:3rem;font-family:monospace;font-weight:700;color:#38bdf8;text-align:right}
+.date{color:#a1a1aa;font-size:1.125rem;margin-top:4px;text-align:right}
+.grid{display:grid;grid-template-columns:1fr 1fr 1fr;gap:24px;padding:24px;flex:1;overflow:hidden}
+.col{background:#18181b;border-radius:12px;padding:16px;box-shadow:0 4px 6px rgba(0,0,0,0.3);overflow-y:auto;display:flex;flex-direction:column}
+.col-active{border-top:4px solid #10b981}
+.col-absent{border-top:4px solid #71717a}
+.col-unknown{border-top:4px solid #f43f5e}
+.col-title{font-size:1.25rem;font-weight:700;margin-bottom:16px;display:flex;align-items:center;gap:8px}
+.col-title-active{color:#34d399}
+.col-title-absent{color:#d4d4d8}
+.col-title-unknown{color:#fb7185}
+.pulse{width:12px;height:12px;border-radius:50%;background:#10b981;animation:pulse 2s infinite}
+@keyframes pulse{0%,100%{opacity:1}50%{opacity:0.5}}
+@keyframes marquee{0%{transform:translateX(100%)}100%{transform:translateX(-100%)}}
+.items{flex:1;overflow-y:auto;scrollbar-width:none}
+.items::-webkit-scrollbar{display:none}
+.item{display:flex;justify-content:space-between;align-items:center;padding:12px;border-radius:8px;margin-bottom:8px}
+.item-active{background:rgba(39,39,42,0.5);border:1px solid #3f3f46}
+.item-absent{background:rgba(39,39,42,0.3);border:1px solid #27272a;opacity:0.7}
+.item-unknown{background:rgba(244,63,94,0.1);border:1px solid rgba(244,63,94,0.2)}
+.name{font-weight:700;font-size:1.125rem}
+.name-unknown{color:#fecdd3}
+.plate{color:#a1a1aa;font-size:0.875rem}
+.plate-unknown{color:rgba(244,63,94,0.6)}
+.time-val{color:#34d399;font-family:monospace;font-weight:700}
+.time-label{color:#71717a;font-size:0.75rem}
+.reason-badge{padding:4px 12px;background:#3f3f46;border-radius:9999px;font-size:0.75rem;font-weight:700;color:#d4d4d8}
+.check-badge{padding:4px 12px;background:rgba(244,63,94,0.2);border-radius:9999px;font-size:0.75rem;font-weight:700;color:#fb7185}
+.banner{background:#f59e0b;padding:12px;color:#09090b;font-weight:700;text-align:center;font-size:1.25rem;white-space:nowrap;overflow:hidden;display:flex;align-items:center}
+.banner-text{animation:marquee 45s linear infinite;display:inline-block}
+.page{display:flex;flex-direction:column;height:100vh}
+"""
+
+POOL_JS = """function updateClock(){
+  var now=new Date();
+  document.getElementById('clock').textContent=now.toLocaleTimeString('id-ID');
+  document.getElementById('date').textContent=now.toLocaleDateString('id-ID',{weekday:'long',year:'numeric',month:'long',day:'numeric'});
+}
+setInterval(updateClock,1000);
+updateClock();
+
+function esc(s){return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;')}
+
+function renderData(data){
+  var al=document.getElementById('active-list');
+  var html='';
+  (data.active||[]).forEach(function(d){
+    html+='<div class="item item-active"><div><div class="name">'+esc(d.name)+'</div><div class="plate">'+esc(d.plate)+'</div></div><div style="text-align:right"><div class="time-val">'+esc(d.time)+'</div><div class="time-label">Input SIJ</div></div></div>';
+  });
+  al.innerHTML=html;
+
+  var bl=document.getElementById('absent-list');
+  html='';
+  (data.absent||[]).forEach(function(d){
+    html+='<div class="item item-absent"><div class="name" style="color:#d4d4d8">'+esc(d.name)+'</div><span class="reason-badge">'+esc(d.reason)+'</span></div>';
+  });
+  bl.innerHTML=html;
+
+  var ul=document.getElementById('unknown-list');
+  html='';
+  (data.unknown||[]).forEach(function(d){
+    html+='<div class="item item-unknown"><div><div class="name name-unknown">'+esc(d.name)+'</div><div class="plate plate-unknown">'+esc(d.plate)+'</div></div><span class="check-badge">Cek Keberadaan</span></div>';
+  });
+  ul.innerHTML=html;
+}
+
+function autoScroll(container){
+  if(!container)return;
+  var scrollSpeed=1;
+  setInterval(function(){
+    container.scrollTop+=scrollSpeed;
+    if(container.scrollTop>=container.scrollHeight-container.clientHeight){
+      container.scrollTop=0;
+    }
+  },50);
+}
+
+var activeList=document.getElementById('active-list');
+var absentList=document.getElementById('absent-list');
+var unknownList=document.getElementById('unknown-list');
+autoScroll(activeList);
+autoScroll(absentList);
+autoScroll(unknownList);
+
+// ?zone=<zone_id> scopes the board; ?page_size=N makes each refresh
+// advance to the next page of the columns.
+var params=new URLSearchParams(location.search);
+var page=0;
 
-    absent_html = ""
-    for d in absent:
-        absent_html += f'<div class="item item-absent"><div class="name" style="color:#d4d4d8">{_esc(d["name"])}</div><span class="reason-badge">{_esc(d["reason"])}</span></div>'
+function fetchData(){
+  if(params.has('page_size'))params.set('page',page+1);
+  var qs=params.toString();
+  var x=new XMLHttpRequest();
+  x.open('GET','/api/pool-dashboard'+(qs?'?'+qs:''),true);
+  x.onload=function(){
+    if(x.status===200){try{var data=JSON.parse(x.responseText);page=data.page||0;renderData(data)}catch(e){}}
+  };
+  x.send();
+}
+setInterval(fetchData,30000);
+"""
 
-    unknown_html = ""
-    for d in unknown:
-        unknown_html += f'<div class="item item-unknown"><div><div class="name name-unknown">{_esc(d["name"])}</div><div class="plate plate-unknown">{_esc(d["plate"])}</div></div><span class="check-badge">Cek Keberadaan</span></div>'
 
-    return f"""<!DOCTYPE html>
+def _pool_asset(content: str, ext: str, media_type: str):
+    data = content.encode()
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    return f"pool.{digest}.{ext}", (data, media_type)
+
+
+_css_name, _css_asset = _pool_asset(POOL_CSS, "css", "text/css")
+_js_name, _js_asset = _pool_asset(POOL_JS, "js", "application/javascript")
+POOL_ASSETS = {_css_name: _css_asset, _js_name: _js_asset}
+
+POOL_SHELL = [
+    part.encode() for part in f"""<!DOCTYPE html>
 <html lang="id">
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
 <title>RAJA Command Center</title>
-<style>
-*{{margin:0;padding:0;box-sizing:border-box}}
-body{{background:#09090b;color:#fff;font-family:system-ui,-apple-system,sans-serif;overflow:hidden}}
-.header{{display:flex;justify-content:space-between;align-items:center;padding:24px;background:#18181b;border-bottom:2px solid #27272a}}
-.title{{font-size:1.875rem;font-weight:900;color:#f59e0b;letter-spacing:0.05em}}
-.subtitle{{color:#a1a1aa;font-size:1.125rem;margin-top:4px}}
-.clock{{font-size:3rem;font-family:monospace;font-weight:700;color:#38bdf8;text-align:right}}
-.date{{color:#a1a1aa;font-size:1.125rem;margin-top:4px;text-align:right}}
-.grid{{display:grid;grid-template-columns:1fr 1fr 1fr;gap:24px;padding:24px;flex:1;overflow:hidden}}
-.col{{background:#18181b;border-radius:12px;padding:16px;box-shadow:0 4px 6px rgba(0,0,0,0.3);overflow-y:auto;display:flex;flex-direction:column}}
-.col-active{{border-top:4px solid #10b981}}
-.col-absent{{border-top:4px solid #71717a}}
-.col-unknown{{border-top:4px solid #f43f5e}}
-.col-title{{font-size:1.25rem;font-weight:700;margin-bottom:16px;display:flex;align-items:center;gap:8px}}
-.col-title-active{{color:#34d399}}
-.col-title-absent{{color:#d4d4d8}}
-.col-title-unknown{{color:#fb7185}}
-.pulse{{width:12px;height:12px;border-radius:50%;background:#10b981;animation:pulse 2s infinite}}
-@keyframes pulse{{0%,100%{{opacity:1}}50%{{opacity:0.5}}}}
-@keyframes marquee{{0%{{transform:translateX(100%)}}100%{{transform:translateX(-100%)}}}}
-.items{{flex:1;overflow-y:auto;scrollbar-width:none}}
-.items::-webkit-scrollbar{{display:none}}
-.item{{display:flex;justify-content:space-between;align-items:center;padding:12px;border-radius:8px;margin-bottom:8px}}
-.item-active{{background:rgba(39,39,42,0.5);border:1px solid #3f3f46}}
-.item-absent{{background:rgba(39,39,42,0.3);border:1px solid #27272a;opacity:0.7}}
-.item-unknown{{background:rgba(244,63,94,0.1);border:1px solid rgba(244,63,94,0.2)}}
-.name{{font-weight:700;font-size:1.125rem}}
-.name-unknown{{color:#fecdd3}}
-.plate{{color:#a1a1aa;font-size:0.875rem}}
-.plate-unknown{{color:rgba(244,63,94,0.6)}}
-.time-val{{color:#34d399;font-family:monospace;font-weight:700}}
-.time-label{{color:#71717a;font-size:0.75rem}}
-.reason-badge{{padding:4px 12px;background:#3f3f46;border-radius:9999px;font-size:0.75rem;font-weight:700;color:#d4d4d8}}
-.check-badge{{padding:4px 12px;background:rgba(244,63,94,0.2);border-radius:9999px;font-size:0.75rem;font-weight:700;color:#fb7185}}
-.banner{{background:#f59e0b;padding:12px;color:#09090b;font-weight:700;text-align:center;font-size:1.25rem;white-space:nowrap;overflow:hidden;display:flex;align-items:center}}
-.banner-text{{animation:marquee 45s linear infinite;display:inline-block}}
-.page{{display:flex;flex-direction:column;height:100vh}}
-</style>
+<link rel="stylesheet" href="/pool-dashboard/assets/{_css_name}">
 </head>
 <body>
 <div class="page">
   <div class="header">
     <div>
       <div class="title">RAJA COMMAND CENTER</div>
-      <div class="subtitle">Status Kehadiran Mitra</div>
+      <div class="subtitle">Status Kehadiran Mitra<!--fragment--></div>
     </div>
     <div>
       <div class="clock" id="clock"></div>
@@ -2169,89 +7326,87 @@ body{{background:#09090b;color:#fff;font-family:system-ui,-apple-system,sans-ser
   <div class="grid">
     <div class="col col-active">
       <div class="col-title col-title-active"><span class="pulse"></span> ON-DUTY (HADIR)</div>
-      <div class="items" id="active-list">{active_html}</div>
+      <div class="items" id="active-list"><!--fragment--></div>
     </div>
     <div class="col col-absent">
       <div class="col-title col-title-absent">KONFIRMASI TIDAK HADIR</div>
-      <div class="items" id="absent-list">{absent_html}</div>
+      <div class="items" id="absent-list"><!--fragment--></div>
     </div>
     <div class="col col-unknown">
       <div class="col-title col-title-unknown">BELUM HADIR</div>
-      <div class="items" id="unknown-list">{unknown_html}</div>
+      <div class="items" id="unknown-list"><!--fragment--></div>
     </div>
   </div>
   <div class="banner"><span class="banner-text">INFO: Tetap utamakan keselamatan kerja | Cek kondisi unit sebelum berangkat | Selalu gunakan seragam yang rapi selama beroperasi. &nbsp;&nbsp;&nbsp;&nbsp; INFO: Tetap utamakan keselamatan kerja | Cek kondisi unit sebelum berangkat | Selalu gunakan seragam yang rapi selama beroperasi.</span></div>
 </div>
-<script>
-function updateClock(){{
-  var now=new Date();
-  document.getElementById('clock').textContent=now.toLocaleTimeString('id-ID');
-  document.getElementById('date').textContent=now.toLocaleDateString('id-ID',{{weekday:'long',year:'numeric',month:'long',day:'numeric'}});
-}}
-setInterval(updateClock,1000);
-updateClock();
+<script src="/pool-dashboard/assets/{_js_name}"></script>
+</body>
+</html>""".split("<!--fragment-->")
+]
 
-function esc(s){{return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;')}}
+POOL_ACTIVE_ITEM = '<div class="item item-active"><div><div class="name">{name}</div><div class="plate">{plate}</div></div><div style="text-align:right"><div class="time-val">{time}</div><div class="time-label">Input SIJ</div></div></div>'
+POOL_ABSENT_ITEM = '<div class="item item-absent"><div class="name" style="color:#d4d4d8">{name}</div><span class="reason-badge">{reason}</span></div>'
+POOL_UNKNOWN_ITEM = '<div class="item item-unknown"><div><div class="name name-unknown">{name}</div><div class="plate plate-unknown">{plate}</div></div><span class="check-badge">Cek Keberadaan</span></div>'
 
-function renderData(data){{
-  var al=document.getElementById('active-list');
-  var html='';
-  (data.active||[]).forEach(function(d){{
-    html+='<div class="item item-active"><div><div class="name">'+esc(d.name)+'</div><div class="plate">'+esc(d.plate)+'</div></div><div style="text-align:right"><div class="time-val">'+esc(d.time)+'</div><div class="time-label">Input SIJ</div></div></div>';
-  }});
-  al.innerHTML=html;
 
-  var bl=document.getElementById('absent-list');
-  html='';
-  (data.absent||[]).forEach(function(d){{
-    html+='<div class="item item-absent"><div class="name" style="color:#d4d4d8">'+esc(d.name)+'</div><span class="reason-badge">'+esc(d.reason)+'</span></div>';
-  }});
-  bl.innerHTML=html;
+def _pool_fragment(template: str, rows: list) -> bytes:
+    return "".join(
+        template.format_map({k: _esc(v)
+                             for k, v in d.items()}) for d in rows).encode()
 
-  var ul=document.getElementById('unknown-list');
-  html='';
-  (data.unknown||[]).forEach(function(d){{
-    html+='<div class="item item-unknown"><div><div class="name name-unknown">'+esc(d.name)+'</div><div class="plate plate-unknown">'+esc(d.plate)+'</div></div><span class="check-badge">Cek Keberadaan</span></div>';
-  }});
-  ul.innerHTML=html;
-}}
 
-function autoScroll(container){{
-  if(!container)return;
-  var scrollSpeed=1;
-  setInterval(function(){{
-    container.scrollTop+=scrollSpeed;
-    if(container.scrollTop>=container.scrollHeight-container.clientHeight){{
-      container.scrollTop=0;
-    }}
-  }},50);
-}}
+def _build_pool_html(data) -> bytes:
+    zone_label = f' &middot; {_esc(data["zone_name"] or data["zone"])}' if data.get(
+        "zone") else ""
+    fragments = (zone_label.encode(),
+                 _pool_fragment(POOL_ACTIVE_ITEM, data.get("active", [])),
+                 _pool_fragment(POOL_ABSENT_ITEM, data.get("absent", [])),
+                 _pool_fragment(POOL_UNKNOWN_ITEM, data.get("unknown", [])))
+    head, *rest = POOL_SHELL
+    return head + b"".join(f + part for f, part in zip(fragments, rest))
 
-var activeList=document.getElementById('active-list');
-var absentList=document.getElementById('absent-list');
-var unknownList=document.getElementById('unknown-list');
-autoScroll(activeList);
-autoScroll(absentList);
-autoScroll(unknownList);
 
-function fetchData(){{
-  var x=new XMLHttpRequest();
-  x.open('GET','/api/pool-dashboard',true);
-  x.onload=function(){{
-    if(x.status===200){{try{{renderData(JSON.parse(x.responseText))}}catch(e){{}}}}
-  }};
-  x.send();
-}}
-setInterval(fetchData,30000);
-</script>
-</body>
-</html>"""
+# (zone, page_size) -> (data key, body, etag)
+pool_page_cache = {}
 
 
 @app.get("/pool-dashboard", response_class=HTMLResponse)
-async def pool_dashboard_page():
-    data = await get_pool_dashboard()
-    return _build_pool_html(data)
+async def pool_dashboard_page(request: Request,
+                              zone: Optional[str] = None,
+                              page_size: int = Query(0, ge=0, le=500)):
+    if presence_board.live and driver_directory.live:
+        if zone is not None and zone not in presence_board.zones:
+            raise HTTPException(status_code=404,
+                                detail="Zona tidak ditemukan")
+        data = await presence_board.board(zone)
+        key = (presence_board.day, presence_board.version)
+    else:
+        data = await pool_dashboard_from_db(zone)
+        key = None
+    cached = pool_page_cache.get((zone, page_size))
+    if key is None or cached is None or cached[0] != key:
+        body = _build_pool_html(paginate_board(data, 0, page_size))
+        etag = f'W/"pool-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        cached = pool_page_cache[(zone, page_size)] = (key, body, etag)
+    _, body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body,
+                    media_type="text/html; charset=utf-8",
+                    headers=headers)
+
+
+@app.get("/pool-dashboard/assets/{name}")
+async def pool_dashboard_asset(name: str):
+    asset = POOL_ASSETS.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    data, media_type = asset
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 
 BUILD_DIR = Path(__file__).parent.parent / "frontend" / "build"
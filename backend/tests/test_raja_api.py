@@ -1,7 +1,18 @@
 """RAJA Digital System - Backend API Tests"""
+import asyncio
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlparse
+from zoneinfo import ZoneInfo
+
 import pytest
 import requests
-import os
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -95,12 +106,54 @@ class TestDrivers:
         assert isinstance(data, list)
         assert all(d['status'] == 'active' for d in data)
 
+    def test_active_drivers_not_modified(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/active", headers=admin_headers)
+        etag = r.headers.get("etag")
+        if not etag:
+            pytest.skip("driver directory not live on this server")
+        r = requests.get(f"{BASE_URL}/api/drivers/active", headers={**admin_headers, "If-None-Match": etag})
+        assert r.status_code == 304
+
+    def test_active_drivers_etag_follows_content(self, admin_headers, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/active", headers=admin_headers)
+        etag = r.headers.get("etag")
+        if not etag:
+            pytest.skip("driver directory not live on this server")
+        driver = r.json()[0]
+        # Rewriting a driver with its own values changes nothing visible
+        r = requests.put(f"{BASE_URL}/api/drivers/{driver['driver_id']}",
+                         json={"plate": driver["plate"]}, headers=superadmin_headers)
+        assert r.status_code == 200
+        time.sleep(0.5)
+        r = requests.get(f"{BASE_URL}/api/drivers/active", headers={**admin_headers, "If-None-Match": etag})
+        assert r.status_code == 304
+
     def test_driver_search(self, admin_headers):
         r = requests.get(f"{BASE_URL}/api/drivers?search=Ahmad", headers=admin_headers)
         assert r.status_code == 200
         data = r.json()
         assert len(data) > 0
 
+    def test_driver_search_endpoint(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/search?q=Ahmad", headers=admin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert len(data) > 0
+        assert data[0]["name"].startswith("Ahmad")
+        assert "score" in data[0]
+
+    def test_driver_search_short_prefix(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/search?q=dr&status_filter=active&limit=5", headers=admin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert 0 < len(data) <= 5
+        assert all(d["status"] == "active" for d in data)
+
+    def test_driver_search_empty_query(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/search?q=", headers=admin_headers)
+        assert r.status_code == 200
+        assert r.json() == []
+
     def test_update_driver_requires_superadmin(self, admin_headers):
         r = requests.put(f"{BASE_URL}/api/drivers/driver001", json={"phone": "08123456789"}, headers=admin_headers)
         assert r.status_code == 403
@@ -130,7 +183,6 @@ class TestSIJ:
     
     def test_get_sij_with_date_filter(self, admin_headers):
         """Test GET /api/sij with date filter for List SIJ page"""
-        from datetime import datetime
         today = datetime.now().strftime("%Y-%m-%d")
         r = requests.get(f"{BASE_URL}/api/sij?date={today}", headers=admin_headers)
         assert r.status_code == 200
@@ -195,7 +247,6 @@ class TestSIJ:
 
     def test_create_sij_with_future_date(self, admin_headers):
         """Test SIJ creation with a valid future date (within 7 days)"""
-        from datetime import datetime, timedelta
         future_date = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
         r = requests.post(f"{BASE_URL}/api/sij", json={
             "driver_id": "driver046",
@@ -211,7 +262,6 @@ class TestSIJ:
 
     def test_create_sij_with_past_date_rejected(self, admin_headers):
         """Test that past dates are rejected"""
-        from datetime import datetime, timedelta
         past_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         r = requests.post(f"{BASE_URL}/api/sij", json={
             "driver_id": "driver047",
@@ -224,7 +274,6 @@ class TestSIJ:
 
     def test_create_sij_with_far_future_date_rejected(self, admin_headers):
         """Test that dates beyond 7 days are rejected"""
-        from datetime import datetime, timedelta
         far_future_date = (datetime.now() + timedelta(days=10)).strftime("%Y-%m-%d")
         r = requests.post(f"{BASE_URL}/api/sij", json={
             "driver_id": "driver048",
@@ -236,6 +285,250 @@ class TestSIJ:
         assert "7 hari" in r.json().get("detail", "").lower()
 
 
+# ===== IDEMPOTENCY TESTS =====
+
+class TestIdempotency:
+    """Idempotency-Key replays the first response instead of writing twice"""
+
+    def test_ritase_replayed(self, admin_headers):
+        headers = {**admin_headers, "Idempotency-Key": str(uuid.uuid4())}
+        body = {"driver_id": "driver044", "date": datetime.now().strftime("%Y-%m-%d"),
+                "waktu_ritase": "10:15"}
+        first = requests.post(f"{BASE_URL}/api/ritase", json=body, headers=headers)
+        assert first.status_code == 200
+        second = requests.post(f"{BASE_URL}/api/ritase", json=body, headers=headers)
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert second.headers.get("Idempotent-Replayed") == "true"
+
+    def test_key_reused_for_other_request(self, admin_headers):
+        headers = {**admin_headers, "Idempotency-Key": str(uuid.uuid4())}
+        body = {"driver_id": "driver044", "date": datetime.now().strftime("%Y-%m-%d")}
+        assert requests.post(f"{BASE_URL}/api/ritase", json=body, headers=headers).status_code == 200
+        r = requests.post(f"{BASE_URL}/api/ritase", json={**body, "notes": "beda"}, headers=headers)
+        assert r.status_code == 422
+
+    def test_sij_retry_returns_transaction(self, admin_headers):
+        headers = {**admin_headers, "Idempotency-Key": str(uuid.uuid4())}
+        body = {"driver_id": "driver044", "sheets": 2, "qris_ref": "TEST_QRIS_IDEMPOTENT",
+                "date": (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")}
+        first = requests.post(f"{BASE_URL}/api/sij", json=body, headers=headers)
+        if first.status_code == 400:
+            pytest.skip("driver044 already has an SIJ for that date")
+        assert first.status_code == 200
+        second = requests.post(f"{BASE_URL}/api/sij", json=body, headers=headers)
+        assert second.status_code == 200
+        assert second.json()["transaction_id"] == first.json()["transaction_id"]
+
+
+# ===== OFFLINE WRITE BUFFER TESTS =====
+
+class TestOfflineWrites:
+    """Journal of counter writes taken while the database was unreachable"""
+
+    def test_offline_writes_summary(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/offline-writes", headers=admin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert "counts" in data and "writes" in data
+        # With the database up nothing stays pending for long
+        assert data["counts"].get("pending", 0) == 0
+
+    def test_unknown_offline_write(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/offline-writes/OFF0", headers=admin_headers)
+        assert r.status_code == 404
+
+
+@pytest.fixture
+def offline_journal(tmp_path, monkeypatch):
+    """An OfflineWriteBuffer on a temp file with three absences queued.
+
+    Runs in-process: run_counter_write is replaced by the test, so no
+    database is needed.
+    """
+    from backend import server
+    monkeypatch.setattr(server, "pool", object())
+
+    async def published(*args):
+        pass
+
+    monkeypatch.setattr(server, "publish_absence", published)
+    journal = server.OfflineWriteBuffer(str(tmp_path / "offline.sqlite3"))
+    user = {"user_id": "U1", "name": "Admin", "role": "admin"}
+    ids = []
+    for i in range(3):
+        body = server.AbsenceRequest(driver_id=f"D{i}", date="2026-10-01", reason="sakit")
+        receipt, _ = asyncio.run(journal.accept(
+            "absence", body, user, None, ConnectionRefusedError(), {}))
+        ids.append(receipt["offline_id"])
+        time.sleep(0.002)  # offline ids are millisecond based
+
+    written = []  # driver ids, once per committed write
+    stored = {}  # idempotency key -> response, as run_counter_write keeps them
+
+    def replay(outcomes):
+        """Replay with run_counter_write raising/returning outcomes[driver_id]."""
+        async def run_counter_write(name, body, user, key, write):
+            if key and key in stored:
+                return stored[key], True
+            outcome = outcomes.get(body.driver_id)
+            if isinstance(outcome, Exception):
+                raise outcome
+            written.append(body.driver_id)
+            response = {"driver_id": body.driver_id}
+            if key:
+                stored[key] = response
+            return response, False
+
+        monkeypatch.setattr(server, "run_counter_write", run_counter_write)
+        applied = asyncio.run(journal.replay())
+        return applied, [asyncio.run(journal.get(i))["status"] for i in ids]
+
+    return server, replay, written
+
+
+class TestOfflineReplay:
+    """OfflineWriteBuffer.replay against a temp journal"""
+
+    def test_replay_applies_in_order(self, offline_journal):
+        _, replay, _ = offline_journal
+        assert replay({}) == (3, ["applied", "applied", "applied"])
+        assert replay({}) == (0, ["applied", "applied", "applied"])
+
+    def test_replay_records_conflict(self, offline_journal):
+        server, replay, _ = offline_journal
+        conflict = server.HTTPException(status_code=400, detail="Driver tidak aktif")
+        assert replay({"D1": conflict}) == (2, ["applied", "conflict", "applied"])
+
+    def test_replay_stops_when_database_unreachable(self, offline_journal):
+        _, replay, _ = offline_journal
+        applied, statuses = replay({"D1": ConnectionRefusedError()})
+        assert (applied, statuses) == (1, ["applied", "pending", "pending"])
+        assert replay({}) == (2, ["applied", "applied", "applied"])
+
+    def test_replay_skips_failed_row(self, offline_journal):
+        _, replay, _ = offline_journal
+        assert replay({"D0": ValueError("rusak")}) == (2, ["failed", "applied", "applied"])
+
+    def test_replay_after_crash_does_not_write_twice(self, offline_journal, monkeypatch):
+        # The worker dies after the first commit but before marking the row.
+        server, replay, written = offline_journal
+        mark = server.OfflineWriteBuffer._mark
+
+        def crash(self, db, offline_id, status, result):
+            monkeypatch.setattr(server.OfflineWriteBuffer, "_mark", mark)
+            raise SystemExit
+
+        monkeypatch.setattr(server.OfflineWriteBuffer, "_mark", crash)
+        with pytest.raises(SystemExit):
+            replay({})
+        assert replay({}) == (3, ["applied", "applied", "applied"])
+        assert written == ["D0", "D1", "D2"]
+
+
+# ===== PRINT SPOOLER TESTS =====
+# A local TCP listener on PRINTER_SINK_PORT (default 9100) stands in for
+# the thermal printer. These run only when the API server runs on this
+# machine with PRINTER_ALLOWED_NETWORKS covering 127.0.0.1 and the port in
+# PRINTER_ALLOWED_PORTS.
+
+@pytest.fixture
+def printer_sink():
+    if urlparse(BASE_URL).hostname not in ("localhost", "127.0.0.1"):
+        pytest.skip("Printer sink needs a local API server")
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        server.bind(("127.0.0.1", int(os.environ.get("PRINTER_SINK_PORT", 9100))))
+    except OSError:
+        pytest.skip("Printer sink port is busy")
+    server.listen()
+    received = bytearray()
+
+    def serve():
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                received.extend(chunk)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield server.getsockname()[1], received
+    try:
+        server.shutdown(socket.SHUT_RDWR)  # wake the pending accept()
+    except OSError:
+        pass
+    server.close()
+
+
+def submit_print(path, body, headers):
+    r = requests.post(f"{BASE_URL}/api{path}", json=body, headers=headers)
+    if r.status_code == 400 and r.json().get("detail") in (
+            "Alamat printer tidak diizinkan", "Port printer tidak diizinkan"):
+        pytest.skip("server does not allow printing to the local sink")
+    return r
+
+
+def wait_for_job(job_id, headers, attempts=20):
+    for _ in range(attempts):
+        job = requests.get(f"{BASE_URL}/api/print/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    return job
+
+
+class TestPrintSpooler:
+    """Server-side ESC/POS printing"""
+
+    def test_print_sij_receipt(self, admin_headers, printer_sink):
+        port, received = printer_sink
+        tx = requests.get(f"{BASE_URL}/api/sij?limit=1", headers=admin_headers).json()[0]
+        r = submit_print(f"/sij/{tx['transaction_id']}/print",
+                         {"ip": "127.0.0.1", "port": port}, admin_headers)
+        assert r.status_code == 200
+        job = wait_for_job(r.json()["job_id"], admin_headers)
+        assert job["status"] == "done"
+        for _ in range(20):
+            if len(received) >= job["bytes"]:
+                break
+            time.sleep(0.05)
+        assert received.startswith(b"\x1b@")
+        assert tx["transaction_id"].encode() in received
+        assert received.count(b"\x1dVA\x00") == tx["sheets"]
+
+    def test_print_raw_hex(self, admin_headers, printer_sink):
+        port, _ = printer_sink
+        r = submit_print("/print/network",
+                         {"ip": "127.0.0.1", "port": port, "hex_data": "1b40zz"}, admin_headers)
+        assert r.status_code == 400
+        r = submit_print("/print/network",
+                         {"ip": "127.0.0.1", "port": port, "hex_data": "1b40"}, admin_headers)
+        assert r.status_code == 200
+        job_id = r.json()["job_id"]
+        assert wait_for_job(job_id, admin_headers)["status"] == "done"
+        # Status is kept in the database, so any worker can list it.
+        jobs = requests.get(f"{BASE_URL}/api/print/jobs?status=done",
+                            headers=admin_headers).json()["jobs"]
+        assert any(j["job_id"] == job_id and j["finished_at"] for j in jobs)
+
+    def test_print_rejects_public_address(self, admin_headers):
+        r = requests.post(f"{BASE_URL}/api/print/network",
+                          json={"ip": "8.8.8.8", "hex_data": "1b40"}, headers=admin_headers)
+        assert r.status_code == 400
+
+    def test_print_rejects_other_ports(self, admin_headers):
+        r = requests.post(f"{BASE_URL}/api/print/network",
+                          json={"ip": "192.168.1.50", "port": 5432, "hex_data": "1b40"},
+                          headers=admin_headers)
+        assert r.status_code == 400
+
+
 # ===== DASHBOARD TESTS =====
 
 class TestDashboard:
@@ -251,6 +544,65 @@ class TestDashboard:
         assert "mismatch_list" in data
         assert "recent_sij" in data
 
+    def test_admin_dashboard_feed(self, admin_token, admin_headers):
+        ws_client = pytest.importorskip("websockets.sync.client")
+        url = BASE_URL.replace("http", "ws", 1) + f"/api/ws/dashboard/admin?token={admin_token}"
+        try:
+            ws = ws_client.connect(url, open_timeout=5)
+        except Exception:
+            pytest.skip("Live feed unavailable (event bus not listening)")
+        with ws:
+            snapshot = json.loads(ws.recv(timeout=5))
+            assert snapshot["type"] == "snapshot"
+            assert "recent_sij" in snapshot["data"]
+            ws.send(json.dumps({"type": "resync"}))
+            assert json.loads(ws.recv(timeout=5))["type"] == "snapshot"
+            r = requests.post(f"{BASE_URL}/api/sij", json={
+                "driver_id": "driver049",
+                "sheets": 1,
+                "qris_ref": "TEST_QRIS_LIVE_FEED"
+            }, headers=admin_headers)
+            if r.status_code != 200 or r.json()["shift"] != snapshot["data"]["shift"]:
+                return
+            while True:
+                message = json.loads(ws.recv(timeout=5))
+                if message["type"] == "sij":
+                    break
+            assert message["transaction_id"] == r.json()["transaction_id"]
+            assert message["delta"]["sij_today_shift"] == 1
+
+    def test_feed_holds_deltas_during_snapshot(self, monkeypatch):
+        """In-process: deltas published while a snapshot is read follow it"""
+        from backend import server
+        hub = server.DashboardHub()
+        sent = []
+
+        class Socket:
+            async def send_text(self, text):
+                sent.append(json.loads(text))
+
+        async def snapshot(shift):
+            # Both land while the snapshot queries run; T1 made it in.
+            await hub.broadcast(shift, {"type": "sij", "op": "create", "transaction_id": "T1"})
+            await hub.broadcast(shift, {"type": "sij", "op": "void", "transaction_id": "T0"})
+            return {"type": "snapshot", "data": {"recent_sij": [{"transaction_id": "T1"}]}}
+
+        monkeypatch.setattr(hub, "snapshot", snapshot)
+
+        async def run():
+            assert await hub.send_snapshot("Shift1", Socket())
+            await hub.broadcast("Shift1", {"type": "ping"})
+
+        asyncio.run(run())
+        assert [(m["type"], m.get("transaction_id")) for m in sent] == [
+            ("snapshot", None), ("sij", "T0"), ("ping", None)]
+
+    def test_admin_dashboard_feed_rejects_bad_token(self):
+        ws_client = pytest.importorskip("websockets.sync.client")
+        url = BASE_URL.replace("http", "ws", 1) + "/api/ws/dashboard/admin?token=invalid"
+        with pytest.raises(Exception):
+            ws_client.connect(url, open_timeout=5).recv(timeout=5)
+
     def test_superadmin_dashboard(self, superadmin_headers):
         r = requests.get(f"{BASE_URL}/api/dashboard/superadmin", headers=superadmin_headers)
         assert r.status_code == 200
@@ -268,6 +620,245 @@ class TestDashboard:
         assert r.status_code == 403
 
 
+def wait_for_board(predicate, attempts=10, zone=None):
+    """The board follows writes via LISTEN/NOTIFY, so allow a short lag."""
+    params = {"zone": zone} if zone else {}
+    for _ in range(attempts):
+        data = requests.get(f"{BASE_URL}/api/pool-dashboard", params=params).json()
+        if predicate(data):
+            return data
+        time.sleep(0.2)
+    return data
+
+
+class TestPoolDashboard:
+    """Pool board presence tests"""
+
+    def test_pool_dashboard_structure(self):
+        r = requests.get(f"{BASE_URL}/api/pool-dashboard")
+        assert r.status_code == 200
+        data = r.json()
+        for key in ["active", "absent", "unknown", "totals", "page", "pages"]:
+            assert key in data
+
+    def test_pool_dashboard_pagination(self):
+        full = requests.get(f"{BASE_URL}/api/pool-dashboard").json()
+        data = requests.get(f"{BASE_URL}/api/pool-dashboard?page_size=5").json()
+        assert data["totals"] == full["totals"]
+        assert all(len(data[k]) <= 5 for k in ["active", "absent", "unknown"])
+        wrapped = requests.get(f"{BASE_URL}/api/pool-dashboard?page_size=5&page={data['pages']}").json()
+        assert wrapped["page"] == 0
+        # Wrapped page numbers are the same cached body
+        first = requests.get(f"{BASE_URL}/api/pool-dashboard?page_size=5")
+        far = requests.get(f"{BASE_URL}/api/pool-dashboard?page_size=5&page={data['pages'] * 1000}")
+        assert far.headers["ETag"] == first.headers["ETag"]
+
+    def test_zone_scoped_board(self, superadmin_headers, admin_headers):
+        requests.delete(f"{BASE_URL}/api/zones/TEST_ZONE", headers=superadmin_headers)
+        r = requests.post(f"{BASE_URL}/api/zones", json={"zone_id": "TEST_ZONE", "name": "Terminal Uji"},
+                          headers=superadmin_headers)
+        assert r.status_code == 200
+        drivers = requests.get(f"{BASE_URL}/api/drivers/active", headers=admin_headers).json()
+        driver = drivers[0]
+        r = requests.put(f"{BASE_URL}/api/drivers/{driver['driver_id']}", json={"zone_id": "TEST_ZONE"},
+                         headers=superadmin_headers)
+        assert r.status_code == 200
+        data = wait_for_board(lambda d: d.get("totals", {}).get("unknown", 0) + d.get("totals", {}).get("active", 0)
+                              + d.get("totals", {}).get("absent", 0) == 1, zone="TEST_ZONE")
+        names = [d["name"] for k in ["active", "absent", "unknown"] for d in data[k]]
+        assert names == [driver["name"]]
+        assert data["zone_name"] == "Terminal Uji"
+        page = requests.get(f"{BASE_URL}/pool-dashboard?zone=TEST_ZONE")
+        assert "Terminal Uji" in page.text
+        r = requests.delete(f"{BASE_URL}/api/zones/TEST_ZONE", headers=superadmin_headers)
+        assert r.status_code == 200
+        for _ in range(10):
+            r = requests.get(f"{BASE_URL}/api/pool-dashboard?zone=TEST_ZONE")
+            if r.status_code == 404:
+                break
+            time.sleep(0.2)
+        assert r.status_code == 404
+
+    def test_assign_unknown_zone_rejected(self, superadmin_headers):
+        r = requests.put(f"{BASE_URL}/api/drivers/driver001", json={"zone_id": "NO_SUCH_ZONE"},
+                         headers=superadmin_headers)
+        assert r.status_code == 400
+
+    def test_pool_page_revalidates(self):
+        r = requests.get(f"{BASE_URL}/pool-dashboard")
+        assert r.status_code == 200
+        assert 'id="active-list"' in r.text
+        r2 = requests.get(f"{BASE_URL}/pool-dashboard", headers={"If-None-Match": r.headers["ETag"]})
+        assert r2.status_code == 304
+        assert r2.content == b""
+        assert r2.headers["ETag"] == r.headers["ETag"]
+
+    def test_pool_page_assets_cached(self):
+        html = requests.get(f"{BASE_URL}/pool-dashboard").text
+        for name in re.findall(r"/pool-dashboard/assets/(pool\.[0-9a-f]+\.(?:css|js))", html):
+            r = requests.get(f"{BASE_URL}/pool-dashboard/assets/{name}")
+            assert r.status_code == 200
+            assert "immutable" in r.headers["Cache-Control"]
+        r = requests.get(f"{BASE_URL}/pool-dashboard/assets/missing.js")
+        assert r.status_code == 404
+
+    def test_absence_moves_driver_to_absent(self, admin_headers):
+        today = datetime.now(ZoneInfo("Asia/Jakarta")).strftime("%Y-%m-%d")
+        unknown = {d["name"] for d in requests.get(f"{BASE_URL}/api/pool-dashboard").json()["unknown"]}
+        drivers = requests.get(f"{BASE_URL}/api/drivers/active", headers=admin_headers).json()
+        driver = next((d for d in drivers if d["name"] in unknown), None)
+        if driver is None:
+            pytest.skip("No driver without presence today")
+        r = requests.post(f"{BASE_URL}/api/absences", json={
+            "driver_id": driver["driver_id"], "date": today, "reason": "IZIN"
+        }, headers=admin_headers)
+        assert r.status_code == 200
+        entry = {"name": driver["name"], "reason": "IZIN"}
+        data = wait_for_board(lambda d: entry in d["absent"])
+        assert entry in data["absent"]
+        requests.post(f"{BASE_URL}/api/absences", json={
+            "driver_id": driver["driver_id"], "date": today, "reason": ""
+        }, headers=admin_headers)
+        data = wait_for_board(lambda d: driver["name"] in {u["name"] for u in d["unknown"]})
+        assert driver["name"] in {d["name"] for d in data["unknown"]}
+
+
+# ===== WEEKLY REPORT TESTS =====
+
+class TestWeeklyReport:
+    """Weekly KHD/RTS grid and batch cell edits"""
+
+    WEEK = {"start_date": "2030-01-07", "end_date": "2030-01-13"}
+
+    def test_weekly_report(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/weekly-report", params=self.WEEK, headers=admin_headers)
+        assert r.status_code == 200
+        assert len(r.json()["days"]) == 7
+
+    def test_batch_cell_edits(self, admin_headers):
+        driver_id = requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers).json()[0]["driver_id"]
+        r = requests.post(f"{BASE_URL}/api/weekly-report/cells", json={**self.WEEK, "edits": [
+            {"driver_id": driver_id, "date": "2030-01-07", "reason": "SAKIT"},
+            {"driver_id": driver_id, "date": "2030-01-08", "manual_rts": 2},
+            {"driver_id": driver_id, "date": "2030-01-09", "manual_rts": 5},
+            {"driver_id": driver_id, "date": "2030-01-09", "manual_rts": 3},
+        ]}, headers=admin_headers)
+        assert r.status_code == 200
+        row = r.json()["drivers"][0]
+        assert row["driver_id"] == driver_id
+        assert row["total_rts"] == 5
+        assert row["daily"][0]["reason"] == "SAKIT"
+        assert row["daily"][2] == {"date": "2030-01-09", "khd": 0, "rts": 3, "reason": "", "is_manual": True}
+        report = requests.get(f"{BASE_URL}/api/weekly-report", params=self.WEEK, headers=admin_headers).json()
+        assert next(d for d in report["drivers"] if d["driver_id"] == driver_id) == row
+
+        r = requests.post(f"{BASE_URL}/api/weekly-report/cells", json={**self.WEEK, "edits": [
+            {"driver_id": driver_id, "date": "2030-01-07", "reason": ""},
+            {"driver_id": driver_id, "date": "2030-01-08", "clear_manual": True},
+            {"driver_id": driver_id, "date": "2030-01-09", "clear_manual": True},
+        ]}, headers=admin_headers)
+        assert r.status_code == 200
+        row = r.json()["drivers"][0]
+        assert row["total_rts"] == 0
+        assert not any(d["reason"] or d["is_manual"] for d in row["daily"])
+
+    def test_batch_rejects_bad_edits(self, admin_headers):
+        driver_id = requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers).json()[0]["driver_id"]
+        url = f"{BASE_URL}/api/weekly-report/cells"
+        r = requests.post(url, json={**self.WEEK, "edits": [
+            {"driver_id": driver_id, "date": "2030-01-07", "reason": "LIBURAN"}]}, headers=admin_headers)
+        assert r.status_code == 400
+        # A date outside the requested week
+        r = requests.post(url, json={**self.WEEK, "edits": [
+            {"driver_id": driver_id, "date": "2030-01-14", "manual_rts": 1}]}, headers=admin_headers)
+        assert r.status_code == 400
+        assert "2030-01-14" in r.json()["detail"]
+        r = requests.post(url, json={**self.WEEK, "edits": [
+            {"driver_id": driver_id, "date": "2030-01-07", "manual_rts": 1},
+            {"driver_id": "TIDAK_ADA", "date": "2030-01-07", "manual_rts": 1}]}, headers=admin_headers)
+        assert r.status_code == 404
+        report = requests.get(f"{BASE_URL}/api/weekly-report", params=self.WEEK, headers=admin_headers).json()
+        row = next(d for d in report["drivers"] if d["driver_id"] == driver_id)
+        assert not row["daily"][0]["is_manual"]
+
+
+# ===== DRIVER TIMELINE TESTS =====
+
+class TestDriverTimeline:
+    """Per-driver merged event stream"""
+
+    def test_timeline_pages(self, admin_headers):
+        driver_id = requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers).json()[1]["driver_id"]
+        requests.post(f"{BASE_URL}/api/weekly-report/cells", json={
+            "start_date": "2030-02-04", "end_date": "2030-02-10", "edits": [
+                {"driver_id": driver_id, "date": "2030-02-04", "reason": "CUTI"},
+                {"driver_id": driver_id, "date": "2030-02-05", "manual_rts": 4},
+                {"driver_id": driver_id, "date": "2030-02-06", "reason": "IZIN", "manual_rts": 1},
+            ]}, headers=admin_headers)
+        url = f"{BASE_URL}/api/drivers/{driver_id}/timeline"
+        params = {"date_from": "2030-02-01", "date_to": "2030-02-28", "limit": 2}
+        r = requests.get(url, params=params, headers=admin_headers)
+        assert r.status_code == 200
+        events = r.json()
+        assert [(e["date"], e["kind"]) for e in events] == [
+            ("2030-02-06", "manual_ritase"), ("2030-02-06", "absence")]
+        r = requests.get(url, params={**params, "cursor": r.headers["X-Next-Cursor"]}, headers=admin_headers)
+        events = r.json()
+        assert [(e["date"], e["kind"]) for e in events] == [
+            ("2030-02-05", "manual_ritase"), ("2030-02-04", "absence")]
+        assert events[0]["detail"]["manual_rts"] == 4
+        assert events[1]["detail"]["reason"] == "CUTI"
+        assert "X-Next-Cursor" not in r.headers
+
+    def test_timeline_unknown_driver(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers/TIDAK_ADA/timeline", headers=admin_headers)
+        assert r.status_code == 404
+
+
+# ===== DRIVER SCORES TESTS =====
+
+class TestScores:
+    """Rolling-window driver scores, leaderboard and scorecard"""
+
+    def test_refresh_blocked_for_admin(self, admin_headers):
+        r = requests.post(f"{BASE_URL}/api/scores/refresh", headers=admin_headers)
+        assert r.status_code == 403
+
+    def test_leaderboard_pages(self, admin_headers, superadmin_headers):
+        r = requests.post(f"{BASE_URL}/api/scores/refresh", headers=superadmin_headers)
+        assert r.status_code == 200
+        window = r.json()["windows"][0]
+        seen, cursor = [], None
+        for _ in range(100):
+            params = {"window": window, "limit": 4, **({"cursor": cursor} if cursor else {})}
+            r = requests.get(f"{BASE_URL}/api/scores", params=params, headers=admin_headers)
+            assert r.status_code == 200
+            seen += r.json()
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen
+        assert [d["score"] for d in seen] == sorted((d["score"] for d in seen), reverse=True)
+        assert len({d["driver_id"] for d in seen}) == len(seen)
+        assert seen[0]["rank"] == 1
+        assert all(d["status"] == "active" for d in seen)
+
+    def test_scorecard(self, admin_headers):
+        driver_id = requests.get(f"{BASE_URL}/api/drivers/active", headers=admin_headers).json()[0]["driver_id"]
+        r = requests.get(f"{BASE_URL}/api/scores/drivers/{driver_id}", headers=admin_headers)
+        assert r.status_code == 200
+        for w in r.json()["windows"]:
+            assert 0 <= w["attendance_rate"] <= 1
+            assert 0 <= w["score"] <= 100
+            assert len(w["absence_weekdays"]) == 7
+        r = requests.get(f"{BASE_URL}/api/scores/drivers/TIDAK_ADA", headers=admin_headers)
+        assert r.status_code == 404
+
+    def test_unknown_window(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/scores", params={"window": 3}, headers=admin_headers)
+        assert r.status_code == 400
+
+
 # ===== AUDIT TESTS =====
 
 class TestAudit:
@@ -286,3 +877,496 @@ class TestAudit:
         r = requests.get(f"{BASE_URL}/api/audit/export", headers=superadmin_headers)
         assert r.status_code == 200
         assert "text/csv" in r.headers.get("content-type", "")
+        assert r.text.splitlines()[0] == "date,driver_id,driver_name,has_sij,has_trip,mismatch"
+
+    def test_export_batches_and_archived_names(self, tmp_path, monkeypatch):
+        """audit_csv_chunks in-process: keyset batches, archived rows found by name"""
+        pytest.importorskip("pyarrow")
+        asyncpg = pytest.importorskip("asyncpg")
+        if not os.environ.get("DATABASE_URL"):
+            pytest.skip("DATABASE_URL not set for the test process")
+        from backend import server
+        archive = server.ColdArchive(tmp_path)
+        archive.write("audit_log", "2001-01", [dict(
+            id=1, date="2001-01-05", driver_id="D9", has_sij=True, has_trip=False, mismatch=True)])
+        monkeypatch.setattr(server, "cold_archive", archive)
+        monkeypatch.setattr(server.driver_directory, "get",
+                            lambda driver_id: {"name": "Sari Arsip"} if driver_id == "D9" else None)
+
+        async def export(batch, search=None):
+            monkeypatch.setattr(server, "AUDIT_EXPORT_BATCH", batch)
+            db = await asyncpg.create_pool(
+                server.strip_pgbouncer_flag(os.environ["DATABASE_URL"]), min_size=1, max_size=1)
+            try:
+                return "".join([chunk async for chunk in server.audit_csv_chunks(
+                    db, "2001-01-01", None, search, False)])
+            finally:
+                await db.close()
+
+        whole = asyncio.run(export(100000))
+        assert len(whole.splitlines()) > 5
+        assert asyncio.run(export(3)) == whole
+        assert "2001-01-05,D9,Sari Arsip,True,False,True" in whole
+        assert "D9" in asyncio.run(export(3, search="sari ars"))
+        assert "D9" not in asyncio.run(export(3, search="budi"))
+
+    def test_audit_keyset_pages(self, superadmin_headers):
+        full = requests.get(f"{BASE_URL}/api/audit", params={"limit": 2000},
+                            headers=superadmin_headers).json()
+        seen, cursor = [], None
+        for _ in range(50):
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            r = requests.get(f"{BASE_URL}/api/audit", params=params, headers=superadmin_headers)
+            assert r.status_code == 200
+            seen += [(row["date"], row["driver_id"]) for row in r.json()]
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen[:len(full)] == [(row["date"], row["driver_id"]) for row in full][:len(seen)]
+        assert len(seen) == len(set(seen))
+
+    def test_audit_mismatch_only_and_summary(self, superadmin_headers):
+        params = {"date_from": "2000-01-01", "date_to": "2999-12-31"}
+        rows = requests.get(f"{BASE_URL}/api/audit", params={**params, "mismatch_only": True, "limit": 2000},
+                            headers=superadmin_headers).json()
+        assert all(row["mismatch"] for row in rows)
+        summary = requests.get(f"{BASE_URL}/api/audit/summary", params=params,
+                               headers=superadmin_headers).json()
+        assert summary["total"] == summary["mismatch"] + summary["ok"]
+        assert summary["mismatch"] >= len(rows)
+
+    def test_audit_invalid_cursor(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/audit", params={"cursor": "bukan-cursor"},
+                         headers=superadmin_headers)
+        assert r.status_code == 400
+
+
+# ===== PARTITIONING TESTS =====
+# Pure helpers run in-process; the schema tests need DATABASE_URL and undo
+# their changes by rolling back.
+
+def run_in_rolled_back_transaction(check):
+    """Run ``await check(conn)`` on DATABASE_URL inside a rolled-back transaction."""
+    asyncpg = pytest.importorskip("asyncpg")
+    if not os.environ.get("DATABASE_URL"):
+        pytest.skip("DATABASE_URL not set for the test process")
+    from backend import server
+
+    async def run():
+        conn = await asyncpg.connect(server.strip_pgbouncer_flag(os.environ["DATABASE_URL"]))
+        tr = conn.transaction()
+        await tr.start()
+        try:
+            return await check(conn)
+        finally:
+            await tr.rollback()
+            await conn.close()
+
+    return asyncio.run(run())
+
+
+class TestPartitioning:
+    """Monthly partitions of sij_transactions and ritase"""
+
+    def test_month_bounds(self):
+        from backend import server
+        assert server.month_bounds("2024-01") == ("2024-01-01", "2024-02-01")
+        assert server.month_bounds("2024-12") == ("2024-12-01", "2025-01-01")
+
+    def test_months_between(self):
+        from backend import server
+        assert server.months_between(date(2024, 11, 30), date(2025, 2, 1)) == [
+            "2024-11", "2024-12", "2025-01", "2025-02"]
+        assert server.months_between(date(2024, 5, 1), date(2024, 5, 31)) == ["2024-05"]
+        assert server.months_between(date(2024, 6, 1), date(2024, 5, 1)) == []
+
+    def test_sij_id_date(self):
+        from backend import server
+        assert server.sij_id_date("driver04920241231123") == "2024-12-31"
+        assert server.sij_id_date("D1202402301234") is None  # no such day
+        assert server.sij_id_date("legacy-id") is None
+
+    def test_lookup_by_id_prunes(self):
+        from backend import server
+
+        async def check(conn):
+            plan = await conn.fetch("EXPLAIN " + server.QUERIES["sij.by_id_date"],
+                                    "driver00120240115123", "2024-01-15")
+            return " ".join(r[0] for r in plan)
+
+        plan = run_in_rolled_back_transaction(check)
+        assert len(set(re.findall(r" on (sij_transactions_\w+)", plan))) == 1, plan
+
+    def test_list_generic_plan_prunes(self):
+        # Each filter combination has its own text, so even the generic plan
+        # Postgres switches to after five executions can prune by date.
+        from backend import server
+        sql, args = server.sorted_filtered_query(
+            "sij.list", "created_at", "desc", "created_at",
+            active_only=True, date_from="2024-01-01", date_to="2024-01-31")
+        assert "IS NULL" not in sql and args == ["2024-01-01", "2024-01-31"]
+
+        async def check(conn):
+            await conn.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+            await conn.execute(f"PREPARE sij_list AS {sql}")
+            plan = await conn.fetch("EXPLAIN EXECUTE sij_list('2024-01-01', '2024-01-31')")
+            partitions = await conn.fetchval(
+                "SELECT COUNT(*) FROM pg_inherits WHERE inhparent = 'sij_transactions'::regclass")
+            return " ".join(r[0] for r in plan), partitions
+
+        plan, partitions = run_in_rolled_back_transaction(check)
+        assert partitions > 1
+        assert "Subplans Removed" in plan
+        assert set(re.findall(r" on (sij_transactions_\w+)", plan)) <= {
+            "sij_transactions_p202401", "sij_transactions_default"}, plan
+
+    def test_timeline_cursor_is_an_index_bound(self):
+        from backend import server
+        sql, args = server.filtered_query(
+            "drivers.timeline", 11, "driver001", after=("2024-01-15", "", "sij", "x"))
+        assert "IS NULL" not in sql
+
+        async def check(conn):
+            await conn.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+            await conn.execute(f"PREPARE timeline AS {sql}")
+            plan = await conn.fetch(
+                "EXPLAIN EXECUTE timeline(11, 'driver001', '2024-01-15', '', 'sij', 'x')")
+            return [r[0].strip() for r in plan]
+
+        plan = run_in_rolled_back_transaction(check)
+        index_conds = [line for line in plan if line.startswith("Index Cond:")]
+        assert len(index_conds) >= 5
+        assert all("(date)::text <= $3" in line for line in index_conds), plan
+        assert sum("Subplans Removed" in line for line in plan) == 2, plan
+
+    def test_legacy_table_migration(self):
+        from backend import server
+
+        async def check(conn):
+            await conn.execute("CREATE SCHEMA raja_migration_test")
+            await conn.execute("SET LOCAL search_path TO raja_migration_test")
+            await conn.execute("""CREATE TABLE ritase (
+                id SERIAL PRIMARY KEY, driver_id VARCHAR(50) NOT NULL,
+                date VARCHAR(10), notes TEXT, created_at TEXT)""")
+            await conn.execute("CREATE INDEX idx_ritase_driver ON ritase (driver_id)")
+            await conn.executemany(
+                "INSERT INTO ritase (driver_id, date, notes, created_at) VALUES ($1, $2, $3, $4)", [
+                    ("D1", "2024-01-05", "a", "2024-01-05T08:00:00"),
+                    ("D2", "2024-02-10", "b", "2024-02-10T08:00:00"),
+                    ("D3", None, "c", "2024-02-11T09:00:00"),
+                ])
+            await server.create_partitioned_table(conn, "ritase", """
+                id SERIAL, driver_id VARCHAR(50) NOT NULL, date VARCHAR(10) NOT NULL,
+                notes TEXT DEFAULT '', admin_id VARCHAR(50), created_at TEXT,
+                PRIMARY KEY (id, date)""")
+            new_id = await conn.fetchval(
+                "INSERT INTO ritase (driver_id, date) VALUES ('D4', '2024-02-12') RETURNING id")
+            return {
+                "kind": await conn.fetchval(
+                    "SELECT relkind::text FROM pg_class WHERE oid = to_regclass('ritase')"),
+                "legacy": await conn.fetchval("SELECT to_regclass('ritase_unpartitioned')"),
+                "rows": [tuple(r) for r in await conn.fetch(
+                    "SELECT tableoid::regclass::text, id, driver_id, date FROM ritase ORDER BY id")],
+                "new_id": new_id,
+            }
+
+        result = run_in_rolled_back_transaction(check)
+        assert result["kind"] == "p"
+        assert result["legacy"] is None
+        assert result["rows"][:3] == [
+            ("ritase_p202401", 1, "D1", "2024-01-05"),
+            ("ritase_p202402", 2, "D2", "2024-02-10"),
+            ("ritase_p202402", 3, "D3", "2024-02-11"),  # undated: day of creation
+        ]
+        assert result["new_id"] == 4
+
+
+# ===== COLD ARCHIVE TESTS =====
+
+class TestArchive:
+    """Archived months listing and transparent reads"""
+
+    def test_list_archive(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/archive", headers=superadmin_headers)
+        assert r.status_code == 200
+        assert set(r.json()) == {"sij_transactions", "ritase", "audit_log"}
+
+    def test_archive_blocked_for_admin(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/archive", headers=admin_headers)
+        assert r.status_code == 403
+
+    def test_sij_range_before_live_data(self, admin_headers):
+        # A range with nothing live or archived is simply empty
+        r = requests.get(f"{BASE_URL}/api/sij", params={
+            "date_from": "2001-01-01", "date_to": "2001-12-31"}, headers=admin_headers)
+        assert r.status_code == 200
+        assert r.json() == []
+
+    def test_archive_round_trip(self, tmp_path):
+        """ColdArchive.write / scan / merge_archived on a temp directory"""
+        pytest.importorskip("pyarrow")
+        from backend import server
+        archive = server.ColdArchive(tmp_path)
+
+        def tx(n, date, status="active", driver_name="Budi"):
+            row = dict.fromkeys(server.ARCHIVE_COLUMNS["sij_transactions"])
+            return dict(row, transaction_id=f"SIJ{n}", driver_id=f"D{n}", driver_name=driver_name,
+                        date=date, time="08:00", sheets=1, amount=40000, status=status)
+
+        assert archive.write("sij_transactions", "2024-01", [
+            tx(1, "2024-01-03"), tx(2, "2024-01-15", status="void"), tx(3, "2024-01-31")]) == 3
+        # Late rows for the month are appended; a rewritten key replaces the old row
+        assert archive.write("sij_transactions", "2024-01", [
+            tx(4, "2024-01-20", driver_name="Sari"), tx(1, "2024-01-03", status="void")]) == 4
+        assert archive.months("sij_transactions") == ["2024-01"]
+
+        def scan(*args, **kwargs):
+            rows = asyncio.run(archive.scan("sij_transactions", *args, **kwargs))
+            return sorted(r["transaction_id"] for r in rows)
+
+        assert scan() == ["SIJ1", "SIJ2", "SIJ3", "SIJ4"]
+        assert scan("2024-01-10", "2024-01-25") == ["SIJ2", "SIJ4"]
+        assert scan("2024-01-01", "2024-01-31", status="active") == ["SIJ3", "SIJ4"]
+        assert scan(search="sari", search_cols=("driver_name", )) == ["SIJ4"]
+        assert scan("2024-02-01", "2024-02-29") == []
+
+        live = [tx(3, "2024-01-31", driver_name="Live")]
+        merged = server.merge_archived(live, asyncio.run(archive.scan("sij_transactions")),
+                                       "sij_transactions")
+        assert len(merged) == 4
+        assert [r["driver_name"] for r in merged if r["transaction_id"] == "SIJ3"] == ["Live"]
+
+
+# ===== INTERNAL TESTS =====
+
+class TestInternal:
+    """Internal operational endpoint tests"""
+
+    def test_pool_stats(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/pool-stats", headers=superadmin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        stats = data["interactive"]
+        for field in ["in_use", "idle", "waiters", "acquire_latency_ms"]:
+            assert field in stats, f"Missing field: {field}"
+        assert stats["acquire_latency_ms"]["buckets"][-1]["le"] == "+Inf"
+
+    def test_pool_stats_blocked_for_admin(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/pool-stats", headers=admin_headers)
+        assert r.status_code == 403
+
+    def test_server_timing_header(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers", headers=superadmin_headers)
+        assert r.status_code == 200
+        timing = r.headers.get("Server-Timing", "")
+        assert timing.startswith("db;dur=")
+        assert "app;dur=" in timing
+
+    def test_server_timing_hidden_from_admin(self, admin_headers):
+        r = requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers)
+        assert r.status_code == 200
+        assert "Server-Timing" not in r.headers
+        r = requests.get(f"{BASE_URL}/")
+        assert "Server-Timing" not in r.headers
+
+    def test_query_stats(self, admin_headers, superadmin_headers):
+        requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers)
+        r = requests.get(f"{BASE_URL}/api/_internal/query-stats", headers=superadmin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        drivers = data["requests"]["GET /api/drivers"]
+        assert drivers["queries_per_request"]["count"] >= 1
+        assert any(s["endpoint"] == "GET /api/drivers" for s in data["statements"])
+        r = requests.get(f"{BASE_URL}/api/_internal/query-stats", headers=admin_headers)
+        assert r.status_code == 403
+
+    def test_metrics_require_token(self):
+        r = requests.get(f"{BASE_URL}/metrics")
+        assert r.status_code in (401, 403)
+        r = requests.get(f"{BASE_URL}/metrics", headers={"Authorization": "Bearer wrong"})
+        assert r.status_code in (401, 403)
+
+    def test_metrics(self, admin_headers):
+        # Set METRICS_TOKEN for both the server and the test run.
+        token = os.environ.get("METRICS_TOKEN")
+        if not token:
+            pytest.skip("METRICS_TOKEN not set for the test process")
+        requests.get(f"{BASE_URL}/api/drivers", headers=admin_headers)
+        r = requests.get(f"{BASE_URL}/metrics", headers={"Authorization": f"Bearer {token}"})
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/plain")
+        body = r.text
+        assert "# TYPE raja_http_request_duration_seconds histogram" in body
+        assert 'route="/api/drivers"' in body
+        assert 'raja_logins_total{result="success"}' in body
+        assert 'raja_db_pool_saturation{pool="interactive"}' in body
+
+    def test_loop_stalls(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/loop-stalls", headers=superadmin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert "enabled" in data
+        assert isinstance(data["stalls"], list)
+
+    def test_profile(self, admin_headers, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/profile?seconds=0.3&include_idle=true",
+                         headers=superadmin_headers)
+        assert r.status_code == 200
+        lines = r.text.strip().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) >= 1 and ";" in stack
+        r = requests.get(f"{BASE_URL}/api/_internal/profile?seconds=0.3", headers=admin_headers)
+        assert r.status_code == 403
+
+    def test_analytics_status(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/analytics", headers=superadmin_headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert "enabled" in data
+        if data.get("ready"):
+            assert set(data["rows"]) == {"sij_transactions", "ritase", "driver_absences", "drivers"}
+
+
+# ===== ANALYTICS REPLICA TESTS =====
+# In-process: loads a DuckDB replica from the database in DATABASE_URL and
+# runs the same report against both. Needs duckdb and pyarrow.
+
+class TestAnalyticsReplica:
+    """Reports give the same numbers from DuckDB as from Postgres"""
+
+    def test_revenue_report_matches_postgres(self, monkeypatch):
+        pytest.importorskip("duckdb")
+        pytest.importorskip("pyarrow")
+        asyncpg = pytest.importorskip("asyncpg")
+        if not os.environ.get("DATABASE_URL"):
+            pytest.skip("DATABASE_URL not set for the test process")
+        from backend import server
+        # Force every period through the replica, not only multi-month ones.
+        monkeypatch.setattr(server, "spans_months", lambda *a: True)
+
+        async def reports():
+            db = await asyncpg.create_pool(
+                server.strip_pgbouncer_flag(os.environ["DATABASE_URL"]),
+                min_size=1, max_size=2)
+            monkeypatch.setattr(server, "pool", db)
+            try:
+                replica = server.AnalyticsReplica(":memory:")
+                for table, (_, columns) in server.ANALYTICS_TABLES.items():
+                    rows = await db.fetch(f"SELECT {', '.join(columns)} FROM {table}")
+                    replica.stage(table, None)
+                    replica.stage(table, [dict(r) for r in rows])
+                await asyncio.to_thread(replica.apply, "test", datetime.now(timezone.utc),
+                                        list(server.ANALYTICS_TABLES), {})
+                replica.refreshed_at = time.monotonic()
+                latest = await db.fetchval(
+                    "SELECT max(date) FROM sij_transactions WHERE status = 'active'")
+                if latest is None:
+                    pytest.skip("no SIJ data to report on")
+                results = []
+                for source in (None, replica):
+                    monkeypatch.setattr(server, "analytics", source)
+                    results.append([
+                        await server._revenue_report_data(period, latest)
+                        for period in ("daily", "weekly", "monthly")
+                    ])
+                replica.close()
+                return results
+            finally:
+                await db.close()
+
+        postgres, duckdb = asyncio.run(reports())
+        assert any(rows for rows, _ in postgres)
+        assert duckdb == postgres
+
+
+# ===== READ REPLICA TESTS =====
+# These run only when the server was started with DATABASE_REPLICA_URL
+# pointing at a second Postgres that carries the RAJA schema.
+
+class TestReplicaRouting:
+    """Reporting reads go to the replica except right after a user's own write"""
+
+    def _replica_reads(self, superadmin_headers):
+        r = requests.get(f"{BASE_URL}/api/_internal/pool-stats", headers=superadmin_headers)
+        replica = r.json().get("replica")
+        if replica is None:
+            pytest.skip("server not configured with DATABASE_REPLICA_URL")
+        return replica["acquire_latency_ms"]["count"]
+
+    def test_report_reads_use_replica(self, superadmin_headers):
+        headers = {"Authorization": f"Bearer {get_token('admin2@raja.id', 'admin123')}"}
+        before = self._replica_reads(superadmin_headers)
+        r = requests.get(f"{BASE_URL}/api/revenue-report", headers=headers)
+        assert r.status_code == 200
+        assert self._replica_reads(superadmin_headers) > before
+
+    def test_read_your_writes_uses_primary(self, superadmin_headers):
+        headers = {"Authorization": f"Bearer {get_token('admin2@raja.id', 'admin123')}"}
+        today = datetime.now().strftime("%Y-%m-%d")
+        r = requests.post(f"{BASE_URL}/api/absences", json={
+            "driver_id": "driver049", "date": today, "reason": ""
+        }, headers=headers)
+        assert r.status_code == 200
+        before = self._replica_reads(superadmin_headers)
+        r = requests.get(f"{BASE_URL}/api/revenue-report", headers=headers)
+        assert r.status_code == 200
+        assert self._replica_reads(superadmin_headers) == before
+
+
+class TestReplicaFallback:
+    """ReplicaReader falls back to the primary only when the replica is unreachable"""
+
+    class FakePool:
+        def __init__(self, result=None, error=None):
+            self.result, self.error = result, error
+            self.healthy = True
+            self.calls = 0
+
+        async def fetchval(self, query, *args, timeout=None):
+            self.calls += 1
+            if self.error is not None:
+                raise self.error
+            return self.result
+
+    def _read(self, error):
+        from backend import server
+        replica = self.FakePool(error=error)
+        primary = self.FakePool(result="primary")
+        reader = server.ReplicaReader(replica, primary)
+        try:
+            return asyncio.run(reader.fetchval("SELECT 1")), replica, primary
+        except Exception as e:
+            return e, replica, primary
+
+    def test_connection_error_falls_back(self):
+        result, replica, primary = self._read(ConnectionRefusedError("replica down"))
+        assert result == "primary"
+        assert replica.healthy is False and primary.calls == 1
+
+    def test_exhausted_replica_falls_back(self):
+        from fastapi import HTTPException
+        result, replica, primary = self._read(HTTPException(status_code=503))
+        assert result == "primary"
+        assert replica.healthy is True and primary.calls == 1
+
+    def test_statement_timeout_is_not_retried(self):
+        result, replica, primary = self._read(asyncio.TimeoutError())
+        assert isinstance(result, asyncio.TimeoutError)
+        assert replica.healthy is True and primary.calls == 0
+
+    def test_lag_check_on_idle_server(self):
+        # The primary replays no WAL; the lag query must read it as current.
+        if not os.environ.get("DATABASE_URL"):
+            pytest.skip("DATABASE_URL not set for the test process")
+        from backend import server
+
+        async def check():
+            tracked = await server.create_db_pool("lag-test", os.environ["DATABASE_URL"],
+                                                  1, 1, 10, max_lag=1.0)
+            try:
+                return await tracked.health_check(), tracked.replication_lag
+            finally:
+                await tracked.close()
+
+        assert asyncio.run(check()) == (True, 0.0)
@@ -4,3 +4,16 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs) {
   return twMerge(clsx(inputs));
 }
+
+// Same key for the same payload until the write succeeds, so a retry after
+// a network error is replayed by the server instead of written twice.
+export function idempotencyKeyFor(ref, payload) {
+  const body = JSON.stringify(payload);
+  if (!ref.current || ref.current.body !== body) {
+    const key = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    ref.current = { body, key };
+  }
+  return ref.current.key;
+}
@@ -64,12 +64,45 @@ const KPICard = ({ title, value, icon: Icon, color, prefix = '', suffix = '', de
 const SHIFT_LABEL = { Shift1: 'Shift 1 (07:00 - 17:00)', Shift2: 'Shift 2 (17:00 - 07:00)' };
 const SHIFT_COLOR = { Shift1: 'text-amber-400 bg-amber-500/10 border-amber-500/20', Shift2: 'text-sky-400 bg-sky-500/10 border-sky-500/20' };
 
+const POLL_SECONDS = 30;
+const RECONNECT_MS = 10000;
+
+const liveFeedUrl = (API, token) => {
+  const base = API.startsWith('http')
+    ? API.replace(/^http/, 'ws')
+    : `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}${API}`;
+  return `${base}/ws/dashboard/admin?token=${encodeURIComponent(token)}`;
+};
+
+const applyLiveMessage = (prev, msg) => {
+  if (msg.type === 'snapshot') return msg.data;
+  if (!prev) return prev;
+  if (msg.type === 'drivers') {
+    return { ...prev, active_drivers: msg.active_drivers, mismatch_list: msg.mismatch_list };
+  }
+  if (msg.type === 'sij') {
+    const recent = prev.recent_sij.filter(tx => tx.transaction_id !== msg.transaction_id);
+    if (msg.transaction) {
+      recent.push(msg.transaction);
+      recent.sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+    }
+    return {
+      ...prev,
+      sij_today_shift: prev.sij_today_shift + msg.delta.sij_today_shift,
+      revenue_shift: prev.revenue_shift + msg.delta.revenue_shift,
+      recent_sij: recent.slice(0, 20),
+    };
+  }
+  return prev;
+};
+
 export default function AdminDashboard() {
-  const { getAuthHeader, API } = useAuth();
+  const { getAuthHeader, API, token } = useAuth();
   const { user } = useAuth();
   const [data, setData] = useState(null);
   const [loading, setLoading] = useState(true);
-  const [countdown, setCountdown] = useState(30);
+  const [countdown, setCountdown] = useState(POLL_SECONDS);
+  const [live, setLive] = useState(false);
 
   const fetchData = async () => {
     try {
@@ -82,15 +115,53 @@ export default function AdminDashboard() {
     }
   };
 
+  // Live feed: snapshot on connect, then pushed deltas.
   useEffect(() => {
+    if (!token || typeof WebSocket === 'undefined') return;
+    let ws = null;
+    let retry = null;
+    let closed = false;
+    const connect = () => {
+      ws = new WebSocket(liveFeedUrl(API, token));
+      ws.onopen = () => setLive(true);
+      ws.onmessage = (e) => {
+        let msg;
+        try { msg = JSON.parse(e.data); } catch { return; }
+        setData(prev => applyLiveMessage(prev, msg));
+        if (msg.type === 'snapshot') setLoading(false);
+      };
+      ws.onclose = () => {
+        setLive(false);
+        if (!closed) retry = setTimeout(connect, RECONNECT_MS);
+      };
+    };
+    connect();
+    const onVisible = () => {
+      if (document.visibilityState === 'visible' && ws?.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'resync' }));
+      }
+    };
+    document.addEventListener('visibilitychange', onVisible);
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      document.removeEventListener('visibilitychange', onVisible);
+      ws?.close();
+    };
+  }, [token]);
+
+  // Polling fallback while the live feed is unavailable.
+  useEffect(() => {
+    if (live) return;
     fetchData();
+    setCountdown(POLL_SECONDS);
     const interval = setInterval(() => {
       fetchData();
-      setCountdown(30);
-    }, 30000);
-    const tick = setInterval(() => setCountdown(c => c > 0 ? c - 1 : 30), 1000);
+      setCountdown(POLL_SECONDS);
+    }, POLL_SECONDS * 1000);
+    const tick = setInterval(() => setCountdown(c => c > 0 ? c - 1 : POLL_SECONDS), 1000);
     return () => { clearInterval(interval); clearInterval(tick); };
-  }, []);
+  }, [live]);
 
   const getMismatchColor = (count) => {
     if (count >= 3) return 'text-red-400';
@@ -119,10 +190,17 @@ export default function AdminDashboard() {
             <Clock className="w-3.5 h-3.5" />
             {SHIFT_LABEL[data?.shift] || data?.shift}
           </div>
-          <div className="flex items-center gap-1.5 text-xs text-zinc-500 font-mono">
-            <RefreshCw className="w-3 h-3" />
-            {countdown}s
-          </div>
+          {live ? (
+            <div className="flex items-center gap-1.5 text-xs text-emerald-400 font-mono" data-testid="live-indicator">
+              <span className="w-2 h-2 rounded-full bg-emerald-400 animate-pulse" />
+              LIVE
+            </div>
+          ) : (
+            <div className="flex items-center gap-1.5 text-xs text-zinc-500 font-mono">
+              <RefreshCw className="w-3 h-3" />
+              {countdown}s
+            </div>
+          )}
         </div>
       </motion.div>
 
@@ -8,18 +8,41 @@ import { ClipboardList, Download, CheckCircle2, XCircle, AlertTriangle } from 'l
 export default function AuditLog() {
   const { getAuthHeader, API } = useAuth();
   const [logs, setLogs] = useState([]);
+  const [summary, setSummary] = useState({ total: 0, mismatch: 0, ok: 0 });
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
-  const [selectedDate, setSelectedDate] = useState('');
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
+  const [mismatchOnly, setMismatchOnly] = useState(false);
   const [exporting, setExporting] = useState(false);
 
   const today = new Date().toISOString().split('T')[0];
 
+  const filterParams = () => {
+    const params = {};
+    if (dateFrom) params.date_from = dateFrom;
+    if (dateTo) params.date_to = dateTo;
+    if (mismatchOnly) params.mismatch_only = true;
+    return params;
+  };
+
+  const fetchPage = (cursor) => axios.get(`${API}/audit`, {
+    headers: getAuthHeader(),
+    params: cursor ? { ...filterParams(), cursor } : filterParams(),
+  });
+
   const fetchLogs = async () => {
     setLoading(true);
     try {
-      const params = selectedDate ? `?date=${selectedDate}` : '';
-      const res = await axios.get(`${API}/audit${params}`, { headers: getAuthHeader() });
+      const { mismatch_only, ...range } = filterParams();
+      const [res, sum] = await Promise.all([
+        fetchPage(null),
+        axios.get(`${API}/audit/summary`, { headers: getAuthHeader(), params: range }),
+      ]);
       setLogs(res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+      setSummary(sum.data);
     } catch {
       toast.error('Gagal memuat audit log');
     } finally {
@@ -27,20 +50,33 @@ export default function AuditLog() {
     }
   };
 
-  useEffect(() => { fetchLogs(); }, [selectedDate]);
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const res = await fetchPage(nextCursor);
+      setLogs(prev => [...prev, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch {
+      toast.error('Gagal memuat audit log');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  useEffect(() => { fetchLogs(); }, [dateFrom, dateTo, mismatchOnly]);
 
   const handleExport = async () => {
     setExporting(true);
     try {
-      const params = selectedDate ? `?date=${selectedDate}` : '';
-      const res = await axios.get(`${API}/audit/export${params}`, {
+      const res = await axios.get(`${API}/audit/export`, {
         headers: getAuthHeader(),
+        params: filterParams(),
         responseType: 'blob',
       });
       const url = window.URL.createObjectURL(new Blob([res.data]));
       const link = document.createElement('a');
       link.href = url;
-      link.setAttribute('download', `audit_${selectedDate || 'all'}.csv`);
+      link.setAttribute('download', `audit_${dateFrom || 'awal'}_${dateTo || 'akhir'}.csv`);
       document.body.appendChild(link);
       link.click();
       link.remove();
@@ -53,9 +89,6 @@ export default function AuditLog() {
     }
   };
 
-  const mismatchCount = logs.filter(l => l.mismatch).length;
-  const matchCount = logs.filter(l => !l.mismatch).length;
-
   return (
     <div className="p-4 md:p-6 max-w-6xl mx-auto space-y-5">
       <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }}>
@@ -86,18 +119,36 @@ export default function AuditLog() {
       {/* Filters + Stats */}
       <div className="flex flex-wrap items-center gap-3">
         <div>
-          <label className="text-label block mb-1.5">Filter Tanggal</label>
+          <label className="text-label block mb-1.5">Dari Tanggal</label>
           <input
-            data-testid="audit-date-filter"
+            data-testid="audit-date-from-filter"
             type="date"
-            value={selectedDate}
+            value={dateFrom}
+            max={dateTo || today}
+            onChange={e => setDateFrom(e.target.value)}
+            className="px-3 py-2 rounded-lg bg-zinc-900/50 border border-zinc-700 focus:border-amber-500/50 outline-none text-zinc-100 text-sm transition-all [color-scheme:dark]"
+          />
+        </div>
+        <div>
+          <label className="text-label block mb-1.5">Sampai Tanggal</label>
+          <input
+            data-testid="audit-date-to-filter"
+            type="date"
+            value={dateTo}
+            min={dateFrom || undefined}
             max={today}
-            onChange={e => setSelectedDate(e.target.value)}
+            onChange={e => setDateTo(e.target.value)}
             className="px-3 py-2 rounded-lg bg-zinc-900/50 border border-zinc-700 focus:border-amber-500/50 outline-none text-zinc-100 text-sm transition-all [color-scheme:dark]"
           />
         </div>
-        {selectedDate && (
-          <button onClick={() => setSelectedDate('')}
+        <button
+          data-testid="audit-mismatch-filter"
+          onClick={() => setMismatchOnly(v => !v)}
+          className={`mt-5 px-3 py-2 rounded-lg text-xs font-bold border transition-all ${mismatchOnly ? 'bg-red-500/10 text-red-400 border-red-500/30' : 'text-zinc-500 hover:text-zinc-300 border-zinc-800 hover:border-zinc-700'}`}>
+          Hanya Mismatch
+        </button>
+        {(dateFrom || dateTo || mismatchOnly) && (
+          <button onClick={() => { setDateFrom(''); setDateTo(''); setMismatchOnly(false); }}
             className="mt-5 px-3 py-2 rounded-lg text-xs text-zinc-500 hover:text-zinc-300 border border-zinc-800 hover:border-zinc-700 transition-all">
             Reset
           </button>
@@ -105,14 +156,14 @@ export default function AuditLog() {
         <div className="flex gap-3 mt-auto ml-auto flex-wrap">
           <div className="flex items-center gap-2 px-3 py-2 rounded-lg bg-red-500/10 border border-red-500/20">
             <AlertTriangle className="w-3.5 h-3.5 text-red-400" />
-            <span className="text-xs font-mono text-red-400 font-bold">{mismatchCount} Mismatch</span>
+            <span className="text-xs font-mono text-red-400 font-bold">{summary.mismatch} Mismatch</span>
           </div>
           <div className="flex items-center gap-2 px-3 py-2 rounded-lg bg-emerald-500/10 border border-emerald-500/20">
             <CheckCircle2 className="w-3.5 h-3.5 text-emerald-400" />
-            <span className="text-xs font-mono text-emerald-400 font-bold">{matchCount} OK</span>
+            <span className="text-xs font-mono text-emerald-400 font-bold">{summary.ok} OK</span>
           </div>
           <div className="flex items-center gap-2 px-3 py-2 rounded-lg bg-zinc-800 border border-zinc-700">
-            <span className="text-xs font-mono text-zinc-400">{logs.length} total</span>
+            <span className="text-xs font-mono text-zinc-400">{summary.total} total</span>
           </div>
         </div>
       </div>
@@ -131,6 +182,7 @@ export default function AuditLog() {
                 <tr className="border-b border-zinc-800/50">
                   <th className="text-left px-5 py-3 text-label">Tanggal</th>
                   <th className="text-left px-5 py-3 text-label">Driver ID</th>
+                  <th className="text-left px-5 py-3 text-label">Nama</th>
                   <th className="text-center px-5 py-3 text-label">Ada SIJ</th>
                   <th className="text-center px-5 py-3 text-label">Ada Trip</th>
                   <th className="text-center px-5 py-3 text-label">Mismatch</th>
@@ -144,6 +196,7 @@ export default function AuditLog() {
                   >
                     <td className="px-5 py-3 font-mono text-xs text-zinc-400">{log.date}</td>
                     <td className="px-5 py-3 font-mono text-xs text-zinc-300">{log.driver_id}</td>
+                    <td className="px-5 py-3 text-xs text-zinc-300">{log.driver_name || '—'}</td>
                     <td className="px-5 py-3 text-center">
                       {log.has_sij ? (
                         <CheckCircle2 className="w-4 h-4 text-emerald-400 mx-auto" />
@@ -174,6 +227,17 @@ export default function AuditLog() {
             </table>
           )}
         </div>
+        {!loading && nextCursor && (
+          <div className="p-3 border-t border-zinc-800/50 text-center">
+            <button
+              data-testid="audit-load-more"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-4 py-2 rounded-lg bg-zinc-800 text-zinc-300 border border-zinc-700 hover:bg-zinc-700 text-xs font-bold transition-all disabled:opacity-50">
+              {loadingMore ? 'Memuat...' : `Muat lagi (${logs.length} dari ${mismatchOnly ? summary.mismatch : summary.total})`}
+            </button>
+          </div>
+        )}
       </motion.div>
     </div>
   );
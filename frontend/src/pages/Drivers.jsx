@@ -8,13 +8,25 @@ import { StatusBadge } from './AdminDashboard';
 
 const CATEGORY_LABELS = { standar: 'Standar', reg: 'Standar', premium: 'Premium' };
 
-const EditModal = ({ driver, onClose, onSave }) => {
+const ZoneSelect = ({ zones, value, onChange }) => (
+  <div>
+    <label className="text-label block mb-1.5">Zona Pool</label>
+    <select value={value || ''} onChange={e => onChange(e.target.value)} data-testid="driver-zone-select"
+      className="w-full px-3 py-2 rounded-lg bg-zinc-950/70 border border-zinc-700 focus:border-amber-500/50 outline-none text-zinc-100 text-sm transition-all">
+      <option value="">Tanpa Zona</option>
+      {zones.map(z => <option key={z.zone_id} value={z.zone_id}>{z.name}</option>)}
+    </select>
+  </div>
+);
+
+const EditModal = ({ driver, zones, onClose, onSave }) => {
   const [form, setForm] = useState({
     name: driver.name,
     phone: driver.phone,
     plate: driver.plate,
     category: driver.category,
     status: driver.status,
+    zone_id: driver.zone_id || '',
   });
 
   const handleSave = (e) => {
@@ -71,6 +83,7 @@ const EditModal = ({ driver, onClose, onSave }) => {
               </select>
             </div>
           </div>
+          <ZoneSelect zones={zones} value={form.zone_id} onChange={zone_id => setForm(f => ({ ...f, zone_id }))} />
           <div className="flex gap-3 pt-2">
             <button type="button" onClick={onClose}
               className="flex-1 py-2 rounded-lg bg-zinc-800 text-zinc-300 border border-zinc-700 hover:bg-zinc-700 text-sm font-bold transition-all">
@@ -87,7 +100,7 @@ const EditModal = ({ driver, onClose, onSave }) => {
   );
 };
 
-const CreateModal = ({ onClose, onCreate }) => {
+const CreateModal = ({ zones, onClose, onCreate }) => {
   const [form, setForm] = useState({
     driver_id: '',
     name: '',
@@ -95,6 +108,7 @@ const CreateModal = ({ onClose, onCreate }) => {
     plate: '',
     category: 'standar',
     status: 'active',
+    zone_id: '',
   });
   const [saving, setSaving] = useState(false);
 
@@ -163,6 +177,7 @@ const CreateModal = ({ onClose, onCreate }) => {
               </select>
             </div>
           </div>
+          <ZoneSelect zones={zones} value={form.zone_id} onChange={zone_id => setForm(f => ({ ...f, zone_id }))} />
           <div className="flex gap-3 pt-2">
             <button type="button" onClick={onClose}
               className="flex-1 py-2 rounded-lg bg-zinc-800 text-zinc-300 border border-zinc-700 hover:bg-zinc-700 text-sm font-bold transition-all">
@@ -189,6 +204,7 @@ export default function Drivers() {
   const [showCreate, setShowCreate] = useState(false);
   const [actionLoading, setActionLoading] = useState(null);
   const [exporting, setExporting] = useState(false);
+  const [zones, setZones] = useState([]);
   const isSuperAdmin = user?.role === 'superadmin';
   const isViewer = user?.role === 'viewer';
 
@@ -208,6 +224,12 @@ export default function Drivers() {
 
   useEffect(() => { fetchDrivers(); }, [search, statusFilter]);
 
+  useEffect(() => {
+    axios.get(`${API}/zones`, { headers: getAuthHeader() })
+      .then(res => setZones(res.data))
+      .catch(() => {});
+  }, []);
+
   const handleSuspend = async (driverId, name) => {
     if (!window.confirm(`Suspend driver ${name}?`)) return;
     setActionLoading(driverId);
@@ -293,10 +315,10 @@ export default function Drivers() {
   return (
     <div className="p-4 md:p-6 max-w-7xl mx-auto space-y-5">
       {editDriver && (
-        <EditModal driver={editDriver} onClose={() => setEditDriver(null)} onSave={handleSave} />
+        <EditModal driver={editDriver} zones={zones} onClose={() => setEditDriver(null)} onSave={handleSave} />
       )}
       {showCreate && (
-        <CreateModal onClose={() => setShowCreate(false)} onCreate={handleCreate} />
+        <CreateModal zones={zones} onClose={() => setShowCreate(false)} onCreate={handleCreate} />
       )}
 
       <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }} className="flex items-center justify-between">
@@ -358,6 +358,24 @@ export default function LaporanMingguan() {
     }
   };
 
+  // Sends grid edits in one batch and swaps in the recomputed driver rows.
+  const saveCells = async (edits) => {
+    const res = await axios.post(
+      `${API}/weekly-report/cells`,
+      { start_date: weekStart, end_date: weekEnd, edits },
+      { headers: getAuthHeader() },
+    );
+    const updated = Object.fromEntries(
+      res.data.drivers.map((d) => [d.driver_id, d]),
+    );
+    setData((prev) =>
+      prev && {
+        ...prev,
+        drivers: prev.drivers.map((d) => updated[d.driver_id] || d),
+      },
+    );
+  };
+
   const handleAbsenceClick = (driverId, driverName, date, currentReason) => {
     setAbsenceModal({
       driverId,
@@ -371,18 +389,15 @@ export default function LaporanMingguan() {
     if (!absenceModal) return;
     setSavingAbsence(true);
     try {
-      await axios.post(
-        `${API}/absences`,
+      await saveCells([
         {
           driver_id: absenceModal.driverId,
           date: absenceModal.date,
           reason: absenceModal.reason,
         },
-        { headers: getAuthHeader() },
-      );
+      ]);
       toast.success("Keterangan absen disimpan");
       setAbsenceModal(null);
-      fetchReport();
     } catch (err) {
       toast.error(err.response?.data?.detail || "Gagal menyimpan keterangan");
     } finally {
@@ -399,14 +414,11 @@ export default function LaporanMingguan() {
     if (!ritaseModal) return;
     setSavingRitase(true);
     try {
-      await axios.post(
-        `${API}/manual-ritase`,
+      await saveCells([
         { driver_id: ritaseModal.driverId, date: ritaseModal.date, manual_rts: ritaseInput },
-        { headers: getAuthHeader() },
-      );
+      ]);
       toast.success("Ritase manual disimpan");
       setRitaseModal(null);
-      fetchReport();
     } catch (err) {
       toast.error(err.response?.data?.detail || "Gagal menyimpan ritase");
     } finally {
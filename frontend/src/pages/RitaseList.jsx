@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef, useMemo } from 'react';
 import axios from 'axios';
 import { useAuth } from '@/context/AuthContext';
+import { idempotencyKeyFor } from '@/lib/utils';
 import { motion, AnimatePresence } from 'framer-motion';
 import { toast } from 'sonner';
 import {
@@ -29,6 +30,7 @@ export default function RitaseList() {
   const [editItem, setEditItem] = useState(null);
   const [formData, setFormData] = useState(emptyForm);
   const [saving, setSaving] = useState(false);
+  const pendingRitase = useRef(null);
   const [drivers, setDrivers] = useState([]);
   const perPage = 15;
 
@@ -107,7 +109,10 @@ export default function RitaseList() {
         toast.success('Ritase berhasil diperbarui');
         setEditItem(null);
       } else {
-        await axios.post(`${API}/ritase`, formData, { headers: getAuthHeader() });
+        await axios.post(`${API}/ritase`, formData, {
+          headers: { ...getAuthHeader(), 'Idempotency-Key': idempotencyKeyFor(pendingRitase, formData) }
+        });
+        pendingRitase.current = null;
         toast.success('Ritase berhasil ditambahkan');
         setShowAddModal(false);
       }
@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef, useMemo } from "react";
 import axios from "axios";
 import { useAuth } from "@/context/AuthContext";
+import { idempotencyKeyFor } from "@/lib/utils";
 import { motion, AnimatePresence } from "framer-motion";
 import { toast } from "sonner";
 import {
@@ -205,10 +206,12 @@ export default function SIJInput() {
   const [result, setResult] = useState(null);
   const [selectedDriver, setSelectedDriver] = useState(null);
   const [searchQuery, setSearchQuery] = useState("");
+  const [searchResults, setSearchResults] = useState([]);
   const [showDropdown, setShowDropdown] = useState(false);
   const [datePickerOpen, setDatePickerOpen] = useState(false);
   const searchRef = useRef(null);
   const dropdownRef = useRef(null);
+  const pendingSij = useRef(null);
 
   // Date constraints: today to 7 days ahead
   const today = startOfDay(new Date());
@@ -243,20 +246,36 @@ export default function SIJInput() {
     return () => document.removeEventListener("mousedown", handleClickOutside);
   }, []);
 
+  // Ranked server-side search, debounced so fast typing sends one request
+  useEffect(() => {
+    const q = searchQuery.trim();
+    if (!q || selectedDriver) {
+      setSearchResults([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      axios
+        .get(`${API}/drivers/search`, {
+          headers: getAuthHeader(),
+          params: { q, status_filter: "active", limit: 50 },
+        })
+        .then((res) => {
+          if (!cancelled) setSearchResults(res.data);
+        })
+        .catch(() => {});
+    }, 150);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery, selectedDriver]);
+
   // Filtered drivers based on search
   const filteredDrivers = useMemo(() => {
     if (!searchQuery.trim()) return drivers.slice(0, 50);
-    const q = searchQuery.toLowerCase();
-    return drivers
-      .filter(
-        (d) =>
-          d.name.toLowerCase().includes(q) ||
-          d.driver_id.toLowerCase().includes(q) ||
-          d.plate.toLowerCase().includes(q) ||
-          d.phone.includes(q),
-      )
-      .slice(0, 50);
-  }, [drivers, searchQuery]);
+    return searchResults;
+  }, [drivers, searchQuery, searchResults]);
 
   const handleDriverSelect = (driver) => {
     setSelectedDriver(driver);
@@ -297,8 +316,12 @@ export default function SIJInput() {
         payload.date = format(form.date, "yyyy-MM-dd");
       }
       const res = await axios.post(`${API}/sij`, payload, {
-        headers: getAuthHeader(),
+        headers: {
+          ...getAuthHeader(),
+          "Idempotency-Key": idempotencyKeyFor(pendingSij, payload),
+        },
       });
+      pendingSij.current = null;
       setResult(res.data);
       toast.success("SIJ berhasil dibuat!");
     } catch (err) {
@@ -14,6 +14,7 @@ module.exports = function(app) {
     createProxyMiddleware({
       target: 'http://localhost:8000',
       changeOrigin: true,
+      ws: true,
     })
   );
 };